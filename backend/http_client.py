@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER_CONFIG = {
+    "connect_timeout": 3.05,
+    "read_timeout": 10,
+    "retries": 2,
+    "backoff_factor": 0.3,
+    "pool_size": 10,
+    "failure_threshold": 5,
+    "reset_timeout": 30,
+}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Per-process breaker: opens after consecutive failures, then lets one probe call through."""
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            cooled_down = time.monotonic() - self._opened_at >= self.reset_timeout
+            if cooled_down and not self._probing:
+                self._probing = True
+                return
+        raise CircuitOpenError(f"{self.name} is unavailable, circuit is open.")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning("Opening circuit for %s", self.name)
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class ProviderSession(requests.Session):
+    """Session for one provider with fixed timeouts, bounded retries, a circuit breaker and metrics."""
+
+    def __init__(self, provider, config):
+        super().__init__()
+        self.provider = provider
+        self.timeout = (config["connect_timeout"], config["read_timeout"])
+        self.breaker = CircuitBreaker(
+            provider, config["failure_threshold"], config["reset_timeout"]
+        )
+
+        # Only idempotent methods are retried on read errors and 5xx responses;
+        # connection failures are safe to retry for any method.
+        retry = Retry(
+            total=config["retries"],
+            backoff_factor=config["backoff_factor"],
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=config["pool_size"],
+            max_retries=retry,
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        metric = f"http.{self.provider}"
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            metrics.incr(f"{metric}.short_circuited")
+            raise
+
+        kwargs["timeout"] = self.timeout
+        start = time.monotonic()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception:
+            # Any error, so a failed probe never leaves the breaker half-open
+            self.breaker.record_failure()
+            metrics.incr(f"{metric}.errors")
+            raise
+        finally:
+            metrics.timing(metric, (time.monotonic() - start) * 1000)
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            metrics.incr(f"{metric}.errors")
+        else:
+            self.breaker.record_success()
+        return response
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_provider_config(provider):
+    overrides = getattr(settings, "OUTBOUND_HTTP", {})
+    return {
+        **DEFAULT_PROVIDER_CONFIG,
+        **overrides.get("default", {}),
+        **overrides.get(provider, {}),
+    }
+
+
+def get_session(provider):
+    """Return the shared session for ``provider``, creating it on first use."""
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                session = ProviderSession(provider, get_provider_config(provider))
+                _sessions[provider] = session
+    return session
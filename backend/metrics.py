@@ -0,0 +1,79 @@
+import logging
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Fixed counters reported by snapshot(); per-provider and per-topic names are
+# derived from OUTBOUND_HTTP and OUTBOX_HANDLERS in _names().
+COUNTERS = (
+    "carts.pruned",
+    "carts.pruned.items",
+    "email.batch.count",
+    "email.batch.errors",
+    "email.batch.total_ms",
+    "email.deferred",
+    "email.failed",
+    "email.sent",
+    "orders.expired",
+    "orders.expired.coupons_released",
+    "payments.needs_refund",
+    "stock.oversold",
+    "stock.out_of_stock",
+    "stock.reservations_expired",
+)
+HTTP_COUNTERS = ("count", "total_ms", "errors", "short_circuited")
+OUTBOX_COUNTERS = ("done", "failed", "dead", "skipped")
+
+
+def _key(name):
+    return f"metrics:{name}"
+
+
+def _names():
+    providers = [name for name in getattr(settings, "OUTBOUND_HTTP", {}) if name != "default"]
+    names = list(COUNTERS)
+    names += [f"http.{provider}.{counter}" for provider in providers for counter in HTTP_COUNTERS]
+    names += [f"outbox.{topic}.{counter}" for topic in settings.OUTBOX_HANDLERS for counter in OUTBOX_COUNTERS]
+    return sorted(names)
+
+
+def incr(name, value=1):
+    """Increment a counter. Metrics must never break the calling code path."""
+    try:
+        try:
+            cache.incr(_key(name), value)
+        except ValueError:
+            # First write of this counter; another process may have created it meanwhile
+            if not cache.add(_key(name), value, None):
+                cache.incr(_key(name), value)
+    except Exception:
+        logger.warning("Could not record metric %s", name, exc_info=True)
+
+
+def timing(name, milliseconds):
+    """Record one call duration as ``<name>.count`` and ``<name>.total_ms``."""
+    incr(f"{name}.count")
+    incr(f"{name}.total_ms", int(milliseconds))
+
+
+@contextmanager
+def timer(name):
+    """Time the wrapped block and count ``<name>.errors`` when it raises."""
+    start = time.monotonic()
+    try:
+        yield
+    except Exception:
+        incr(f"{name}.errors")
+        raise
+    finally:
+        timing(name, (time.monotonic() - start) * 1000)
+
+
+def snapshot():
+    """Return every known metric as a ``{name: value}`` dict."""
+    names = _names()
+    values = cache.get_many([_key(name) for name in names])
+    return {name: values.get(_key(name), 0) for name in names}
@@ -14,6 +14,8 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import timedelta
+from celery.schedules import crontab
+from corsheaders.defaults import default_headers
 
 
 # Load environment variables from .env file
@@ -55,6 +57,7 @@ INSTALLED_APPS = [
     "users",
     "products",
     "orders",
+    "outbox",
 ]
 
 MIDDLEWARE = [
@@ -195,12 +198,99 @@ SESSION_SAVE_EVERY_REQUEST = True
 
 PASSWORD_RESET_TIMEOUT = 86400  # 24 hours
 
+# Shared by every web and worker process, so metrics, cached coupons, carts,
+# the catalog and their invalidation work across processes, see backend/metrics.py
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_REDIS_URL", "redis://redis:6379/1"),
+    }
+}
+
 CELERY_BROKER_URL = "redis://redis:6379/0"
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
+CELERY_BEAT_SCHEDULE = {
+    "dispatch-outbox": {
+        "task": "outbox.tasks.dispatch_outbox",
+        "schedule": 30.0,
+    },
+    "send-queued-emails": {
+        "task": "outbox.tasks.send_queued_emails",
+        "schedule": 30.0,
+    },
+    "reconcile-sales-rollups": {
+        "task": "orders.tasks.reconcile_sales_rollups",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    "prune-idempotency-keys": {
+        "task": "orders.tasks.prune_idempotency_keys",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "prune-image-uploads": {
+        "task": "orders.tasks.prune_image_uploads",
+        "schedule": crontab(hour=3, minute=30),
+    },
+    "archive-orders": {
+        "task": "orders.tasks.archive_old_orders",
+        "schedule": crontab(hour=4, minute=0),
+    },
+    "expire-unpaid-orders": {
+        "task": "orders.tasks.expire_stale_orders",
+        "schedule": crontab(minute="*/15"),
+    },
+    "release-stock-reservations": {
+        "task": "orders.tasks.release_stock_reservations",
+        "schedule": crontab(minute="*/5"),
+    },
+    "prune-abandoned-carts": {
+        "task": "products.tasks.prune_carts",
+        "schedule": crontab(hour=4, minute=30),
+    },
+    "prune-outbox-events": {
+        "task": "outbox.tasks.prune_outbox_events",
+        "schedule": crontab(hour=5, minute=0),
+    },
+    "prune-sent-emails": {
+        "task": "outbox.tasks.prune_sent_emails",
+        "schedule": crontab(hour=5, minute=15),
+    },
+}
+
+# Preview rendering is CPU bound, run it on its own worker pool:
+#   celery -A backend worker -Q previews --concurrency=<cores>
+CELERY_TASK_ROUTES = {
+    "orders.tasks.render_order_item_preview": {"queue": "previews"},
+}
+
+# Days rebuilt from the orders by the nightly sales rollup reconcile
+SALES_ROLLUP_RECONCILE_DAYS = 7
+
+# Transactional outbox, see outbox/dispatcher.py
+OUTBOX_HANDLERS = {
+    "orders.create_shipment": "orders.handlers.create_shiprocket_shipment",
+    "orders.rollup": "orders.handlers.update_sales_rollup",
+}
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_BATCHES_PER_RUN = 10
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_RETENTION_DAYS = 30  # delivered events, and their dedupe keys, are kept this long
+OUTBOX_PRUNE_BATCH_SIZE = 1000
+
+# Email queue, see outbox/mail.py
+EMAIL_BATCH_SIZE = 200
+EMAIL_MAX_BATCHES_PER_RUN = 10
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_LEASE_SECONDS = 300
+EMAIL_RETENTION_DAYS = 7
+EMAIL_PRUNE_BATCH_SIZE = 1000
+EMAIL_DOMAIN_RATE_LIMITS = {
+    "default": 120,  # messages per minute per recipient domain
+}
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
@@ -225,8 +315,77 @@ NUMBER_OF_IMAGE_PER_PRODUCT = 6
 
 PAGE_LIMIT = 10
 
+BULK_STATUS_UPDATE_LIMIT = 1000
+
+SHIPPING_CHARGE = 60
+
+EXPORT_CHUNK_SIZE = 2000
+
+COUPON_CACHE_TTL = 300
+COUPON_INDEX_TTL = 60
+
+# Idempotency-Key support for checkout endpoints, see orders/idempotency.py
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_SECONDS = 60
+IDEMPOTENCY_PRUNE_BATCH_SIZE = 1000
+
+# Order item photo uploads, see orders/uploads.py
+ORDER_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+ORDER_IMAGE_MAX_PIXELS = 40_000_000
+ORDER_IMAGE_UPLOAD_TTL = 60 * 60 * 24
+ORDER_IMAGE_PRUNE_BATCH_SIZE = 500
+
+# Invoice list page size when a page is asked for, documents are cached in orders/invoices.py
+INVOICE_PAGE_SIZE = 20
+INVOICE_MAX_PAGE_SIZE = 100
+
+# Unpaid online orders expire after this, see orders/cleanup.py
+UNPAID_ORDER_TTL = 60 * 60 * 24
+UNPAID_ORDER_BATCH_SIZE = 500
+
+# Stock held for an unpaid order, see orders/stock.py
+STOCK_RESERVATION_TTL = 30 * 60
+STOCK_RELEASE_BATCH_SIZE = 500
+
+# Carts untouched for this many days are deleted, see products/cart.py
+CART_ABANDON_DAYS = 60
+CART_PRUNE_BATCH_SIZE = 500
+CART_BATCH_MAX_OPERATIONS = 50
+CART_SUMMARY_TTL = 300
+
+# Carts of shoppers who are not logged in live in a signed cookie
+GUEST_CART_COOKIE = "guest_cart"
+GUEST_CART_COOKIE_AGE = 60 * 60 * 24 * 30
+GUEST_CART_COOKIE_SECURE = True
+GUEST_CART_COOKIE_SAMESITE = "Lax"
+GUEST_CART_MAX_LINES = 50
+
+# Wishlist bulk changes and the cached ids list, see products/wishlist.py
+WISHLIST_BULK_LIMIT = 100
+WISHLIST_IDS_TTL = 60 * 60
+
+# Shared product catalog: server-side cache and the max-age sent to browsers and CDNs
+CATALOG_CACHE_TTL = 60
+CATALOG_MAX_AGE = 60
+
+# Closed orders older than this move to the archive, see orders/archive.py
+ORDER_ARCHIVE_AFTER_DAYS = 365
+ORDER_ARCHIVE_BATCH_SIZE = 500
+
+# Personalized gift previews, see orders/previews.py
+PREVIEW_MAX_SIZE = 1200
+PREVIEW_JPEG_QUALITY = 85
+PREVIEW_PENDING_SECONDS = 300
+
+# Bulk coupon generation, see orders/coupons.py
+COUPON_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+COUPON_CODE_LENGTH = 10
+COUPON_BULK_LIMIT = 200000
+COUPON_BULK_BATCH_SIZE = 5000
+
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
 
 # Google login
 SOCIAL_SECRET = os.getenv("SOCIAL_SECRET")
@@ -240,6 +399,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 FRONTEND_DOMAIN = os.getenv("FRONTEND_DOMAIN")
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 NUMBER_OF_IMAGE_PER_PRODUCT = 5
 
 SECURE_SSL_REDIRECT = True  # Redirect HTTP to HTTPS
@@ -251,3 +411,19 @@ SESSION_COOKIE_SECURE = True  # Secure sessions over HTTPS
 SHIPROCKET_EMAIL = os.getenv("SHIPROCKET_EMAIL")
 SHIPROCKET_PASSWORD = os.getenv("SHIPROCKET_PASSWORD")
 SHIPROCKET_API_URL = 'https://apiv2.shiprocket.in/v1'
+SHIPROCKET_TOKEN_TTL = 60 * 60 * 24  # Tokens are valid for 10 days, refresh daily to stay well inside that
+
+# Outbound HTTP clients, see backend/http_client.py. Timeouts are in seconds.
+OUTBOUND_HTTP = {
+    "default": {
+        "connect_timeout": 3.05,
+        "read_timeout": 10,
+        "retries": 2,
+        "pool_size": 10,
+        "failure_threshold": 5,
+        "reset_timeout": 30,
+    },
+    "razorpay": {"read_timeout": 15},
+    "shiprocket": {"read_timeout": 20},
+    "google": {"read_timeout": 5},
+}
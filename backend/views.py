@@ -0,0 +1,21 @@
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from . import metrics
+
+
+class MetricsAPIView(APIView):
+    """Expose the application counters and timings recorded in backend.metrics."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(
+            {
+                "status": True,
+                "data": metrics.snapshot(),
+                "message": "Metrics arrived successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
@@ -0,0 +1,262 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from django.utils.timezone import make_aware
+from outbox.dispatcher import enqueue
+from outbox.models import OutboxEvent
+from .models import Order, OrderItem, SalesRollup, ProductTypeSalesRollup, ProductSalesRollup
+
+# Order events that move the sales rollups.
+PAID = "PAID"
+CANCELLED = Order.CANCELLED
+DELIVERED = Order.DELIVERED
+
+# What the customer pays for the goods: the discounted price when a coupon
+# was applied, the item total otherwise. Shipping is not revenue.
+SUB_TOTAL = Case(
+    When(final_price__gt=0, then=F("final_price")),
+    default=F("total_price"),
+    output_field=FloatField(),
+)
+
+
+def record_sales_event(order_id, event):
+    """Queue a rollup update for ``order_id`` in the current transaction, once per order and event."""
+    enqueue(
+        "orders.rollup",
+        {"order_id": order_id, "event": event},
+        dedupe_key=f"order:{order_id}:rollup:{event.lower()}",
+    )
+
+
+def _increment(model, key, **deltas):
+    """Add ``deltas`` to the rollup row for ``key`` with a single ``UPDATE``."""
+    # Looked up again if a rebuild replaced the row in between
+    while True:
+        row, _ = model.objects.get_or_create(**key)
+        if model.objects.filter(pk=row.pk).update(
+            **{field: F(field) + value for field, value in deltas.items()}
+        ):
+            return
+
+
+def apply_sales_event(order_id, event):
+    """Apply one order event to the rollups. Only paid orders count as sales."""
+    order = Order.all_objects.filter(pk=order_id, is_paid=True).first()
+    if not order:
+        return
+
+    day = timezone.localdate(order.created_at)
+    sub_total = order.final_price or order.total_price
+    order_key = {"date": day, "payment_method": order.payment_method}
+
+    items = [
+        {"product_id": item.product_id, "product_type_id": item.product_type_id,
+         "quantity": item.quantity, "revenue": item.price * item.quantity}
+        for item in order.items.only("product_id", "product_type_id", "price", "quantity")
+    ]
+    types = {}
+    for item in items:
+        totals = types.setdefault(item["product_type_id"], {"quantity": 0, "revenue": 0.0})
+        totals["quantity"] += item["quantity"]
+        totals["revenue"] += item["revenue"]
+
+    if event == PAID:
+        _increment(SalesRollup, order_key, orders=1, revenue=sub_total, discount=order.discount_amount)
+        for product_type_id, totals in types.items():
+            _increment(
+                ProductTypeSalesRollup, {**order_key, "product_type_id": product_type_id},
+                orders=1, quantity=totals["quantity"], revenue=totals["revenue"],
+            )
+        for item in items:
+            _increment(
+                ProductSalesRollup, {**order_key, "product_id": item["product_id"]},
+                quantity=item["quantity"], revenue=item["revenue"],
+            )
+    elif event == CANCELLED:
+        _increment(SalesRollup, order_key, cancelled_orders=1, cancelled_revenue=sub_total)
+        for product_type_id, totals in types.items():
+            _increment(
+                ProductTypeSalesRollup, {**order_key, "product_type_id": product_type_id},
+                cancelled_quantity=totals["quantity"], cancelled_revenue=totals["revenue"],
+            )
+        for item in items:
+            _increment(
+                ProductSalesRollup, {**order_key, "product_id": item["product_id"]},
+                cancelled_quantity=item["quantity"], cancelled_revenue=item["revenue"],
+            )
+    elif event == DELIVERED:
+        _increment(SalesRollup, order_key, delivered_orders=1)
+
+
+@transaction.atomic
+def rebuild_sales_rollups(start, end):
+    """
+    Recompute the rollups for ``start`` to ``end`` (inclusive) from the orders.
+    Returns the number of ``SalesRollup`` rows written. Raises ``ValueError`` for
+    days that may hold archived orders, which are no longer counted.
+    """
+    archive_cutoff = timezone.localdate() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    if start <= archive_cutoff:
+        raise ValueError(f"Orders up to {archive_cutoff} may be archived, rebuild later days only.")
+
+    created_from = make_aware(datetime.combine(start, time.min))
+    created_to = make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    cancelled = Q(status=Order.CANCELLED)
+    item_cancelled = Q(order__status=Order.CANCELLED)
+    line_total = F("price") * F("quantity")
+
+    # Locked so their status cannot change under the rebuild; orders paid
+    # after this are counted by their own events
+    order_ids = list(
+        Order.all_objects.select_for_update()
+        .filter(is_paid=True, created_at__gte=created_from, created_at__lt=created_to)
+        .values_list("id", flat=True)
+    )
+    # Their queued events are settled, the rebuild counts them. Handlers lock
+    # their event first, so this waits for one in progress
+    OutboxEvent.objects.filter(
+        topic="orders.rollup", status=OutboxEvent.PENDING, payload__order_id__in=order_ids
+    ).update(status=OutboxEvent.DONE, processed_at=timezone.now(), last_error=None)
+
+    order_totals = (
+        Order.all_objects.filter(id__in=order_ids)
+        .annotate(day=TruncDate("created_at"))
+        .values("day", "payment_method")
+        .annotate(
+            order_count=Count("id"),
+            revenue_total=Sum(SUB_TOTAL),
+            discount_total=Sum("discount_amount"),
+            cancelled_count=Count("id", filter=cancelled),
+            cancelled_total=Coalesce(Sum(SUB_TOTAL, filter=cancelled), 0.0),
+            delivered_count=Count("id", filter=Q(status=Order.DELIVERED)),
+        )
+        .order_by()
+    )
+    items = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .annotate(day=TruncDate("order__created_at"), payment_method=F("order__payment_method"))
+    )
+    type_totals = (
+        items.values("day", "payment_method", "product_type_id")
+        .annotate(
+            order_count=Count("order_id", distinct=True),
+            quantity_total=Sum("quantity"),
+            revenue_total=Sum(line_total, output_field=FloatField()),
+            cancelled_quantity_total=Coalesce(Sum("quantity", filter=item_cancelled), 0),
+            cancelled_total=Coalesce(Sum(line_total, filter=item_cancelled, output_field=FloatField()), 0.0),
+        )
+        .order_by()
+    )
+    product_totals = (
+        items.values("day", "payment_method", "product_id")
+        .annotate(
+            quantity_total=Sum("quantity"),
+            revenue_total=Sum(line_total, output_field=FloatField()),
+            cancelled_quantity_total=Coalesce(Sum("quantity", filter=item_cancelled), 0),
+            cancelled_total=Coalesce(Sum(line_total, filter=item_cancelled, output_field=FloatField()), 0.0),
+        )
+        .order_by()
+    )
+
+    for model in (SalesRollup, ProductTypeSalesRollup, ProductSalesRollup):
+        model.objects.filter(date__gte=start, date__lte=end).delete()
+
+    rows = SalesRollup.objects.bulk_create([
+        SalesRollup(
+            date=row["day"],
+            payment_method=row["payment_method"],
+            orders=row["order_count"],
+            revenue=row["revenue_total"],
+            discount=row["discount_total"],
+            cancelled_orders=row["cancelled_count"],
+            cancelled_revenue=row["cancelled_total"],
+            delivered_orders=row["delivered_count"],
+        )
+        for row in order_totals
+    ])
+    ProductTypeSalesRollup.objects.bulk_create([
+        ProductTypeSalesRollup(
+            date=row["day"],
+            payment_method=row["payment_method"],
+            product_type_id=row["product_type_id"],
+            orders=row["order_count"],
+            quantity=row["quantity_total"],
+            revenue=row["revenue_total"],
+            cancelled_quantity=row["cancelled_quantity_total"],
+            cancelled_revenue=row["cancelled_total"],
+        )
+        for row in type_totals
+    ])
+    ProductSalesRollup.objects.bulk_create([
+        ProductSalesRollup(
+            date=row["day"],
+            payment_method=row["payment_method"],
+            product_id=row["product_id"],
+            quantity=row["quantity_total"],
+            revenue=row["revenue_total"],
+            cancelled_quantity=row["cancelled_quantity_total"],
+            cancelled_revenue=row["cancelled_total"],
+        )
+        for row in product_totals
+    ])
+    return len(rows)
+
+
+def sales_report(start, end, top=10):
+    """Answer a date-range sales question from the rollups alone."""
+    in_range = {"date__gte": start, "date__lte": end}
+    net_revenue = Sum(F("revenue") - F("cancelled_revenue"))
+
+    orders = SalesRollup.objects.filter(**in_range)
+    totals = orders.aggregate(
+        orders=Coalesce(Sum("orders"), 0),
+        revenue=Coalesce(Sum("revenue"), 0.0),
+        discount=Coalesce(Sum("discount"), 0.0),
+        cancelled_orders=Coalesce(Sum("cancelled_orders"), 0),
+        cancelled_revenue=Coalesce(Sum("cancelled_revenue"), 0.0),
+        delivered_orders=Coalesce(Sum("delivered_orders"), 0),
+    )
+    totals["net_orders"] = totals["orders"] - totals["cancelled_orders"]
+    totals["net_revenue"] = totals["revenue"] - totals["cancelled_revenue"]
+    totals["average_order_value"] = (
+        round(totals["net_revenue"] / totals["net_orders"], 2) if totals["net_orders"] else 0.0
+    )
+
+    return {
+        "from": start,
+        "to": end,
+        "totals": totals,
+        "by_day": list(
+            orders.values("date")
+            .annotate(orders=Sum("orders"), cancelled_orders=Sum("cancelled_orders"), net_revenue=net_revenue)
+            .order_by("date")
+        ),
+        "by_payment_method": list(
+            orders.values("payment_method")
+            .annotate(orders=Sum("orders"), cancelled_orders=Sum("cancelled_orders"), net_revenue=net_revenue)
+            .order_by("payment_method")
+        ),
+        "by_product_type": list(
+            ProductTypeSalesRollup.objects.filter(**in_range)
+            .values("product_type_id", product_type_name=F("product_type__name"))
+            .annotate(
+                orders=Sum("orders"),
+                quantity=Sum(F("quantity") - F("cancelled_quantity")),
+                net_revenue=net_revenue,
+            )
+            .order_by("-net_revenue")
+        ),
+        "top_products": list(
+            ProductSalesRollup.objects.filter(**in_range)
+            .values("product_id", product_code=F("product__code"), product_name=F("product__name"))
+            .annotate(
+                quantity=Sum(F("quantity") - F("cancelled_quantity")),
+                net_revenue=net_revenue,
+            )
+            .order_by("-net_revenue")[:top]
+        ),
+    }
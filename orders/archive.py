@@ -0,0 +1,100 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils.timezone import now
+from .models import ArchivedOrder, Order, OrderItem, OrderStatusHistory, ProductReview
+
+# Orders in these states no longer change and can leave the hot tables
+ARCHIVABLE_STATUSES = (Order.CANCELLED, Order.DELIVERED)
+
+
+def _serialize(objects):
+    rows = serializers.serialize("python", objects)
+    for row in rows:
+        for name, value in row["fields"].items():
+            # DjangoJSONEncoder would cut datetimes to milliseconds
+            if isinstance(value, datetime):
+                row["fields"][name] = value.isoformat()
+    return rows
+
+
+def _deserialize(rows):
+    return [row.object for row in serializers.deserialize("python", rows)]
+
+
+def archive_orders(older_than_days=None, batch_size=None):
+    """
+    Move closed orders created more than ``older_than_days`` ago to ``ArchivedOrder``,
+    one short transaction per batch. Returns the number of orders archived.
+    """
+    older_than_days = older_than_days or settings.ORDER_ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    cutoff = now() - timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        ids = list(
+            Order.all_objects.filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return archived
+        archived += _archive_batch(ids)
+
+
+def _archive_batch(ids):
+    with transaction.atomic():
+        # Re-checked under the row locks, an order may have changed since
+        orders = list(
+            Order.all_objects.select_for_update().filter(id__in=ids, status__in=ARCHIVABLE_STATUSES).order_by("id")
+        )
+        if not orders:
+            return 0
+        ids = [order.pk for order in orders]
+
+        items = defaultdict(list)
+        for item in OrderItem.objects.filter(order_id__in=ids).order_by("id"):
+            items[item.order_id].append(item)
+        history = defaultdict(list)
+        for entry in OrderStatusHistory.objects.filter(order_id__in=ids).order_by("id"):
+            history[entry.order_id].append(entry)
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.pk,
+                user_id=order.user_id,
+                order_number=order.order_number,
+                status=order.status,
+                created_at=order.created_at,
+                data={
+                    "order": _serialize([order])[0],
+                    "items": _serialize(items[order.pk]),
+                    "history": _serialize(history[order.pk]),
+                },
+            )
+            for order in orders
+        ])
+
+        # Reviews stay with the product, without the order item they came from
+        ProductReview.objects.filter(order_item__order_id__in=ids).update(order_item=None)
+        Order.all_objects.filter(id__in=ids).delete()
+    return len(orders)
+
+
+def restore_instance(archived):
+    """
+    Rebuild an unsaved ``Order`` from ``archived``, with its items and history
+    attached as if prefetched, ready for the order serializers.
+    """
+    order = _deserialize([archived.data["order"]])[0]
+    items = _deserialize(archived.data["items"])
+    history = _deserialize(archived.data["history"])
+    for item in items:
+        item.order = order
+    prefetch_related_objects([order], "user")
+    prefetch_related_objects(items, "product_type")
+    order._prefetched_objects_cache = {"items": items, "history": history}
+    return order
@@ -0,0 +1,58 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+from backend import metrics
+from .coupons import release_coupon
+from .models import Order, OrderStatusHistory, StockReservation
+from .stock import release_reservations
+
+logger = logging.getLogger(__name__)
+
+
+def expire_unpaid_orders(batch_size=None):
+    """
+    Cancel online orders still unpaid ``UNPAID_ORDER_TTL`` seconds after checkout.
+
+    Expired orders are marked ``CANCELLED`` and soft deleted, and any coupon
+    use and stock they held is given back. Each batch is its own short
+    transaction that skips rows another request has locked, such as a
+    payment being finalized right now. Returns the number of orders expired.
+    """
+    batch_size = batch_size or settings.UNPAID_ORDER_BATCH_SIZE
+    cutoff = now() - timedelta(seconds=settings.UNPAID_ORDER_TTL)
+    stale = Order.objects.filter(
+        payment_method="ONLINE", is_paid=False, status=Order.PLACED, created_at__lt=cutoff
+    )
+    expired = released = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                stale.select_for_update(skip_locked=True).order_by("id").only("id", "coupon_id")[:batch_size]
+            )
+            if not orders:
+                break
+            timestamp = now()
+            Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+                status=Order.CANCELLED, is_deleted=True, updated_at=timestamp
+            )
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(
+                    order=order,
+                    status=Order.CANCELLED,
+                    timestamp=timestamp,
+                    details="Order expired: payment was not received in time.",
+                )
+                for order in orders
+            ])
+            for order in orders:
+                if order.coupon_id and release_coupon(order):
+                    released += 1
+            release_reservations(StockReservation.objects.filter(order__in=orders))
+        expired += len(orders)
+
+    metrics.incr("orders.expired", expired)
+    metrics.incr("orders.expired.coupons_released", released)
+    logger.info("Expired %s unpaid order(s), released %s coupon(s)", expired, released)
+    return expired
@@ -0,0 +1,240 @@
+import secrets
+import time
+from bisect import bisect_right
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import Coupon, CouponRedemption
+
+# Cached "not found" marker, so unknown codes do not hit the database either.
+_MISSING = "missing"
+
+_random = secrets.SystemRandom()
+
+
+class CouponUnavailable(Exception):
+    """The coupon cannot be redeemed, the message says why."""
+
+
+def get_coupon_by_code(code):
+    """
+    Return the ``Coupon`` for ``code`` or ``None``, cached for ``COUPON_CACHE_TTL``.
+
+    ``used_count`` on the cached copy may be stale; redemption never relies on it.
+    """
+    key = Coupon.cache_key(code)
+    coupon = cache.get(key)
+    if coupon is None:
+        coupon = Coupon.objects.filter(code=code).first() or _MISSING
+        cache.set(key, coupon, settings.COUPON_CACHE_TTL)
+    return None if coupon == _MISSING else coupon
+
+
+def _claim_user_slot(coupon, user, order):
+    """Record the redemption, taking a free per-user slot when the coupon has a per-user limit."""
+    if not coupon.per_user_limit:
+        return CouponRedemption.objects.create(coupon=coupon, user=user, order=order)
+
+    taken = set(
+        CouponRedemption.objects.filter(coupon=coupon, user=user).values_list("slot", flat=True)
+    )
+    for slot in range(1, coupon.per_user_limit + 1):
+        if slot in taken:
+            continue
+        try:
+            with transaction.atomic():
+                return CouponRedemption.objects.create(coupon=coupon, user=user, order=order, slot=slot)
+        except IntegrityError:
+            # Another checkout by the same user took this slot first.
+            continue
+    raise CouponUnavailable("You have already used this coupon the maximum number of times.")
+
+
+def redeem_coupon(coupon, order, user):
+    """
+    Count one use of ``coupon`` for ``order`` or raise ``CouponUnavailable``.
+
+    Call it last inside the transaction that applies the coupon; the limit is a
+    conditional UPDATE, so the coupon row stays locked only until commit.
+    """
+    current = CouponRedemption.objects.filter(order=order).select_related("coupon").first()
+    if current and current.coupon_id == coupon.pk:
+        return current
+    if current:
+        release_coupon(order)
+
+    if coupon.usage_limit is not None and cache.get(Coupon.sold_out_key(coupon.pk)):
+        raise CouponUnavailable("Coupon is expired or usage limit exceeded")
+
+    redemption = _claim_user_slot(coupon, user, order)
+
+    counted = Coupon.objects.filter(pk=coupon.pk)
+    if coupon.usage_limit is not None:
+        counted = counted.filter(used_count__lt=F("usage_limit"))
+    if not counted.update(used_count=F("used_count") + 1):
+        cache.set(Coupon.sold_out_key(coupon.pk), True, settings.COUPON_CACHE_TTL)
+        raise CouponUnavailable("Coupon is expired or usage limit exceeded")
+    return redemption
+
+
+def release_coupon(order):
+    """Give back the coupon use held by a cancelled or deleted ``order``. Returns ``True`` if one was released."""
+    redemption = CouponRedemption.objects.filter(order=order).first()
+    if not redemption:
+        return False
+
+    deleted, _ = CouponRedemption.objects.filter(pk=redemption.pk).delete()
+    if not deleted:
+        return False
+
+    Coupon.objects.filter(pk=redemption.coupon_id, used_count__gt=0).update(used_count=F("used_count") - 1)
+    transaction.on_commit(lambda: cache.delete(Coupon.sold_out_key(redemption.coupon_id)))
+    return True
+
+
+def existing_codes(prefix=""):
+    """Load the existing coupon codes starting with ``prefix`` into a set."""
+    coupons = Coupon.objects.all()
+    if prefix:
+        coupons = coupons.filter(code__startswith=prefix)
+    return set(coupons.values_list("code", flat=True).iterator(chunk_size=settings.COUPON_BULK_BATCH_SIZE))
+
+
+def generate_codes(count, length=None, prefix="", alphabet=None):
+    """
+    Return ``count`` new random codes that clash with no existing coupon. Raises
+    ``ValueError`` when ``alphabet`` and ``length`` leave too little room for them.
+    """
+    length = length or settings.COUPON_CODE_LENGTH
+    alphabet = alphabet or settings.COUPON_CODE_ALPHABET
+    taken = existing_codes(prefix)
+    if count > (len(alphabet) ** length - len(taken)) // 2:
+        raise ValueError("Code length is too short for that many codes.")
+
+    codes = set()
+    while len(codes) < count:
+        code = prefix + "".join(_random.choices(alphabet, k=length))
+        if code not in taken:
+            codes.add(code)
+    return list(codes)
+
+
+def filter_new_codes(codes):
+    """Drop blanks, repeats and codes that already exist, keeping the input order."""
+    codes = list(dict.fromkeys(code.strip() for code in codes if code and code.strip()))
+    batch_size = settings.COUPON_BULK_BATCH_SIZE
+    taken = set()
+    for start in range(0, len(codes), batch_size):
+        taken.update(
+            Coupon.objects.filter(code__in=codes[start:start + batch_size]).values_list("code", flat=True)
+        )
+    return [code for code in codes if code not in taken]
+
+
+def create_coupons(codes, user=None, **terms):
+    """
+    Create one coupon per code with the shared ``terms`` in chunked inserts, all or
+    nothing. Returns the number of coupons created.
+    """
+    batch_size = settings.COUPON_BULK_BATCH_SIZE
+    with transaction.atomic():
+        for start in range(0, len(codes), batch_size):
+            Coupon.objects.bulk_create([
+                Coupon(code=code, created_by=user, updated_by=user, **terms)
+                for code in codes[start:start + batch_size]
+            ])
+        # Codes looked up before they existed are cached as missing
+        transaction.on_commit(lambda: Coupon.clear_cache(*codes))
+    return len(codes)
+
+
+class CouponIndex:
+    """
+    The coupons open to everyone today, sorted by ``min_order_amount`` with
+    their terms in parallel lists, so ranking them for an amount is one bisect
+    and one pass. Campaign codes are handed out privately and never suggested.
+    """
+
+    def __init__(self, coupons, version=None, day=None):
+        coupons = sorted(coupons, key=lambda coupon: coupon.min_order_amount)
+        self.version = version
+        self.day = day
+        self.built_at = time.monotonic()
+        self.coupons = coupons
+        self.thresholds = [coupon.min_order_amount for coupon in coupons]
+        self.percentages = [coupon.discount_type == Coupon.PERCENTAGE for coupon in coupons]
+        self.values = [coupon.discount_value for coupon in coupons]
+        # As in ``Coupon.discount_for``, only percentage discounts are capped
+        self.caps = [
+            coupon.max_discount if percentage and coupon.max_discount else float("inf")
+            for percentage, coupon in zip(self.percentages, coupons)
+        ]
+
+    @classmethod
+    def build(cls):
+        today = timezone.localdate()
+        coupons = Coupon.objects.filter(
+            Q(usage_limit__isnull=True) | Q(used_count__lt=F("usage_limit")),
+            campaign__isnull=True,
+            valid_from__lte=today,
+            valid_to__gte=today,
+        )
+        return cls(list(coupons), version=cache.get(Coupon.INDEX_VERSION_KEY), day=today)
+
+    def is_current(self):
+        return (
+            self.day == timezone.localdate()
+            and time.monotonic() - self.built_at < settings.COUPON_INDEX_TTL
+            and self.version == cache.get(Coupon.INDEX_VERSION_KEY)
+        )
+
+    def ranked(self, amount):
+        """``(discount, coupon)`` pairs ``amount`` qualifies for, best first."""
+        end = bisect_right(self.thresholds, amount)
+        discounts = [
+            min(amount * value / 100 if percentage else value, cap, amount)
+            for percentage, value, cap in zip(self.percentages[:end], self.values[:end], self.caps[:end])
+        ]
+        return sorted(zip(discounts, self.coupons[:end]), key=lambda pair: pair[0], reverse=True)
+
+
+_index = None
+
+
+def get_coupon_index():
+    """This process's ``CouponIndex``, rebuilt after coupon writes, daily and every ``COUPON_INDEX_TTL``."""
+    global _index
+    if _index is None or not _index.is_current():
+        _index = CouponIndex.build()
+    return _index
+
+
+def find_best_coupon(amount, user=None):
+    """
+    Return ``(coupon, discount)`` for the best coupon on ``amount``, or ``(None, 0)``,
+    skipping coupons that are sold out or that ``user`` has used up.
+    """
+    ranked = [(discount, coupon) for discount, coupon in get_coupon_index().ranked(amount) if discount > 0]
+    if not ranked:
+        return None, 0
+
+    used = {}
+    limited = [coupon.pk for _, coupon in ranked if coupon.per_user_limit]
+    if user is not None and user.is_authenticated and limited:
+        used = dict(
+            CouponRedemption.objects.filter(user=user, coupon_id__in=limited)
+            .values("coupon_id")
+            .annotate(uses=Count("id"))
+            .values_list("coupon_id", "uses")
+        )
+
+    for discount, coupon in ranked:
+        if coupon.usage_limit is not None and cache.get(Coupon.sold_out_key(coupon.pk)):
+            continue
+        if coupon.per_user_limit and used.get(coupon.pk, 0) >= coupon.per_user_limit:
+            continue
+        # Priced by the model, so the suggestion matches what applying it charges
+        return coupon, round(coupon.discount_for(amount), 2)
+    return None, 0
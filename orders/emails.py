@@ -0,0 +1,33 @@
+from django.conf import settings
+from outbox.mail import queue_email
+from .models import Order, OrderItem
+
+
+def status_update_email(order, new_status):
+    """Return the ``queue_email`` kwargs for an order status notification."""
+    return {
+        "to": order.email if order.email else order.user.email,
+        "subject": f"Your Order {order.order_number} is {new_status}",
+        "body": f"Dear {order.user.email},\n\nYour order {order.order_number} status has been updated to {new_status}.\n\nThank you!",
+        "html_template": "email_template.html",
+        "context": {"order_id": order.id, "status": new_status},
+        "context_builder": "orders.emails.status_update_context",
+    }
+
+
+def queue_status_update_email(order, new_status):
+    return queue_email(**status_update_email(order, new_status))
+
+
+def status_update_context(context):
+    """Template context for ``email_template.html``, built by the mail worker."""
+    order = Order.all_objects.get(pk=context["order_id"])
+    sub_total = order.final_price if order.final_price else order.total_price
+    return {
+        "order": order,
+        "order_items": OrderItem.objects.filter(order=order).select_related("product"),
+        "status": context["status"],
+        "sub_total": sub_total,
+        "shipping_changes": settings.SHIPPING_CHARGE,
+        "total_price": sub_total + settings.SHIPPING_CHARGE,
+    }
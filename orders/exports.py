@@ -0,0 +1,195 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import chain
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils.timezone import make_aware
+from products.models import ProductType
+from .models import ArchivedOrder, Order, OrderItem, Coupon
+
+ORDER_COLUMNS = [
+    "id", "order_number", "created_at", "user_email", "status", "payment_method",
+    "is_paid", "is_deleted", "total_price", "total_gst", "coupon_code",
+    "discount_amount", "final_price", "cod_charges", "name", "email",
+    "phone_number", "state", "city", "pincode",
+]
+
+ORDER_ITEM_COLUMNS = [
+    "id", "order_id", "order_number", "order_created_at", "product_id", "code",
+    "name", "product_type", "price", "quantity", "line_total",
+]
+
+INVOICE_COLUMNS = [
+    "order_id", "order_number", "created_at", "user_email", "payment_method",
+    "status", "coupon_code", "total_price", "total_gst", "discount_amount",
+    "sub_total", "shipping", "cod_charges", "grand_total",
+]
+
+COUPON_COLUMNS = [
+    "code", "campaign", "discount_type", "discount_value", "max_discount",
+    "min_order_amount", "valid_from", "valid_to", "usage_limit",
+    "per_user_limit", "used_count",
+]
+
+
+class Echo:
+    """Pseudo-buffer whose ``write`` hands back the value, for streaming ``csv.writer`` output."""
+
+    def write(self, value):
+        return value
+
+
+def _created_between(start, end):
+    """Half-open ``created_at`` range covering the whole ``start`` to ``end`` days."""
+    return {
+        "created_at__gte": make_aware(datetime.combine(start, time.min)),
+        "created_at__lt": make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    }
+
+
+def _archived_orders(start, end, **filters):
+    """
+    Yield ``(archived, fields)`` for the archived orders in the range, see
+    ``orders.archive``. ``fields`` is shaped like the live order rows.
+    """
+    queryset = (
+        ArchivedOrder.objects.filter(**_created_between(start, end), **filters)
+        .select_related("user")
+        .order_by("id")
+    )
+    coupon_codes = {}
+    for archived in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        fields = dict(archived.data["order"]["fields"])
+        coupon_id = fields.get("coupon")
+        if coupon_id and coupon_id not in coupon_codes:
+            coupon_codes[coupon_id] = Coupon.objects.filter(pk=coupon_id).values_list("code", flat=True).first()
+        fields.update(
+            id=archived.pk,
+            created_at=archived.created_at,
+            user_email=archived.user.email,
+            coupon_code=coupon_codes.get(coupon_id),
+        )
+        yield archived, fields
+
+
+def order_rows(start, end):
+    archived = (fields for _, fields in _archived_orders(start, end))
+    queryset = (
+        Order.all_objects.filter(**_created_between(start, end))
+        .order_by("id")
+        .values(
+            "id", "order_number", "created_at", "status", "payment_method",
+            "is_paid", "is_deleted", "total_price", "total_gst",
+            "discount_amount", "final_price", "cod_charges", "name", "email",
+            "phone_number", "state", "city", "pincode",
+            user_email=F("user__email"),
+            coupon_code=F("coupon__code"),
+        )
+    )
+    for row in chain(archived, queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)):
+        row["phone_number"] = str(row["phone_number"]) if row["phone_number"] else None
+        yield row
+
+
+def _archived_item_rows(start, end):
+    type_names = {}
+    for archived, _ in _archived_orders(start, end):
+        for item in archived.data["items"]:
+            fields = item["fields"]
+            type_id = fields.get("product_type")
+            if type_id and type_id not in type_names:
+                type_names[type_id] = ProductType.objects.filter(pk=type_id).values_list("name", flat=True).first()
+            yield {
+                **fields,
+                "id": item["pk"],
+                "order_id": archived.pk,
+                "order_number": archived.order_number,
+                "order_created_at": archived.created_at,
+                "product_id": fields.get("product"),
+                "product_type_name": type_names.get(type_id),
+            }
+
+
+def order_item_rows(start, end):
+    archived = _archived_item_rows(start, end)
+    queryset = (
+        OrderItem.objects.filter(
+            **{f"order__{key}": value for key, value in _created_between(start, end).items()}
+        )
+        .order_by("id")
+        .values(
+            "id", "order_id", "product_id", "code", "name", "price", "quantity",
+            order_number=F("order__order_number"),
+            order_created_at=F("order__created_at"),
+            product_type_name=F("product_type__name"),
+        )
+    )
+    for row in chain(archived, queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)):
+        row["product_type"] = row.pop("product_type_name")
+        row["line_total"] = row["price"] * row["quantity"]
+        yield row
+
+
+def invoice_rows(start, end):
+    archived = (
+        {**fields, "order_id": fields["id"]}
+        for _, fields in _archived_orders(start, end, data__order__fields__is_paid=True)
+    )
+    queryset = (
+        Order.all_objects.filter(is_paid=True, **_created_between(start, end))
+        .order_by("id")
+        .values(
+            "order_number", "created_at", "payment_method", "status",
+            "total_price", "total_gst", "discount_amount", "final_price",
+            "cod_charges",
+            order_id=F("id"),
+            user_email=F("user__email"),
+            coupon_code=F("coupon__code"),
+        )
+    )
+    for row in chain(archived, queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)):
+        final_price = row.pop("final_price")
+        row["sub_total"] = final_price if final_price else row["total_price"]
+        row["shipping"] = settings.SHIPPING_CHARGE
+        row["grand_total"] = row["sub_total"] + row["shipping"]
+        yield row
+
+
+def coupon_rows(campaign=None):
+    queryset = Coupon.objects.order_by("id")
+    if campaign:
+        queryset = queryset.filter(campaign=campaign)
+    return queryset.values(*COUPON_COLUMNS).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+EXPORTS = {
+    "orders": (ORDER_COLUMNS, order_rows),
+    "order_items": (ORDER_ITEM_COLUMNS, order_item_rows),
+    "invoices": (INVOICE_COLUMNS, invoice_rows),
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def stream_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row.get(column) for column in columns])
+
+
+def stream_jsonl(columns, rows):
+    for row in rows:
+        yield json.dumps({column: row.get(column) for column in columns}, cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_export(export_type, output, start, end):
+    """Yield the ``export_type`` rows between ``start`` and ``end`` encoded as ``output``, archived orders first."""
+    columns, rows = EXPORTS[export_type]
+    encoder = stream_csv if output == "csv" else stream_jsonl
+    return encoder(columns, rows(start, end))
@@ -0,0 +1,37 @@
+from outbox.dispatcher import external
+from .models import Order
+from .shiprocket import ShiprocketAPI
+from .analytics import apply_sales_event
+
+# Outbox handlers for order side effects, registered in settings.OUTBOX_HANDLERS.
+# Each receives the JSON payload recorded with the event.
+
+
+@external
+def create_shiprocket_shipment(payload):
+    order = Order.all_objects.get(pk=payload["order_id"])
+    shiprocket = ShiprocketAPI()
+
+    # Delivery is at-least-once, so each step is saved as soon as it succeeds
+    # and skipped when the event is retried.
+    if not order.shiprocket_order_id:
+        shiprocket_response = shiprocket.create_order(order)
+        if not shiprocket_response:
+            raise RuntimeError(f"Shiprocket order creation failed for order {order.id}.")
+
+        order.shiprocket_order_id = shiprocket_response.get('order_id')
+        order.shiprocket_shipment_id = shiprocket_response.get('shipment_id')
+        order.save(update_fields=["shiprocket_order_id", "shiprocket_shipment_id", "updated_at"])
+
+    # Generate AWB
+    if order.shiprocket_shipment_id and not order.awb_code:
+        awb_response = shiprocket.generate_awb(order.shiprocket_shipment_id)
+        if not awb_response or not awb_response.get('awb_code'):
+            raise RuntimeError(f"Shiprocket AWB generation failed for order {order.id}.")
+
+        order.awb_code = awb_response.get('awb_code')
+        order.save(update_fields=["awb_code", "updated_at"])
+
+
+def update_sales_rollup(payload):
+    apply_sales_event(payload["order_id"], payload["event"])
@@ -0,0 +1,122 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def _fingerprint(request):
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.get_full_path().encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """
+    Insert the in-flight row for ``key`` or return the one already there.
+
+    Returns ``(record, claimed)``. An expired row, or an in-flight row whose
+    lock ran out because its request died, is taken over.
+    """
+    timestamp = now()
+    fields = {
+        "fingerprint": fingerprint,
+        "status_code": None,
+        "response_body": None,
+        "locked_until": timestamp + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": timestamp + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+    }
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, **fields), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        return None, False
+
+    expired = record.expires_at <= timestamp
+    abandoned = record.status_code is None and record.locked_until <= timestamp
+    if expired or (abandoned and record.fingerprint == fingerprint):
+        # Conditional on the row we read, so only one retry takes it over
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, expires_at=record.expires_at, locked_until=record.locked_until
+        ).update(**fields)
+        if taken:
+            for field, value in fields.items():
+                setattr(record, field, value)
+            return record, True
+        record.refresh_from_db()
+    return record, False
+
+
+def idempotent(func):
+    """
+    Make a POST handler safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key runs normally and its response is stored for
+    ``IDEMPOTENCY_KEY_TTL`` seconds. Repeats of the same request get that
+    response back without running the handler again. A repeat that arrives
+    while the first is still running gets 409, and reusing a key for a
+    different request gets 422. Only successful responses are stored; after an
+    error the key is released so the request can be fixed and retried.
+    Requests without the header are not affected.
+    """
+    @wraps(func)
+    def wrapped_view(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return func(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            return Response({"status": False, "message": f"{HEADER} is too long."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = _fingerprint(request)
+        record, claimed = _claim(request.user, key, fingerprint)
+        if not claimed:
+            if record is not None and record.fingerprint != fingerprint:
+                return Response(
+                    {"status": False, "message": "This Idempotency-Key was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record is None or record.status_code is None:
+                return Response(
+                    {"status": False, "message": "A request with this Idempotency-Key is still being processed."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return Response(record.response_body, status=record.status_code, headers={"Idempotent-Replayed": "true"})
+
+        try:
+            response = func(self, request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+
+        if status.is_success(response.status_code):
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status_code=response.status_code, response_body=response.data
+            )
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
+
+    return wrapped_view
+
+
+def prune_expired_keys(batch_size=None):
+    """Delete expired keys in bounded batches. Returns the number deleted."""
+    batch_size = batch_size or settings.IDEMPOTENCY_PRUNE_BATCH_SIZE
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=now()).values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,116 @@
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from .models import InvoiceDocument, Order
+from .serializers import expand_requested, prefetch_order_details
+
+# Columns needed to decide whether a stored document can be served
+DOCUMENT_FIELDS = ("id", "updated_at", "is_paid", "status")
+# The customer details the documents embed
+USER_FIELDS = ("user__email", "user__phone_number", "user__first_name", "user__last_name", "user__gender")
+
+
+def document_rows(orders):
+    """``orders`` as the rows ``order_documents`` takes, with their items' last change."""
+    return orders.values(*DOCUMENT_FIELDS, *USER_FIELDS).annotate(items_updated_at=Max("items__updated_at"))
+
+
+def is_final(order):
+    """Paid and delivered orders no longer change, so their documents can be kept."""
+    return order["is_paid"] and order["status"] == Order.DELIVERED
+
+
+def make_etag(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def fingerprint(order, request):
+    """
+    Hash of what a document is rendered from: the order and its items as of
+    their last change, the customer's details and the site its absolute URLs
+    point to.
+    """
+    return make_etag([
+        order["updated_at"],
+        order["items_updated_at"],
+        [str(order[field]) for field in USER_FIELDS],
+        request.build_absolute_uri("/"),
+    ])
+
+
+def order_documents(orders, kind, serializer_class, request):
+    """
+    Return ``(data, etag)`` for each of ``orders``, in the same order.
+
+    ``orders`` are rows from ``document_rows``. Finalized orders are served
+    from their stored ``InvoiceDocument`` while its ``fingerprint`` matches,
+    in one query for all of them. The rest are serialized in
+    one prefetched batch, and the finalized ones among them stored for next
+    time. ``?expand=product`` asks for live product data and skips the store.
+    """
+    orders = list(orders)
+    cacheable = not expand_requested({"request": request}, "product")
+    documents = {}
+    if cacheable:
+        final = {order["id"]: fingerprint(order, request) for order in orders if is_final(order)}
+        if final:
+            stored = InvoiceDocument.objects.filter(order_id__in=final, kind=kind).values(
+                "order_id", "fingerprint", "data", "etag"
+            )
+            documents = {
+                document["order_id"]: (document["data"], document["etag"])
+                for document in stored
+                if document["fingerprint"] == final[document["order_id"]]
+            }
+
+    missing = [order for order in orders if order["id"] not in documents]
+    if missing:
+        queryset = prefetch_order_details(Order.objects.filter(id__in=[order["id"] for order in missing]), request)
+        context = {"request": request}
+        rendered = {instance.pk: serializer_class(instance, context=context).data for instance in queryset}
+        new = []
+        for order in missing:
+            # Round trip so a fresh document is identical to a stored one
+            data = json.loads(json.dumps(rendered[order["id"]], cls=DjangoJSONEncoder))
+            documents[order["id"]] = (data, make_etag(data))
+            if cacheable and is_final(order):
+                new.append(InvoiceDocument(
+                    order_id=order["id"],
+                    kind=kind,
+                    fingerprint=final[order["id"]],
+                    data=data,
+                    etag=documents[order["id"]][1],
+                ))
+        if new:
+            # Replaces stale documents, and races with a concurrent render are harmless
+            InvoiceDocument.objects.bulk_create(
+                new,
+                update_conflicts=True,
+                unique_fields=["order", "kind"],
+                update_fields=["fingerprint", "data", "etag"],
+            )
+
+    return [documents[order["id"]] for order in orders]
+
+
+def conditional_response(request, etag, payload):
+    """
+    Answer with ``payload`` tagged with ``etag``, or an empty 304 when the
+    client's ``If-None-Match`` already has it.
+    """
+    etag = quote_etag(etag)
+    # Weak comparison, as for GET in RFC 9110
+    tags = [tag.removeprefix("W/") for tag in parse_etags(request.headers.get("If-None-Match", ""))]
+    if etag in tags or "*" in tags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(payload, status=status.HTTP_200_OK)
+    response["ETag"] = etag
+    # The data is per user; browsers must check back before reusing it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
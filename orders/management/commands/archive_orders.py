@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move closed orders older than a number of days to the order archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive orders created more than this many days ago.")
+        parser.add_argument("--batch-size", type=int, help="Orders moved per transaction.")
+
+    def handle(self, *args, **options):
+        if options["days"] is not None and options["days"] < 1:
+            raise CommandError("--days must be at least 1.")
+        if options["batch_size"] is not None and options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        archived = archive_orders(options["days"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} order(s)."))
@@ -0,0 +1,28 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from orders.exports import EXPORTS, CONTENT_TYPES, stream_export
+
+
+class Command(BaseCommand):
+    help = "Export orders, order items or invoice totals for a date range as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", dest="export_type", choices=sorted(EXPORTS), default="orders")
+        parser.add_argument("--output", choices=sorted(CONTENT_TYPES), default="csv")
+        parser.add_argument("--from", dest="start", required=True, help="First day, YYYY-MM-DD.")
+        parser.add_argument("--to", dest="end", required=True, help="Last day, YYYY-MM-DD.")
+        parser.add_argument("--file", help="Write to this path instead of stdout.")
+
+    def handle(self, *args, **options):
+        start = parse_date(options["start"])
+        end = parse_date(options["end"])
+        if not start or not end or start > end:
+            raise CommandError("Please provide a valid --from and --to date (YYYY-MM-DD).")
+
+        rows = stream_export(options["export_type"], options["output"], start, end)
+        if options["file"]:
+            with open(options["file"], "w", newline="") as destination:
+                destination.writelines(rows)
+        else:
+            sys.stdout.writelines(rows)
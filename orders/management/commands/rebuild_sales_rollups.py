@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from orders.analytics import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups for a date range from the orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", required=True, help="First day, YYYY-MM-DD.")
+        parser.add_argument("--to", dest="end", required=True, help="Last day, YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        start = parse_date(options["start"])
+        end = parse_date(options["end"])
+        if not start or not end or start > end:
+            raise CommandError("Please provide a valid --from and --to date (YYYY-MM-DD).")
+
+        try:
+            rows = rebuild_sales_rollups(start, end)
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} sales rollup row(s) from {start} to {end}."))
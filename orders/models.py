@@ -1,4 +1,7 @@
-from django.db import models
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils.timezone import now
 from backend.models import BaseModel
 from users.models import User
 from products.models import Product, ProductType
@@ -25,10 +28,55 @@ class Coupon(BaseModel):
     min_order_amount = models.FloatField(default=0.0)  # Minimum order value requirede
     valid_from = models.DateField()
     valid_to = models.DateField()
+    usage_limit = models.PositiveIntegerField(null=True, blank=True)  # Total redemptions allowed, empty for unlimited
+    per_user_limit = models.PositiveIntegerField(null=True, blank=True)  # Redemptions allowed per user, empty for unlimited
+    used_count = models.PositiveIntegerField(default=0)
+    campaign = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+
+    # Changed on every coupon write so each process rebuilds its coupon index
+    INDEX_VERSION_KEY = "coupon:index:version"
+
+    @staticmethod
+    def cache_key(code):
+        return f"coupon:code:{code}"
+
+    @staticmethod
+    def sold_out_key(coupon_id):
+        return f"coupon:{coupon_id}:sold-out"
+
+    @staticmethod
+    def clear_cache(*codes, coupon_ids=()):
+        cache.delete_many(
+            [Coupon.cache_key(code) for code in codes] + [Coupon.sold_out_key(pk) for pk in coupon_ids]
+        )
+        cache.set(Coupon.INDEX_VERSION_KEY, uuid.uuid4().hex, None)
 
     def is_valid(self):
         today = date.today()
-        return self.valid_from <= today <= self.valid_to and self.used_count < self.usage_limit
+        return self.valid_from <= today <= self.valid_to and (
+            self.usage_limit is None or self.used_count < self.usage_limit
+        )
+
+    def discount_for(self, amount):
+        """The discount this coupon gives on ``amount``, never more than the amount itself."""
+        if self.discount_type == Coupon.PERCENTAGE:
+            discount = (amount * self.discount_value) / 100
+            if self.max_discount:
+                discount = min(discount, self.max_discount)
+        else:
+            discount = self.discount_value
+        return min(discount, amount)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # A raised usage_limit makes a sold out coupon available again
+        transaction.on_commit(lambda: Coupon.clear_cache(self.code, coupon_ids=[self.pk]))
+
+    def delete(self, *args, **kwargs):
+        code, pk = self.code, self.pk
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: Coupon.clear_cache(code, coupon_ids=[pk]))
+        return result
 
     def __str__(self):
         return f"{self.code} - {self.discount_type} ({self.discount_value})"
@@ -39,6 +87,30 @@ class Coupon(BaseModel):
         verbose_name_plural = "Coupons"
 
 
+def build_status_transitions(flow, cancellable, cancelled):
+    """
+    Precompute the allowed status moves for an order lifecycle.
+
+    Orders move forward through ``flow`` (skipping steps is allowed, going back
+    is not) and can be cancelled from any of the ``cancellable`` statuses.
+    """
+    transitions = {}
+    for position, current in enumerate(flow):
+        allowed = set(flow[position + 1:])
+        if current in cancellable:
+            allowed.add(cancelled)
+        transitions[current] = frozenset(allowed)
+    transitions[cancelled] = frozenset()
+    return transitions
+
+
+class LiveOrderManager(models.Manager):
+    """Orders that have not been soft deleted."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class Order(BaseModel):
     """Stores the overall order for a user."""
 
@@ -58,6 +130,10 @@ class Order(BaseModel):
         (CANCELLED, 'Cancelled'),
     ]
 
+    STATUS_FLOW = (PLACED, CONFIRMED, PACKAGING, SHIPPED, DELIVERED)
+    CANCELLABLE_STATUSES = (PLACED, CONFIRMED, PACKAGING)
+    STATUS_TRANSITIONS = build_status_transitions(STATUS_FLOW, CANCELLABLE_STATUSES, CANCELLED)
+
     PAYMENT_METHOD_CHOICES = [
         ('ONLINE', 'Online Payment'),
         ('COD', 'Cash on Delivery'),
@@ -72,7 +148,7 @@ class Order(BaseModel):
 
     # Payment related fields
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHOD_CHOICES, default='ONLINE')
-    razorpay_order_id = models.CharField(max_length=100, null=True, blank=True)
+    razorpay_order_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     razorpay_payment_id = models.CharField(max_length=100, null=True, blank=True)
     is_paid = models.BooleanField(default=False)
 
@@ -115,6 +191,52 @@ class Order(BaseModel):
             self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
         super().save(*args, **kwargs)
 
+    def can_transition_to(self, new_status):
+        return new_status in self.STATUS_TRANSITIONS.get(self.status, ())
+
+    def transition_to(self, new_status, details="", user=None):
+        """
+        Move the order to ``new_status`` and log it in the status history.
+
+        The write is a guarded ``UPDATE ... WHERE status = <current status>``
+        that only touches the status columns, so when another request changed
+        the status first this one becomes a no-op instead of overwriting it.
+        Returns the new ``OrderStatusHistory`` row, or ``None`` if the move is
+        not allowed or lost the race.
+        """
+        if not self.can_transition_to(new_status):
+            return None
+
+        changes = {"status": new_status, "updated_at": now()}
+        if user is not None:
+            changes["updated_by"] = user
+
+        with transaction.atomic():
+            updated = Order.objects.filter(pk=self.pk, status=self.status).update(**changes)
+            if not updated:
+                return None
+            for field, value in changes.items():
+                setattr(self, field, value)
+            if new_status == Order.CANCELLED:
+                from .coupons import release_coupon
+                from .stock import release_reservations
+
+                release_coupon(self)
+                release_reservations(self.stock_reservations.all(), committed=True)
+            if new_status in (Order.CANCELLED, Order.DELIVERED):
+                from .analytics import record_sales_event
+
+                record_sales_event(self.pk, new_status)
+            return OrderStatusHistory.objects.create(
+                order=self,
+                status=new_status,
+                timestamp=changes["updated_at"],
+                details=details,
+            )
+
+    # Soft deleted orders are hidden everywhere except through ``all_objects``
+    objects = LiveOrderManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f"Order {self.id} by {self.user.email}"
@@ -123,6 +245,16 @@ class Order(BaseModel):
         db_table = "order"
         verbose_name = "Order"
         verbose_name_plural = "Orders"
+        # Partial indexes over live orders only, matching LiveOrderManager
+        indexes = [
+            models.Index(
+                fields=["user", "-id"], name="order_live_user_idx", condition=models.Q(is_deleted=False)
+            ),
+            models.Index(
+                fields=["is_paid", "-id"], name="order_live_is_paid_idx", condition=models.Q(is_deleted=False)
+            ),
+            models.Index(fields=["status"], name="order_live_status_idx", condition=models.Q(is_deleted=False)),
+        ]
 
 
 class OrderItem(BaseModel):
@@ -151,6 +283,7 @@ class OrderItem(BaseModel):
             )
         ],
     ) 
+    preview_image = models.FileField(upload_to="previews/", max_length=255, blank=True)
 
 
     def __str__(self):
@@ -162,6 +295,79 @@ class OrderItem(BaseModel):
         verbose_name_plural = "Order Items"
 
 
+class ImageUpload(models.Model):
+    """
+    A customer photo uploaded ahead of order creation.
+
+    The upload endpoint streams the file to storage and hands back ``token``;
+    order items reference the token instead of carrying the image in the
+    order JSON. The image is decoded and checked by a background task, see
+    ``orders.uploads``. A token can be used by one order item only.
+    """
+
+    PENDING = "PENDING"
+    VALID = "VALID"
+    INVALID = "INVALID"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (VALID, "Valid"),
+        (INVALID, "Invalid"),
+    ]
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="image_uploads")
+    file = models.FileField(upload_to="orderitems/uploads/", max_length=255)
+    size = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.CharField(max_length=255, blank=True, null=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    order_item = models.OneToOneField(
+        OrderItem, on_delete=models.SET_NULL, null=True, blank=True, related_name="image_upload"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.token} ({self.status})"
+
+    class Meta:
+        db_table = "image_upload"
+        verbose_name = "Image Upload"
+        verbose_name_plural = "Image Uploads"
+
+
+class CouponRedemption(models.Model):
+    """
+    One use of a coupon, held by the order it was applied to.
+
+    The row outlives its order when the order is archived, so the use still
+    counts towards the limits; ``order`` is then empty. ``slot`` numbers a user's redemptions of a coupon from 1 to its
+    ``per_user_limit``; the unique constraint on it enforces the per-user
+    limit without locking. It is empty for coupons without a per-user limit.
+    """
+
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name="redemptions")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="coupon_redemptions")
+    order = models.OneToOneField(
+        Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="coupon_redemption"
+    )
+    slot = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.coupon.code} on order {self.order_id}"
+
+    class Meta:
+        db_table = "coupon_redemption"
+        verbose_name = "Coupon Redemption"
+        verbose_name_plural = "Coupon Redemptions"
+        constraints = [
+            models.UniqueConstraint(fields=["coupon", "user", "slot"], name="coupon_redemption_user_slot"),
+        ]
+
+
 class OrderStatusHistory(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="history")
     status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
@@ -194,4 +400,216 @@ class ProductReview(BaseModel):
         db_table = "product_review"
         verbose_name = "Product Review"
         verbose_name_plural = "Product Reviews"
-        unique_together = ('user', 'product', 'order_item')
\ No newline at end of file
+        unique_together = ('user', 'product', 'order_item')
+
+
+class SalesRollup(models.Model):
+    """
+    Paid order totals per day and payment method.
+
+    Kept up to date by the ``orders.rollup`` outbox handler as orders are paid,
+    cancelled or delivered and rebuilt nightly from the orders themselves, see
+    ``orders.analytics``. Days are the order's local creation date.
+    """
+
+    date = models.DateField()
+    payment_method = models.CharField(max_length=10, choices=Order.PAYMENT_METHOD_CHOICES)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0.0)
+    discount = models.FloatField(default=0.0)
+    cancelled_orders = models.PositiveIntegerField(default=0)
+    cancelled_revenue = models.FloatField(default=0.0)
+    delivered_orders = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} {self.payment_method}: {self.orders} orders"
+
+    class Meta:
+        db_table = "sales_rollup"
+        verbose_name = "Sales Rollup"
+        verbose_name_plural = "Sales Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=["date", "payment_method"], name="sales_rollup_key"),
+        ]
+
+
+class ProductTypeSalesRollup(models.Model):
+    """Paid order item totals per day, product type and payment method."""
+
+    date = models.DateField()
+    product_type = models.ForeignKey(ProductType, on_delete=models.CASCADE, related_name="sales_rollups")
+    payment_method = models.CharField(max_length=10, choices=Order.PAYMENT_METHOD_CHOICES)
+    orders = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0.0)
+    cancelled_quantity = models.PositiveIntegerField(default=0)
+    cancelled_revenue = models.FloatField(default=0.0)
+
+    def __str__(self):
+        return f"{self.date} {self.product_type_id} {self.payment_method}: {self.quantity} items"
+
+    class Meta:
+        db_table = "product_type_sales_rollup"
+        verbose_name = "Product Type Sales Rollup"
+        verbose_name_plural = "Product Type Sales Rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "product_type", "payment_method"], name="product_type_sales_rollup_key"
+            ),
+        ]
+
+
+class ProductSalesRollup(models.Model):
+    """Paid order item totals per day, product and payment method, for top product reports."""
+
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="sales_rollups")
+    payment_method = models.CharField(max_length=10, choices=Order.PAYMENT_METHOD_CHOICES)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0.0)
+    cancelled_quantity = models.PositiveIntegerField(default=0)
+    cancelled_revenue = models.FloatField(default=0.0)
+
+    def __str__(self):
+        return f"{self.date} {self.product_id} {self.payment_method}: {self.quantity} items"
+
+    class Meta:
+        db_table = "product_sales_rollup"
+        verbose_name = "Product Sales Rollup"
+        verbose_name_plural = "Product Sales Rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "product", "payment_method"], name="product_sales_rollup_key"
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    The outcome of a request sent with an ``Idempotency-Key`` header.
+
+    ``status_code`` stays empty while the first request is in flight; once it
+    finishes the response is stored so retries can be answered from here.
+    Rows are pruned after ``expires_at``, see ``orders.idempotency``.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_until = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'in flight'})"
+
+    class Meta:
+        db_table = "idempotency_key"
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="idempotency_key_user_key"),
+        ]
+
+
+class InvoiceDocument(models.Model):
+    """
+    The rendered JSON of a finalized order, one row per order and kind.
+
+    Paid, delivered orders do not change, so they are serialized once and
+    served from here. ``fingerprint`` covers everything the document was
+    rendered from; a document whose fingerprint no longer matches is stale
+    and is rendered again, see ``orders.invoices``.
+    """
+
+    INVOICE = "invoice"
+    ORDER = "order"
+    KIND_CHOICES = [
+        (INVOICE, "Invoice"),
+        (ORDER, "Order"),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="documents")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    fingerprint = models.CharField(max_length=64)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    etag = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.order_id} ({self.kind})"
+
+    class Meta:
+        db_table = "invoice_document"
+        verbose_name = "Invoice Document"
+        verbose_name_plural = "Invoice Documents"
+        constraints = [
+            models.UniqueConstraint(fields=["order", "kind"], name="invoice_document_order_kind"),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+    A closed order moved out of the hot order tables, see ``orders.archive``.
+
+    ``id`` is the order's original id. ``data`` holds the order, its items
+    and its status history as serialized rows, enough to rebuild unsaved
+    instances for the order serializers.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_orders")
+    order_number = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(null=True, db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"Archived order {self.id} ({self.order_number})"
+
+    class Meta:
+        db_table = "archived_order"
+        verbose_name = "Archived Order"
+        verbose_name_plural = "Archived Orders"
+        indexes = [
+            models.Index(fields=["user", "-id"], name="archived_order_user_idx"),
+        ]
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product taken from stock for an order, see ``orders.stock``.
+
+    A reservation is ``HELD`` until the order is paid (``COMMITTED``) or it
+    expires or the order is cancelled (``RELEASED``, units back in stock).
+    """
+
+    HELD = "HELD"
+    COMMITTED = "COMMITTED"
+    RELEASED = "RELEASED"
+    STATUS_CHOICES = [
+        (HELD, "Held"),
+        (COMMITTED, "Committed"),
+        (RELEASED, "Released"),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="stock_reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="stock_reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id} ({self.status})"
+
+    class Meta:
+        db_table = "stock_reservation"
+        verbose_name = "Stock Reservation"
+        verbose_name_plural = "Stock Reservations"
+        indexes = [
+            models.Index(fields=["status", "expires_at"], name="stock_reservation_expiry_idx"),
+        ]
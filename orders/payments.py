@@ -0,0 +1,111 @@
+import logging
+import razorpay
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from backend import metrics
+from backend.http_client import get_session
+from .models import Order, OrderStatusHistory
+from .analytics import record_sales_event, PAID
+from .stock import commit_reservations
+
+logger = logging.getLogger(__name__)
+
+_razorpay_clients = {}
+
+
+def get_razorpay_client():
+    """
+    Return the shared Razorpay client for the configured keys.
+
+    The client is built once per process on top of the pooled ``razorpay``
+    provider session, so API calls get its timeouts and circuit breaker.
+    """
+    auth = (settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+    client = _razorpay_clients.get(auth)
+    if client is None:
+        client = razorpay.Client(session=get_session("razorpay"), auth=auth)
+        _razorpay_clients[auth] = client
+    return client
+
+
+def finalize_razorpay_payment(razorpay_order_id, razorpay_payment_id, user=None):
+    """
+    Mark the order behind a Razorpay order id as paid, exactly once.
+
+    Both the client-side verify call and the ``payment.captured`` webhook end up
+    here. The paid flag is flipped with a conditional ``UPDATE ... WHERE
+    is_paid = false`` so concurrent retries race on a single row write and only
+    the winner logs the history entry.
+
+    Only live orders are finalized. An order that was cancelled or deleted,
+    for instance by the unpaid order expiry, has already given back its
+    coupon use and stock, so a late payment for it is recorded for a refund
+    instead, see ``_record_late_payment``.
+
+    Returns ``(order, finalized)``; ``order`` is ``None`` when no order matches
+    and ``finalized`` is ``False`` when the payment was already recorded or
+    the order was no longer live.
+    """
+    if not razorpay_order_id:
+        return None, False
+
+    # Deleted orders too, a late payment for them must still be recorded
+    order = Order.all_objects.filter(razorpay_order_id=razorpay_order_id).first()
+    if not order:
+        return None, False
+
+    changes = {
+        "is_paid": True,
+        "razorpay_payment_id": razorpay_payment_id,
+        "updated_at": now(),
+    }
+    if user is not None:
+        changes["updated_by"] = user
+
+    with transaction.atomic():
+        updated = (
+            Order.objects.filter(pk=order.pk, is_paid=False).exclude(status=Order.CANCELLED).update(**changes)
+        )
+        if not updated:
+            _record_late_payment(order, razorpay_payment_id)
+            order.refresh_from_db()
+            return order, False
+
+        OrderStatusHistory.objects.create(
+            order=order,
+            status=Order.PLACED,
+            timestamp=now(),
+            details=f"Payment received via Razorpay. Payment ID: {razorpay_payment_id}"
+        )
+        record_sales_event(order.pk, PAID)
+        commit_reservations(order)
+
+    order.refresh_from_db()
+    return order, True
+
+
+def _record_late_payment(order, razorpay_payment_id):
+    """
+    Note a payment that arrived after ``order`` was cancelled or deleted.
+
+    The order stays unpaid and cancelled, so the rollups, coupon and stock
+    are left as they are; the payment id and a history entry mark it for a
+    refund. Repeats of the same payment are recorded once.
+    """
+    late = Order.all_objects.filter(pk=order.pk, is_paid=False).filter(
+        Q(status=Order.CANCELLED) | Q(is_deleted=True)
+    ).exclude(razorpay_payment_id=razorpay_payment_id)
+    if not late.update(razorpay_payment_id=razorpay_payment_id, updated_at=now()):
+        return False
+
+    OrderStatusHistory.objects.create(
+        order=order,
+        status=order.status,
+        timestamp=now(),
+        details=f"Payment received after the order was cancelled, refund required. Payment ID: {razorpay_payment_id}",
+    )
+    metrics.incr("payments.needs_refund")
+    logger.warning("Order %s was paid after it was cancelled or deleted, payment %s needs a refund", order.pk, razorpay_payment_id)
+    return True
@@ -0,0 +1,144 @@
+import hashlib
+import io
+import json
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.timezone import now
+from PIL import Image, ImageOps
+from .models import OrderItem
+
+logger = logging.getLogger(__name__)
+
+
+def _pending_key(item_id):
+    return f"preview:pending:{item_id}"
+
+
+def needs_preview(item):
+    return bool(item.user_image) and bool(item.product.preview_placement)
+
+
+def schedule_preview(item_id):
+    """
+    Ask a ``previews`` worker to render the preview for an order item.
+
+    Repeated calls while a render is queued are dropped, so polling clients
+    do not pile up work.
+    """
+    from .tasks import render_order_item_preview
+
+    if not cache.add(_pending_key(item_id), True, settings.PREVIEW_PENDING_SECONDS):
+        return False
+    try:
+        render_order_item_preview.apply_async((item_id,), retry=False)
+    except Exception:
+        cache.delete(_pending_key(item_id))
+        logger.warning("Could not schedule the preview of order item %s", item_id, exc_info=True)
+        return False
+    return True
+
+
+def schedule_order_previews(order_id):
+    """Schedule previews for the items of an order that have a photo and a placed product."""
+    items = (
+        OrderItem.objects.filter(order_id=order_id, preview_image="", product__preview_placement__isnull=False)
+        .exclude(user_image="")
+        .values_list("id", flat=True)
+    )
+    for item_id in items:
+        schedule_preview(item_id)
+
+
+def fingerprint(template, photo, placement):
+    """Content hash of everything that decides how a preview looks."""
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(template).digest())
+    digest.update(hashlib.sha256(photo).digest())
+    digest.update(json.dumps(placement, sort_keys=True).encode())
+    digest.update(str(settings.PREVIEW_MAX_SIZE).encode())
+    return digest.hexdigest()
+
+
+def compose_preview(template, photo, placement):
+    """
+    Place ``photo`` on the product ``template`` and return the preview as JPEG bytes.
+
+    ``placement`` gives the photo's box as fractions of the template size. The
+    photo is cropped to fill the box (``cover``) or scaled to fit inside it
+    (``contain``), optionally rotated, and drawn over the template or under
+    it, for templates with a transparent window.
+    """
+    with Image.open(io.BytesIO(template)) as template_image, Image.open(io.BytesIO(photo)) as photo_image:
+        canvas = template_image.convert("RGBA")
+        photo_image = ImageOps.exif_transpose(photo_image).convert("RGBA")
+
+    box = (
+        max(1, round(placement["width"] * canvas.width)),
+        max(1, round(placement["height"] * canvas.height)),
+    )
+    if placement.get("fit", "cover") == "contain":
+        fitted = ImageOps.contain(photo_image, box, Image.LANCZOS)
+    else:
+        fitted = ImageOps.fit(photo_image, box, Image.LANCZOS)
+    if placement.get("rotation"):
+        fitted = fitted.rotate(placement["rotation"], resample=Image.BICUBIC, expand=True)
+
+    position = (
+        round(placement["x"] * canvas.width + (box[0] - fitted.width) / 2),
+        round(placement["y"] * canvas.height + (box[1] - fitted.height) / 2),
+    )
+    layer = Image.new("RGBA", canvas.size, (0, 0, 0, 0))
+    layer.paste(fitted, position, fitted)
+
+    if placement.get("layer", "over") == "under":
+        preview = Image.new("RGBA", canvas.size, (255, 255, 255, 255))
+        preview.alpha_composite(layer)
+        preview.alpha_composite(canvas)
+    else:
+        preview = canvas
+        preview.alpha_composite(layer)
+
+    preview = preview.convert("RGB")
+    preview.thumbnail((settings.PREVIEW_MAX_SIZE, settings.PREVIEW_MAX_SIZE), Image.LANCZOS)
+    output = io.BytesIO()
+    preview.save(output, "JPEG", quality=settings.PREVIEW_JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def render_preview(item_id):
+    """
+    Render and store the preview of one order item. Returns the file name.
+
+    Previews are stored under the content hash of their inputs, so the same
+    photo on the same template renders once however many items use it.
+    """
+    try:
+        item = OrderItem.objects.select_related("product").filter(pk=item_id).first()
+        if not item or not needs_preview(item):
+            return None
+
+        placement = item.product.preview_placement
+        try:
+            with item.product.image.open("rb") as file:
+                template = file.read()
+            with item.user_image.open("rb") as file:
+                photo = file.read()
+
+            name = f"previews/{fingerprint(template, photo, placement)}.jpg"
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(compose_preview(template, photo, placement)))
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+            logger.warning("Could not render the preview of order item %s", item_id, exc_info=True)
+            return None
+
+        # Only if the photo was not replaced while rendering. updated_at is
+        # bumped so stored order documents showing the item are rendered again
+        OrderItem.objects.filter(pk=item.pk, user_image=item.user_image.name).update(
+            preview_image=name, updated_at=now()
+        )
+        return name
+    finally:
+        cache.delete(_pending_key(item_id))
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Order, OrderItem, OrderStatusHistory, ProductReview, Coupon
+from .models import Order, OrderItem, OrderStatusHistory, ProductReview, Coupon, ImageUpload
 from products.models import Product, CartItems
 from products.serializers import ProductSerializer
 from django.shortcuts import get_object_or_404
@@ -7,15 +7,90 @@ from users.models import User
 from users.serializers import UserListSerializer
 from django.conf import settings
 from drf_extra_fields.fields import Base64ImageField
+from django.utils.timezone import now
+from django.db.models import Prefetch
+from collections import defaultdict
+from .stock import OutOfStock, reserve_stock
+from products.cart import cart_changed
+
+
+def expand_requested(context, name):
+    """Whether the request asked for ``name`` with ``?expand=`` (comma separated)."""
+    request = context.get("request")
+    if not request:
+        return False
+    return name in request.query_params.get("expand", "").split(",")
+
+
+def prefetch_order_details(queryset, request):
+    """
+    Load everything the order and invoice serializers read in a few queries:
+    the user with the orders, then the items (with their product type, and the
+    product only for ``?expand=product``) and the history in one query each.
+    """
+    items = OrderItem.objects.select_related("product_type").order_by("id")
+    if expand_requested({"request": request}, "product"):
+        items = items.select_related("product", "product__product_type")
+    return queryset.select_related("user").prefetch_related(
+        Prefetch("items", queryset=items),
+        "history",
+    )
+
 
 class OrderItemSerializerList(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    """
+    An order line as it was bought, from the snapshot columns on ``OrderItem``.
+
+    ``product`` is the product id; the live product is nested only when the
+    request asks for ``?expand=product``.
+    """
+
+    product_type = serializers.SlugRelatedField(slug_field="name", read_only=True)
+    image = serializers.SerializerMethodField(read_only=True)
+    line_total = serializers.SerializerMethodField(read_only=True)
     url = serializers.SerializerMethodField(read_only=True)
     user_image = serializers.SerializerMethodField(read_only=True)
+    preview_image = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = OrderItem
-        fields = ["id", "product", "quantity", "url", "user_image"]
+        fields = [
+            "id",
+            "product",
+            "name",
+            "code",
+            "product_type",
+            "price",
+            "image",
+            "quantity",
+            "line_total",
+            "url",
+            "user_image",
+            "preview_image",
+        ]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if expand_requested(self.context, "product"):
+            try:
+                data["product"] = ProductSerializer(instance.product, context=self.context).data
+            except Product.DoesNotExist:
+                # Archived orders can outlive their products
+                pass
+        return data
+
+    def get_image(self, obj):
+        if obj.image:
+            request = self.context.get("request")
+            return (
+                request.build_absolute_uri(obj.image.url)
+                if request
+                else f"{settings.MEDIA_URL}{obj.image.url}"
+            )
+        return None
+
+    def get_line_total(self, obj):
+        return obj.price * obj.quantity
     
     def get_url(self, obj):
         """Returns the URL of the product associated with the order item."""
@@ -31,6 +106,16 @@ class OrderItemSerializerList(serializers.ModelSerializer):
             )
         return None
 
+    def get_preview_image(self, obj):
+        if obj.preview_image:
+            request = self.context.get("request")
+            return (
+                request.build_absolute_uri(obj.preview_image.url)
+                if request
+                else f"{settings.MEDIA_URL}{obj.preview_image.url}"
+            )
+        return None
+
 
 class OrderHistorySerializer(serializers.ModelSerializer):
     changed_by = UserListSerializer(read_only=True)
@@ -101,10 +186,11 @@ class OrderItemSerializer(serializers.ModelSerializer):
     product_detail = ProductSerializer(source="product", read_only=True)
     url = serializers.URLField(required=False)
     user_image = Base64ImageField(required=False)
+    user_image_token = serializers.UUIDField(required=False, allow_null=True, write_only=True)
 
     class Meta:
         model = OrderItem
-        fields = ["id", "product", "product_detail", "quantity", "user_image", "url"]
+        fields = ["id", "product", "product_detail", "quantity", "user_image", "user_image_token", "url"]
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -158,7 +244,24 @@ class OrderSerializer(serializers.ModelSerializer):
         if data.get('payment_method') == 'COD':
             # Set default COD charges
             data['cod_charges'] = 60.0  # You can adjust this value as needed
-            
+
+        # Resolve image upload tokens to the uploaded files in one query
+        tokens = [item["user_image_token"] for item in data.get("items", []) if item.get("user_image_token")]
+        if tokens:
+            if len(set(tokens)) != len(tokens):
+                raise serializers.ValidationError({"items": "Each uploaded image can only be used once."})
+            uploads = {
+                upload.token: upload
+                for upload in ImageUpload.objects.filter(
+                    token__in=tokens, user=self.context["request"].user, used_at__isnull=True
+                ).exclude(status=ImageUpload.INVALID)
+            }
+            if len(uploads) != len(tokens):
+                raise serializers.ValidationError({"items": "Uploaded image not found, invalid or already used."})
+            for item in data["items"]:
+                if item.get("user_image_token"):
+                    item["image_upload"] = uploads[item["user_image_token"]]
+
         return data
 
     def create(self, validated_data):
@@ -170,6 +273,7 @@ class OrderSerializer(serializers.ModelSerializer):
         # Create the order
         order = Order.objects.create(**validated_data)
         user_cart_data = []
+        tracked = defaultdict(int)
         # Calculate total price based on items and create OrderItem instances
         for item_data in items_data:
             # Extract the product ID instead of the product instance
@@ -181,9 +285,25 @@ class OrderSerializer(serializers.ModelSerializer):
             price = product.price
             total_price += quantity * price
 
-            # Create the OrderItem instance
-            OrderItem.objects.create(order=order, product=product, quantity=quantity, name=product.name, code=product.code, product_type=product.product_type, price=product.price, image=product.image, user_image=item_data.get('user_image', None), url=item_data.get('url', None))
+            # Create the OrderItem instance, an uploaded image takes the place of a Base64 one
+            image_upload = item_data.get("image_upload")
+            user_image = image_upload.file.name if image_upload else item_data.get('user_image', None)
+            order_item = OrderItem.objects.create(order=order, product=product, quantity=quantity, name=product.name, code=product.code, product_type=product.product_type, price=product.price, image=product.image, user_image=user_image, url=item_data.get('url', None))
+            if image_upload and not ImageUpload.objects.filter(
+                pk=image_upload.pk, used_at__isnull=True
+            ).exclude(status=ImageUpload.INVALID).update(used_at=now(), order_item=order_item):
+                raise serializers.ValidationError({"items": "Uploaded image was already used."})
             user_cart_data.append(product.id)
+            if product.stock_quantity is not None:
+                tracked[product.id] += quantity
+
+        # Hold the stock last, so product rows stay locked for as short as possible
+        try:
+            reserve_stock(order, tracked)
+        except OutOfStock as error:
+            product = Product.objects.filter(pk=error.product_id).only("name", "code").first()
+            name = (product.name or product.code) if product else f"product {error.product_id}"
+            raise serializers.ValidationError({"items": f"Not enough stock left for {name}."})
 
         # Update the total price in the order
         order.total_price = total_price
@@ -192,6 +312,7 @@ class OrderSerializer(serializers.ModelSerializer):
 
         # delete cart data
         CartItems.objects.filter(cart__user=user, product__in=user_cart_data).delete()
+        cart_changed(user.pk)
         return order
 
 
@@ -242,17 +363,67 @@ class OrderItemUpdateSerializer(serializers.ModelSerializer):
 
 
 class OrderStatusUpdateSerializer(serializers.ModelSerializer):
+    details = serializers.CharField(required=False, allow_blank=True, default="", write_only=True)
+
     class Meta:
         model = Order
-        fields = '__all__'
+        fields = ["id", "order_number", "status", "details", "updated_at"]
+        read_only_fields = ["id", "order_number", "updated_at"]
+        extra_kwargs = {"status": {"required": True}}
 
     def validate_status(self, value):
-        """Ensure status is valid."""
-        if value not in dict(Order.STATUS_CHOICES):
-            raise serializers.ValidationError("Invalid status value.")
+        """Ensure the order lifecycle allows the move."""
+        if self.instance and value != self.instance.status and not self.instance.can_transition_to(value):
+            raise serializers.ValidationError(
+                f"Order cannot move from {self.instance.status} to {value}."
+            )
         return value
 
 
+class OrderFilterSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    is_paid = serializers.BooleanField(required=False)
+    payment_method = serializers.ChoiceField(choices=Order.PAYMENT_METHOD_CHOICES, required=False)
+    created_from = serializers.DateField(required=False)
+    created_to = serializers.DateField(required=False)
+
+
+class OrderBulkStatusUpdateSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=settings.BULK_STATUS_UPDATE_LIMIT,
+    )
+    filter = OrderFilterSerializer(required=False)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    details = serializers.CharField(required=False, allow_blank=True, default="")
+
+    def validate(self, data):
+        if ("order_ids" in data) == ("filter" in data):
+            raise serializers.ValidationError("Provide either order ids or a filter.")
+        return data
+
+    def get_queryset(self):
+        """Orders selected by the validated ``order_ids`` or ``filter``."""
+        if "order_ids" in self.validated_data:
+            return Order.objects.filter(id__in=self.validated_data["order_ids"])
+
+        filters = self.validated_data["filter"]
+        queryset = Order.objects.all()
+        if "status" in filters:
+            queryset = queryset.filter(status=filters["status"])
+        if "is_paid" in filters:
+            queryset = queryset.filter(is_paid=filters["is_paid"])
+        if "payment_method" in filters:
+            queryset = queryset.filter(payment_method=filters["payment_method"])
+        if "created_from" in filters:
+            queryset = queryset.filter(created_at__date__gte=filters["created_from"])
+        if "created_to" in filters:
+            queryset = queryset.filter(created_at__date__lte=filters["created_to"])
+        return queryset
+
+
 class ProductReviewSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True, default=serializers.CurrentUserDefault())
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
@@ -311,4 +482,53 @@ class UpdateProductReviewSerializer(serializers.ModelSerializer):
 class CouponSerializer(serializers.ModelSerializer):
     class Meta:
         model = Coupon
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        read_only_fields = ("used_count",)
+
+
+class CouponBulkCreateSerializer(serializers.ModelSerializer):
+    """
+    Shared terms for a coupon campaign plus where the codes come from: either
+    ``count`` random codes (with optional ``prefix`` and ``length``), a list
+    of ``codes``, or a CSV ``file`` with the codes in its first column.
+    """
+
+    count = serializers.IntegerField(required=False, min_value=1, max_value=settings.COUPON_BULK_LIMIT)
+    prefix = serializers.CharField(required=False, default="", allow_blank=True, max_length=20)
+    length = serializers.IntegerField(required=False, min_value=4, max_value=30)
+    codes = serializers.ListField(
+        child=serializers.CharField(max_length=50), required=False, max_length=settings.COUPON_BULK_LIMIT
+    )
+    file = serializers.FileField(required=False)
+
+    class Meta:
+        model = Coupon
+        fields = [
+            "campaign",
+            "discount_type",
+            "discount_value",
+            "max_discount",
+            "min_order_amount",
+            "valid_from",
+            "valid_to",
+            "usage_limit",
+            "per_user_limit",
+            "count",
+            "prefix",
+            "length",
+            "codes",
+            "file",
+        ]
+        extra_kwargs = {
+            "campaign": {"required": True, "allow_null": False, "allow_blank": False},
+            "usage_limit": {"default": 1},
+            "per_user_limit": {"default": 1},
+        }
+
+    def validate(self, data):
+        sources = [source for source in ("count", "codes", "file") if data.get(source)]
+        if len(sources) != 1:
+            raise serializers.ValidationError({"count": "Provide exactly one of count, codes or file."})
+        if data["valid_from"] > data["valid_to"]:
+            raise serializers.ValidationError({"valid_to": "Valid to must be on or after valid from."})
+        return data
@@ -1,34 +1,63 @@
+import logging
 import requests
 from django.conf import settings
-import json
+from django.core.cache import cache
+from backend.http_client import get_session
+
+logger = logging.getLogger(__name__)
+
 
 class ShiprocketAPI:
+    TOKEN_CACHE_KEY = "shiprocket:token"
+
     def __init__(self):
         self.base_url = settings.SHIPROCKET_API_URL
+        self.session = get_session("shiprocket")
         self.token = self._get_token()
 
     def _get_token(self):
-        """Get authentication token from Shiprocket"""
+        """Get authentication token from Shiprocket, reusing a cached one."""
+        token = cache.get(self.TOKEN_CACHE_KEY)
+        if token:
+            return token
+
         url = f"{self.base_url}/external/auth/login"
         payload = {
             "email": settings.SHIPROCKET_EMAIL,
             "password": settings.SHIPROCKET_PASSWORD
         }
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json().get('token')
+        response = self._request("post", url, json=payload)
+        if response is not None and response.status_code == 200:
+            token = response.json().get('token')
+            if token:
+                cache.set(self.TOKEN_CACHE_KEY, token, settings.SHIPROCKET_TOKEN_TTL)
+            return token
         return None
 
+    def _headers(self):
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.token}'
+        }
+
+    def _request(self, method, url, **kwargs):
+        """Call Shiprocket, returning ``None`` instead of raising on network errors."""
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            logger.warning("Shiprocket request to %s failed", url, exc_info=True)
+            return None
+        if response.status_code == 401:
+            # Token was revoked or expired early, fetch a fresh one next time.
+            cache.delete(self.TOKEN_CACHE_KEY)
+        return response
+
     def create_order(self, order):
         """Create order in Shiprocket"""
         if not self.token:
             return None
 
         url = f"{self.base_url}/external/orders/create/adhoc"
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.token}'
-        }
 
         # Calculate order total including COD charges if applicable
         order_total = order.final_price if order.final_price else order.total_price
@@ -69,8 +98,8 @@ class ShiprocketAPI:
             "weight": 0.5,
         }
 
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code in [200, 201]:
+        response = self._request("post", url, headers=self._headers(), json=payload)
+        if response is not None and response.status_code in [200, 201]:
             return response.json()
         return None
 
@@ -80,16 +109,12 @@ class ShiprocketAPI:
             return None
 
         url = f"{self.base_url}/external/courier/assign/awb"
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.token}'
-        }
         payload = {
             "shipment_id": shipment_id,
         }
 
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 200:
+        response = self._request("post", url, headers=self._headers(), json=payload)
+        if response is not None and response.status_code == 200:
             return response.json()
         return None
 
@@ -99,12 +124,8 @@ class ShiprocketAPI:
             return None
 
         url = f"{self.base_url}/external/courier/track/awb/{awb_code}"
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.token}'
-        }
 
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
+        response = self._request("get", url, headers=self._headers())
+        if response is not None and response.status_code == 200:
             return response.json()
-        return None 
\ No newline at end of file
+        return None
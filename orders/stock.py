@@ -0,0 +1,142 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils.timezone import now
+from backend import metrics
+from products.models import Product
+from .models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStock(Exception):
+    """Not enough units of ``product_id`` left to reserve."""
+
+    def __init__(self, product_id):
+        super().__init__(product_id)
+        self.product_id = product_id
+
+
+def _take(product_id, quantity):
+    """Take ``quantity`` units with one conditional ``UPDATE``. Returns ``True`` if there were enough."""
+    taken = Product.objects.filter(pk=product_id, stock_quantity__gte=quantity).update(
+        stock_quantity=F("stock_quantity") - quantity,
+        status=Case(
+            When(stock_quantity=quantity, then=Value(Product.OUT_OF_STOCK)),
+            default=F("status"),
+        ),
+    )
+    if not taken:
+        return False
+    # The row stays locked until commit, so this sees the stock this update left
+    if Product.objects.filter(pk=product_id, stock_quantity=0).exists():
+        transaction.on_commit(Product.clear_catalog_cache)
+    return True
+
+
+def _put_back(quantities):
+    products = Product.objects.select_for_update().filter(pk__in=quantities, stock_quantity__isnull=False)
+    sold_out = [pk for pk, stock in products.order_by("id").values_list("id", "stock_quantity") if stock == 0]
+    for product_id in sorted(quantities):
+        Product.objects.filter(pk=product_id, stock_quantity__isnull=False).update(
+            stock_quantity=F("stock_quantity") + quantities[product_id],
+            status=Value(Product.IN_STOCK) if product_id in sold_out else F("status"),
+        )
+    if sold_out:
+        transaction.on_commit(Product.clear_catalog_cache)
+
+
+def reserve_stock(order, quantities):
+    """
+    Hold stock for ``order``, ``quantities`` being ``{product_id: units}``
+    for products whose stock is tracked, or raise ``OutOfStock``.
+
+    Must run inside the transaction that creates the order. The hold lasts
+    ``STOCK_RESERVATION_TTL`` seconds unless the order is paid.
+    """
+    if not quantities:
+        return []
+    # Products are always locked in id order, here and in _put_back, so
+    # transactions sharing products cannot deadlock
+    for product_id in sorted(quantities):
+        if not _take(product_id, quantities[product_id]):
+            metrics.incr("stock.out_of_stock")
+            raise OutOfStock(product_id)
+
+    expires_at = now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    return StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def commit_reservations(order):
+    """
+    Keep the stock held for ``order`` for good, once it is paid. A hold that
+    already expired is taken again; if the stock is gone the oversell is logged.
+    """
+    with transaction.atomic():
+        StockReservation.objects.filter(order=order, status=StockReservation.HELD).update(
+            status=StockReservation.COMMITTED
+        )
+        for reservation in StockReservation.objects.filter(order=order, status=StockReservation.RELEASED):
+            if _take(reservation.product_id, reservation.quantity):
+                StockReservation.objects.filter(pk=reservation.pk).update(status=StockReservation.COMMITTED)
+            else:
+                metrics.incr("stock.oversold")
+                logger.warning(
+                    "Order %s was paid after its hold on product %s expired and the stock is gone",
+                    order.pk, reservation.product_id,
+                )
+
+
+def release_reservations(reservations, committed=False):
+    """
+    Put the units of the ``HELD`` reservations in ``reservations`` back in
+    stock, skipping rows another transaction has locked. With ``committed``,
+    for cancelled orders, paid stock is given back too and locked rows are
+    waited for. Returns the number released.
+    """
+    if committed:
+        statuses = (StockReservation.HELD, StockReservation.COMMITTED)
+        locked = reservations.filter(status__in=statuses).select_for_update()
+    else:
+        statuses = (StockReservation.HELD,)
+        locked = reservations.filter(status__in=statuses).select_for_update(skip_locked=True)
+    with transaction.atomic():
+        rows = list(locked.values_list("id", "product_id", "quantity"))
+        if not rows:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows], status__in=statuses).update(
+            status=StockReservation.RELEASED
+        )
+        quantities = defaultdict(int)
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        _put_back(quantities)
+    return len(rows)
+
+
+def release_expired_reservations(batch_size=None):
+    """Release holds past their expiry in bounded batches. Returns the number released."""
+    batch_size = batch_size or settings.STOCK_RELEASE_BATCH_SIZE
+    released = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(status=StockReservation.HELD, expires_at__lt=now())
+            .order_by("expires_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        count = release_reservations(StockReservation.objects.filter(pk__in=ids))
+        if not count:
+            # Everything left is locked by checkouts in progress
+            break
+        released += count
+
+    metrics.incr("stock.reservations_expired", released)
+    return released
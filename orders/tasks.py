@@ -0,0 +1,61 @@
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from .analytics import rebuild_sales_rollups
+from .idempotency import prune_expired_keys
+from .uploads import validate_upload, prune_unused_uploads
+from .previews import render_preview
+from .archive import archive_orders
+from .cleanup import expire_unpaid_orders
+from .stock import release_expired_reservations
+
+
+@shared_task
+def reconcile_sales_rollups():
+    """Rebuild the sales rollups for the last few days from the orders."""
+    end = timezone.localdate()
+    start = end - timedelta(days=settings.SALES_ROLLUP_RECONCILE_DAYS)
+    return rebuild_sales_rollups(start, end)
+
+
+@shared_task
+def prune_idempotency_keys():
+    """Delete stored Idempotency-Key responses past their TTL."""
+    return prune_expired_keys()
+
+
+@shared_task
+def validate_image_upload(upload_id):
+    """Decode and check an uploaded order item image."""
+    return validate_upload(upload_id)
+
+
+@shared_task
+def prune_image_uploads():
+    """Delete uploaded images that no order used."""
+    return prune_unused_uploads()
+
+
+@shared_task
+def render_order_item_preview(item_id):
+    """Render an order item preview, routed to the ``previews`` queue."""
+    return render_preview(item_id)
+
+
+@shared_task
+def archive_old_orders():
+    """Move old closed orders to the archive."""
+    return archive_orders()
+
+
+@shared_task
+def expire_stale_orders():
+    """Cancel online orders that were never paid."""
+    return expire_unpaid_orders()
+
+
+@shared_task
+def release_stock_reservations():
+    """Put stock held by orders that were not paid in time back on sale."""
+    return release_expired_reservations()
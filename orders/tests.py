@@ -1,3 +1,633 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import csv
+import tempfile
+from datetime import date, timedelta
+from io import BytesIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localdate
+from rest_framework.test import APIClient
+from PIL import Image
+from products.models import Product, ProductType
+from users.models import User
+from outbox.dispatcher import dispatch_pending, enqueue
+from outbox.models import OutboxEvent
+from .analytics import rebuild_sales_rollups
+from .archive import archive_orders, restore_instance
+from .exports import invoice_rows, order_item_rows, order_rows
+from .coupons import CouponUnavailable, find_best_coupon, redeem_coupon, release_coupon
+from .models import (
+    ArchivedOrder, Coupon, CouponRedemption, IdempotencyKey, ImageUpload, Order, OrderItem, SalesRollup,
+    StockReservation, build_status_transitions,
+)
+from .payments import finalize_razorpay_payment
+from .stock import OutOfStock, release_expired_reservations, reserve_stock
+from .uploads import validate_upload
 
-# Create your tests here.
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def create_user(email="customer@example.com"):
+    return User.objects.create_user(email=email, password="Passw0rd!")
+
+
+def create_product(code="MUG-1", price=100.0, **kwargs):
+    product_type, _ = ProductType.objects.get_or_create(name="mugs")
+    return Product.objects.create(
+        code=code,
+        name=code,
+        product_type=product_type,
+        price=price,
+        image="product/images/mug.png",
+        is_url=False,
+        is_image=True,
+        status=Product.IN_STOCK,
+        **kwargs,
+    )
+
+
+def create_order(user, product, quantity=1, **kwargs):
+    order = Order.objects.create(user=user, total_price=product.price * quantity, **kwargs)
+    OrderItem.objects.create(
+        order=order,
+        product=product,
+        quantity=quantity,
+        name=product.name,
+        code=product.code,
+        product_type=product.product_type,
+        price=product.price,
+        image=product.image,
+    )
+    return order
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product(stock_quantity=3)
+
+    def test_reserve_takes_stock_and_refuses_oversell(self):
+        order = create_order(self.user, self.product, quantity=3)
+        reserve_stock(order, {self.product.pk: 3})
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 0)
+        self.assertEqual(self.product.status, Product.OUT_OF_STOCK)
+
+        other = create_order(self.user, self.product)
+        with self.assertRaises(OutOfStock):
+            reserve_stock(other, {self.product.pk: 1})
+
+    def test_selling_out_and_restocking_clear_the_catalog_cache(self):
+        cache.set(Product.CATALOG_VERSION_KEY, "before")
+        order = create_order(self.user, self.product, quantity=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(order, {self.product.pk: 3})
+        self.assertNotEqual(cache.get(Product.CATALOG_VERSION_KEY), "before")
+
+        cache.set(Product.CATALOG_VERSION_KEY, "sold out")
+        StockReservation.objects.update(expires_at=order.created_at - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired_reservations()
+        self.assertNotEqual(cache.get(Product.CATALOG_VERSION_KEY), "sold out")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.status, Product.IN_STOCK)
+
+    def test_admin_restock(self):
+        self.product.stock_quantity = 0
+        self.product.save()
+        self.assertEqual(self.product.status, Product.OUT_OF_STOCK)
+
+        self.product.stock_quantity = 5
+        self.product.save()
+        self.assertEqual(self.product.status, Product.IN_STOCK)
+
+    def test_paid_order_keeps_stock_until_cancelled(self):
+        order = create_order(self.user, self.product, quantity=2, razorpay_order_id="order_rzp_1")
+        reserve_stock(order, {self.product.pk: 2})
+
+        order, finalized = finalize_razorpay_payment("order_rzp_1", "pay_1")
+        self.assertTrue(finalized)
+        # The webhook and the client both report the payment, only one finalizes
+        self.assertFalse(finalize_razorpay_payment("order_rzp_1", "pay_1")[1])
+        self.assertEqual(order.history.count(), 1)
+        self.assertEqual(StockReservation.objects.get(order=order).status, StockReservation.COMMITTED)
+
+        # Committed holds are not released by the expiry job
+        StockReservation.objects.update(expires_at=order.created_at - timedelta(days=1))
+        self.assertEqual(release_expired_reservations(), 0)
+
+        self.assertIsNotNone(order.transition_to(Order.CANCELLED))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+        self.assertEqual(self.product.status, Product.IN_STOCK)
+        self.assertEqual(StockReservation.objects.get(order=order).status, StockReservation.RELEASED)
+
+    def test_expired_hold_is_released_once(self):
+        order = create_order(self.user, self.product, quantity=2)
+        reserve_stock(order, {self.product.pk: 2})
+        StockReservation.objects.update(expires_at=order.created_at - timedelta(days=1))
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(release_expired_reservations(), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+
+    def test_late_payment_does_not_revive_a_cancelled_order(self):
+        order = create_order(self.user, self.product, razorpay_order_id="order_rzp_2")
+        reserve_stock(order, {self.product.pk: 1})
+        order.transition_to(Order.CANCELLED)
+
+        order, finalized = finalize_razorpay_payment("order_rzp_2", "pay_2")
+        self.assertFalse(finalized)
+        self.assertFalse(order.is_paid)
+        self.assertEqual(order.status, Order.CANCELLED)
+        self.assertEqual(order.razorpay_payment_id, "pay_2")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CouponRedemptionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product()
+        self.coupon = Coupon.objects.create(
+            code="FLASH10",
+            discount_value=10,
+            valid_from=date.today(),
+            valid_to=date.today() + timedelta(days=1),
+            usage_limit=2,
+            per_user_limit=1,
+        )
+
+    def redeem(self, order, user):
+        # As in checkout, inside the transaction that applies the coupon
+        with transaction.atomic():
+            return redeem_coupon(self.coupon, order, user)
+
+    def test_usage_limit(self):
+        users = [create_user(f"customer{number}@example.com") for number in range(3)]
+        orders = [create_order(user, self.product) for user in users]
+
+        self.redeem(orders[0], users[0])
+        self.redeem(orders[1], users[1])
+        with self.assertRaises(CouponUnavailable):
+            self.redeem(orders[2], users[2])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 2)
+
+        # A released use can be taken by someone else
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(release_coupon(orders[1]))
+        self.redeem(orders[2], users[2])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 2)
+
+    def test_raised_limit_reopens_a_sold_out_coupon(self):
+        users = [create_user(f"customer{number}@example.com") for number in range(3)]
+        orders = [create_order(user, self.product) for user in users]
+        self.redeem(orders[0], users[0])
+        self.redeem(orders[1], users[1])
+        with self.assertRaises(CouponUnavailable):
+            self.redeem(orders[2], users[2])
+
+        self.coupon.refresh_from_db()
+        self.coupon.usage_limit = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coupon.save()
+        self.redeem(orders[2], users[2])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 3)
+
+    def test_per_user_limit_and_repeats(self):
+        user = create_user()
+        first, second = create_order(user, self.product), create_order(user, self.product)
+
+        self.redeem(first, user)
+        # Applying the same coupon to the same order again counts once
+        self.redeem(first, user)
+        with self.assertRaises(CouponUnavailable):
+            self.redeem(second, user)
+
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 1)
+        self.assertEqual(CouponRedemption.objects.filter(user=user).count(), 1)
+
+    def test_release_is_counted_once(self):
+        user = create_user()
+        order = create_order(user, self.product)
+        self.redeem(order, user)
+
+        self.assertTrue(release_coupon(order))
+        self.assertFalse(release_coupon(order))
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.body = {"items": [{"product": self.product.pk, "quantity": 1}], "payment_method": "COD"}
+
+    def post(self, body, key="checkout-1"):
+        return self.client.post("/order/", body, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_the_stored_response(self):
+        first = self.post(self.body)
+        second = self.post(self.body)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_different_request_with_the_same_key(self):
+        self.post(self.body)
+        response = self.post({**self.body, "payment_method": "ONLINE"})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_rejected_request_releases_the_key(self):
+        response = self.post({**self.body, "items": [{"product": 0, "quantity": 1}]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post(self.body).status_code, 201)
+
+    def test_repeat_while_in_flight(self):
+        self.post(self.body)
+        IdempotencyKey.objects.update(status_code=None, response_body=None)
+
+        response = self.post(self.body)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SalesRollupTests(TestCase):
+    def test_rebuild_settles_queued_events(self):
+        user = create_user()
+        create_order(user, create_product(), razorpay_order_id="order_rzp_1")
+        finalize_razorpay_payment("order_rzp_1", "pay_1")
+
+        # The paid event is still queued when the nightly rebuild runs
+        rebuild_sales_rollups(localdate(), localdate())
+        dispatch_pending()
+
+        self.assertEqual(SalesRollup.objects.get().orders, 1)
+
+    def test_rebuild_refuses_archived_days(self):
+        with self.assertRaises(ValueError):
+            rebuild_sales_rollups(localdate() - timedelta(days=400), localdate())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        self.order = create_order(create_user(), self.product, status=Order.DELIVERED, is_paid=True)
+        self.order.history.create(status=Order.DELIVERED, details="Delivered")
+        self.created = localdate() - timedelta(days=400)
+        Order.objects.filter(pk=self.order.pk).update(created_at=self.order.created_at - timedelta(days=400))
+
+    def test_archive_and_restore(self):
+        live = create_order(self.order.user, self.product)
+
+        self.assertEqual(archive_orders(), 1)
+        self.assertFalse(Order.all_objects.filter(pk=self.order.pk).exists())
+        self.assertTrue(Order.objects.filter(pk=live.pk).exists())
+
+        order = restore_instance(ArchivedOrder.objects.get())
+        self.assertEqual(order.pk, self.order.pk)
+        self.assertEqual(order.order_number, self.order.order_number)
+        self.assertEqual(order.user, self.order.user)
+        self.assertEqual([item.code for item in order.items.all()], [self.product.code])
+        self.assertEqual([entry.details for entry in order.history.all()], ["Delivered"])
+
+    def test_exports_include_archived_orders(self):
+        archive_orders()
+
+        self.assertEqual([row["id"] for row in order_rows(self.created, self.created)], [self.order.pk])
+        self.assertEqual([row["order_id"] for row in invoice_rows(self.created, self.created)], [self.order.pk])
+        items = list(order_item_rows(self.created, self.created))
+        self.assertEqual([(row["code"], row["product_type"]) for row in items], [(self.product.code, "mugs")])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+@mock.patch("orders.handlers.ShiprocketAPI")
+class ShiprocketShipmentTests(TestCase):
+    def setUp(self):
+        self.order = create_order(create_user(), create_product())
+        enqueue("orders.create_shipment", {"order_id": self.order.pk})
+
+    def test_failed_awb_is_retried_without_a_second_shipment(self, api):
+        api.return_value.create_order.return_value = {"order_id": 11, "shipment_id": 22}
+        api.return_value.generate_awb.return_value = None
+
+        dispatch_pending()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.shiprocket_shipment_id, "22")
+        self.assertIsNone(self.order.awb_code)
+        self.assertEqual(OutboxEvent.objects.get().status, OutboxEvent.PENDING)
+
+        api.return_value.generate_awb.return_value = {"awb_code": "AWB1"}
+        OutboxEvent.objects.update(available_at=self.order.created_at)
+        dispatch_pending()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.awb_code, "AWB1")
+        self.assertEqual(api.return_value.create_order.call_count, 1)
+        self.assertEqual(OutboxEvent.objects.get().status, OutboxEvent.DONE)
+
+
+@override_settings(CACHES=LOCAL_CACHE, RAZORPAY_WEBHOOK_SECRET="whsec")
+class RazorpayWebhookTests(TestCase):
+    def setUp(self):
+        self.order = create_order(create_user(), create_product(), razorpay_order_id="order_rzp_1")
+
+    def post(self, body, secret="whsec"):
+        body = json.dumps(body)
+        signature = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+        return self.client.post(
+            "/order/razorpay-webhook/", body, content_type="application/json", HTTP_X_RAZORPAY_SIGNATURE=signature
+        )
+
+    def captured(self, order_id="order_rzp_1"):
+        return {
+            "event": "payment.captured",
+            "payload": {"payment": {"entity": {"id": "pay_1", "order_id": order_id}}},
+        }
+
+    def test_captured_payment_finalizes_the_order_once(self):
+        self.assertEqual(self.post(self.captured()).json()["message"], "Payment Successfully.")
+        self.assertEqual(self.post(self.captured()).json()["message"], "Payment already processed.")
+
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.is_paid)
+        self.assertEqual(self.order.razorpay_payment_id, "pay_1")
+        self.assertEqual(self.order.history.count(), 1)
+
+    def test_bad_signature_is_rejected(self):
+        response = self.post(self.captured(), secret="forged")
+
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
+
+    def test_unknown_order_and_other_events_are_acknowledged(self):
+        self.assertEqual(self.post(self.captured("order_rzp_missing")).status_code, 200)
+        self.assertEqual(self.post({"event": "payment.failed"}).json()["message"], "Event ignored.")
+
+    def test_payment_for_a_cancelled_order_is_recorded(self):
+        self.order.transition_to(Order.CANCELLED)
+
+        response = self.post(self.captured())
+        self.assertEqual(response.json()["message"], "Order was cancelled, payment recorded for a refund.")
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
+        self.assertEqual(self.order.razorpay_payment_id, "pay_1")
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class BulkStatusUpdateTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product()
+        admin = create_user("admin@example.com")
+        admin.is_staff = True
+        admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def test_moves_allowed_orders_and_reports_the_rest(self):
+        placed = create_order(self.user, self.product)
+        delivered = create_order(self.user, self.product, status=Order.DELIVERED)
+
+        response = self.client.post(
+            "/order/update-status/bulk/",
+            {"order_ids": [placed.pk, delivered.pk, 0], "status": Order.SHIPPED},
+            format="json",
+        )
+        results = {result["order_id"]: result["status"] for result in response.data["data"]}
+        self.assertEqual(results, {placed.pk: True, delivered.pk: False, 0: False})
+
+        placed.refresh_from_db()
+        delivered.refresh_from_db()
+        self.assertEqual((placed.status, delivered.status), (Order.SHIPPED, Order.DELIVERED))
+        self.assertEqual(list(placed.history.values_list("status", flat=True)), [Order.SHIPPED])
+        self.assertFalse(delivered.history.exists())
+
+    def test_select_by_filter(self):
+        orders = [create_order(self.user, self.product) for _ in range(2)]
+        create_order(self.user, self.product, status=Order.CONFIRMED)
+
+        response = self.client.post(
+            "/order/update-status/bulk/",
+            {"filter": {"status": Order.PLACED}, "status": Order.CANCELLED},
+            format="json",
+        )
+        self.assertEqual(response.data["message"], "2 order(s) updated successfully!")
+        self.assertEqual(Order.objects.filter(status=Order.CANCELLED).count(), len(orders))
+
+    def test_order_ids_or_filter_is_required(self):
+        response = self.client.post("/order/update-status/bulk/", {"status": Order.SHIPPED}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderStatusTransitionTests(TestCase):
+    def test_transition_table(self):
+        transitions = build_status_transitions(("A", "B", "C"), ("A",), "X")
+
+        self.assertEqual(transitions, {
+            "A": {"B", "C", "X"},
+            "B": {"C"},
+            "C": set(),
+            "X": set(),
+        })
+
+    def test_stale_instance_does_not_overwrite_a_newer_status(self):
+        order = create_order(create_user(), create_product())
+        stale = Order.objects.get(pk=order.pk)
+
+        self.assertIsNotNone(order.transition_to(Order.SHIPPED))
+        # Still PLACED in memory, so cancelling looks allowed but lost the race
+        self.assertIsNone(stale.transition_to(Order.CANCELLED))
+        self.assertIsNone(order.transition_to(Order.PLACED))
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.SHIPPED)
+        self.assertEqual(list(order.history.values_list("status", flat=True)), [Order.SHIPPED])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.product = create_product(price=250.0)
+        self.order = create_order(create_user(), self.product, quantity=2, is_paid=True)
+        create_order(create_user("other@example.com"), self.product)
+        admin = create_user("admin@example.com")
+        admin.is_staff = True
+        admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def export(self, **params):
+        today = localdate().isoformat()
+        return self.client.get("/order/export/", {"from": today, "to": today, **params})
+
+    def jsonl(self, response):
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_csv_orders(self):
+        response = self.export(type="orders", output="csv")
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(line.decode() for line in response.streaming_content))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["order_number"], self.order.order_number)
+        self.assertEqual(rows[0]["user_email"], "customer@example.com")
+
+    def test_jsonl_invoices_and_items(self):
+        invoices = self.jsonl(self.export(type="invoices", output="jsonl"))
+        self.assertEqual([invoice["order_id"] for invoice in invoices], [self.order.pk])
+        self.assertEqual(invoices[0]["sub_total"], 500.0)
+
+        items = self.jsonl(self.export(type="order_items", output="jsonl"))
+        self.assertEqual(items[0]["line_total"], 500.0)
+
+    def test_invalid_range(self):
+        self.assertEqual(self.export(type="refunds").status_code, 400)
+        self.assertEqual(self.client.get("/order/export/", {"from": "2024-02-01", "to": "2024-01-01"}).status_code, 400)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class BestCouponTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def coupon(self, code, **terms):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Coupon.objects.create(
+                code=code, valid_from=date.today(), valid_to=date.today() + timedelta(days=1), **terms
+            )
+
+    def test_best_discount_the_amount_qualifies_for(self):
+        self.coupon("FLAT50", discount_type=Coupon.FIXED, discount_value=50)
+        self.coupon("TENPCT", discount_value=10, max_discount=80)
+        self.coupon("BIG200", discount_type=Coupon.FIXED, discount_value=200, min_order_amount=1000)
+        self.coupon("VIP90", discount_type=Coupon.FIXED, discount_value=90, campaign="vip")
+
+        self.assertEqual(find_best_coupon(300), (Coupon.objects.get(code="FLAT50"), 50))
+        self.assertEqual(find_best_coupon(900), (Coupon.objects.get(code="TENPCT"), 80))
+        self.assertEqual(find_best_coupon(1000), (Coupon.objects.get(code="BIG200"), 200))
+        self.assertEqual(find_best_coupon(30), (Coupon.objects.get(code="FLAT50"), 30))
+
+    def test_skips_coupons_the_user_used_up(self):
+        once = self.coupon("ONCE", discount_type=Coupon.FIXED, discount_value=40, per_user_limit=1)
+        self.coupon("AGAIN", discount_type=Coupon.FIXED, discount_value=20)
+        user = create_user()
+        with transaction.atomic():
+            redeem_coupon(once, create_order(user, create_product()), user)
+
+        self.assertEqual(find_best_coupon(300)[0], once)
+        self.assertEqual(find_best_coupon(300, user)[0].code, "AGAIN")
+
+
+@override_settings(CACHES=LOCAL_CACHE, MEDIA_ROOT=tempfile.mkdtemp(), ORDER_IMAGE_MAX_SIZE=64 * 1024)
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_user())
+
+    def upload(self, content, name="photo.png"):
+        return self.client.post("/order/uploads/", {"image": SimpleUploadedFile(name, content)}, format="multipart")
+
+    def png(self, size=(40, 30)):
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def test_valid_image(self):
+        response = self.upload(self.png())
+        self.assertEqual(response.status_code, 201)
+
+        upload = ImageUpload.objects.get(token=response.data["data"]["token"])
+        self.assertTrue(validate_upload(upload.pk))
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.width, upload.height), (ImageUpload.VALID, 40, 30))
+
+    def test_file_that_is_not_an_image(self):
+        response = self.upload(b"not really a png")
+
+        upload = ImageUpload.objects.get(token=response.data["data"]["token"])
+        self.assertFalse(validate_upload(upload.pk))
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ImageUpload.INVALID)
+
+    def test_rejected_uploads(self):
+        self.assertEqual(self.upload(b"x" * (128 * 1024)).status_code, 413)
+        self.assertEqual(self.upload(self.png(), name="photo.gif").status_code, 400)
+        self.assertFalse(ImageUpload.objects.exists())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class OrderItemSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product(price=100.0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_items_show_what_was_bought(self):
+        order = create_order(self.user, self.product, quantity=2)
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed", price=150.0)
+
+        item = self.client.get(f"/order/{order.pk}/").data["data"]["items"][0]
+        self.assertEqual((item["product"], item["name"], item["price"]), (self.product.pk, "MUG-1", 100.0))
+        self.assertEqual(item["line_total"], 200.0)
+
+        item = self.client.get(f"/order/{order.pk}/", {"expand": "product"}).data["data"]["items"][0]
+        self.assertEqual(item["product"]["name"], "Renamed")
+
+    def test_order_list_queries_do_not_grow_with_orders(self):
+        create_order(self.user, self.product)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get("/order/")
+
+        for _ in range(3):
+            create_order(self.user, self.product)
+        with CaptureQueriesContext(connection) as four:
+            self.assertEqual(len(self.client.get("/order/").data["data"]), 4)
+        self.assertEqual(len(four), len(one))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SoftDeleteTests(TestCase):
+    def test_deleted_order_is_hidden_but_kept(self):
+        user = create_user()
+        product = create_product(stock_quantity=2)
+        order = create_order(user, product)
+        reserve_stock(order, {product.pk: 1})
+        client = APIClient()
+        client.force_authenticate(user)
+
+        self.assertEqual(client.delete(f"/order/{order.pk}/").status_code, 200)
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+        self.assertTrue(Order.all_objects.get(pk=order.pk).is_deleted)
+        self.assertEqual(client.get("/order/").data["data"], [])
+        self.assertEqual(client.get(f"/order/{order.pk}/").status_code, 404)
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 2)
@@ -0,0 +1,113 @@
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.db import transaction
+from django.utils.timezone import now
+from PIL import Image
+from .models import ImageUpload, OrderItem
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_EXTENSIONS = (".jpg", ".jpeg", ".png")
+ALLOWED_FORMATS = ("JPEG", "PNG")
+
+# Room for the multipart boundaries and headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class SizeLimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploaded files to a temporary file on disk, stopping as soon as the
+    request has sent more than ``max_size`` bytes of file data.
+    """
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size or settings.ORDER_IMAGE_MAX_SIZE
+        self.received = 0
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.exceeded = True
+            raise StopUpload()
+        return super().receive_data_chunk(raw_data, start)
+
+
+def create_upload(user, image):
+    """Store an uploaded image and queue its validation. Returns the ``ImageUpload``."""
+    extension = os.path.splitext(image.name)[1].lower()
+    with transaction.atomic():
+        upload = ImageUpload(user=user, size=image.size)
+        upload.file.save(f"{upload.token.hex}{extension}", image, save=False)
+        upload.save()
+        transaction.on_commit(lambda: _schedule_validation(upload.pk))
+    return upload
+
+
+def _schedule_validation(upload_id):
+    from .tasks import validate_image_upload
+
+    try:
+        validate_image_upload.apply_async((upload_id,), retry=False)
+    except Exception:
+        logger.warning("Could not schedule validation of image upload %s", upload_id, exc_info=True)
+
+
+def _check_image(file):
+    with Image.open(file) as image:
+        if image.format not in ALLOWED_FORMATS:
+            raise ValueError("Only JPG and PNG images are allowed.")
+        width, height = image.size
+        if width * height > settings.ORDER_IMAGE_MAX_PIXELS:
+            raise ValueError("Image dimensions are too large.")
+        # Decode the whole image so truncated or corrupt files are caught
+        image.load()
+    return width, height
+
+
+def validate_upload(upload_id):
+    """
+    Decode a pending upload with Pillow and mark it valid or invalid.
+
+    Invalid files are deleted; an order item already using one loses its
+    image. Returns ``True`` when the image is valid.
+    """
+    upload = ImageUpload.objects.filter(pk=upload_id, status=ImageUpload.PENDING).first()
+    if not upload:
+        return False
+
+    try:
+        with upload.file.open("rb") as file:
+            width, height = _check_image(file)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as error:
+        with transaction.atomic():
+            ImageUpload.objects.filter(pk=upload.pk).update(status=ImageUpload.INVALID, error=str(error)[:255])
+            OrderItem.objects.filter(image_upload__pk=upload.pk).update(user_image="", updated_at=now())
+        upload.file.delete(save=False)
+        logger.info("Image upload %s is invalid: %s", upload.pk, error)
+        return False
+
+    ImageUpload.objects.filter(pk=upload.pk).update(status=ImageUpload.VALID, width=width, height=height)
+    return True
+
+
+def prune_unused_uploads(batch_size=None):
+    """Delete uploads never used by an order within ``ORDER_IMAGE_UPLOAD_TTL``, with their files."""
+    batch_size = batch_size or settings.ORDER_IMAGE_PRUNE_BATCH_SIZE
+    cutoff = now() - timedelta(seconds=settings.ORDER_IMAGE_UPLOAD_TTL)
+    deleted = 0
+    while True:
+        uploads = list(ImageUpload.objects.filter(used_at__isnull=True, created_at__lt=cutoff)[:batch_size])
+        if not uploads:
+            return deleted
+        ids = [upload.pk for upload in uploads]
+        # An order may have claimed one of them since, keep those
+        deleted += ImageUpload.objects.filter(pk__in=ids, used_at__isnull=True).delete()[0]
+        kept = set(ImageUpload.objects.filter(pk__in=ids).values_list("pk", flat=True))
+        for upload in uploads:
+            if upload.pk not in kept and upload.file:
+                upload.file.delete(save=False)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import OrderAPIView, CreateRazorpayOrder, VerifyPayment, InvoiceListView, OrderItemUpdateAPIView, OrderStatusUpdateView, OrderStatusHistoryAPIView, CreateProductReviewAPIView, ApplyCouponView, CouponAPIView, CODPayment
+from .views import OrderAPIView, CreateRazorpayOrder, VerifyPayment, InvoiceListView, OrderItemUpdateAPIView, OrderStatusUpdateView, OrderStatusHistoryAPIView, CreateProductReviewAPIView, ApplyCouponView, CouponAPIView, CODPayment, RazorpayWebhookView, OrderBulkStatusUpdateView, OrderExportView, SalesAnalyticsView, CouponBulkCreateView, CouponExportView, BestCouponView, OrderImageUploadView, OrderItemPreviewView
 
 urlpatterns = [
     # Product Type API
@@ -8,14 +8,24 @@ urlpatterns = [
     path('checkout-order/<int:order_id>/', CreateRazorpayOrder.as_view(), name='checkout_order'),
     path('cod-checkout-order/<int:order_id>/', CODPayment.as_view(), name='cod-checkout_order'),
     path('verify-payment/', VerifyPayment.as_view(), name='verify_payment'),
+    path('razorpay-webhook/', RazorpayWebhookView.as_view(), name='razorpay_webhook'),
     path('invoices/', InvoiceListView.as_view(), name='invoice-list'),
+    path('export/', OrderExportView.as_view(), name='order-export'),
+    path('analytics/', SalesAnalyticsView.as_view(), name='sales-analytics'),
     path("order-item/<int:pk>/", OrderItemUpdateAPIView.as_view(), name="order-item-update"),
+    path("order-item/<int:pk>/preview/", OrderItemPreviewView.as_view(), name="order-item-preview"),
+    path('uploads/', OrderImageUploadView.as_view(), name='order-image-upload'),
+    path('uploads/<uuid:token>/', OrderImageUploadView.as_view(), name='order-image-upload-detail'),
     path('update-status/<int:order_id>/', OrderStatusUpdateView.as_view(), name='update_order_status'),
+    path('update-status/bulk/', OrderBulkStatusUpdateView.as_view(), name='bulk_update_order_status'),
     path("order-history/", OrderStatusHistoryAPIView.as_view(), name="order-history"),
     path("order-history/<int:order_id>/", OrderStatusHistoryAPIView.as_view(), name="order-history-detail"),
     path('reviews/', CreateProductReviewAPIView.as_view(), name='create-review'),
     path('reviews/<int:review_id>/', CreateProductReviewAPIView.as_view(), name='update-delete-review'),
     path('apply-coupon/<int:order_id>/', ApplyCouponView.as_view(), name='apply_coupon'),
     path('coupons/', CouponAPIView.as_view(), name='coupon-list-create'),
+    path('coupons/bulk/', CouponBulkCreateView.as_view(), name='coupon-bulk-create'),
+    path('coupons/export/', CouponExportView.as_view(), name='coupon-export'),
+    path('coupons/best/', BestCouponView.as_view(), name='coupon-best'),
     path('coupons/<int:pk>/', CouponAPIView.as_view(), name='coupon-detail')
 ]
\ No newline at end of file
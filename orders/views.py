@@ -1,28 +1,59 @@
 from rest_framework import status, generics
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Order, OrderItem, OrderStatusHistory, ProductReview, Coupon
+from rest_framework.parsers import MultiPartParser
+from rest_framework.pagination import PageNumberPagination
+from .models import Order, OrderItem, OrderStatusHistory, ProductReview, Coupon, ImageUpload, InvoiceDocument, ArchivedOrder, StockReservation
 from .serializers import (
     OrderSerializer,
     OrderSerializerList,
     InvoiceListSerializer,
     OrderItemUpdateSerializer,
     OrderStatusUpdateSerializer,
+    OrderBulkStatusUpdateSerializer,
     OrderHistorySerializer,
     ProductReviewSerializer,
     UpdateProductReviewSerializer,
-    CouponSerializer
+    CouponSerializer,
+    CouponBulkCreateSerializer,
+    prefetch_order_details,
 )
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from django.conf import settings
 import razorpay
 from backend.utils import serializers_error, superuser_required
-from django.core.mail import send_mail
+from django.db import transaction
 from django.utils.timezone import now
 from datetime import date
-from django.template.loader import render_to_string
-from .shiprocket import ShiprocketAPI
+from .payments import get_razorpay_client, finalize_razorpay_payment
+from outbox.dispatcher import enqueue
+from .emails import queue_status_update_email, status_update_email
+from outbox.mail import queue_emails
+from .exports import EXPORTS, CONTENT_TYPES, COUPON_COLUMNS, stream_export, stream_csv, coupon_rows
+from .analytics import record_sales_event, sales_report, PAID
+from .idempotency import idempotent
+from .uploads import SizeLimitedUploadHandler, create_upload, ALLOWED_EXTENSIONS, MULTIPART_OVERHEAD
+from .previews import needs_preview, schedule_preview, schedule_order_previews
+from .invoices import document_rows, order_documents, conditional_response, make_etag
+from .archive import restore_instance
+from .stock import commit_reservations, release_reservations
+from .coupons import (
+    get_coupon_by_code,
+    redeem_coupon,
+    release_coupon,
+    generate_codes,
+    filter_new_codes,
+    create_coupons,
+    find_best_coupon,
+    CouponUnavailable,
+)
+import csv
+import io
+import json
+import os
 
 class ApplyCouponView(APIView):
     permission_classes = [IsAuthenticated]
@@ -39,11 +70,11 @@ class ApplyCouponView(APIView):
                 return Response({"status": False, "message": "Coupon code is required"}, status=status.HTTP_400_BAD_REQUEST)
 
             # Get coupon by code
-            coupon = Coupon.objects.filter(code=coupon_code).first()
+            coupon = get_coupon_by_code(coupon_code)
             if not coupon:
                 return Response({"status": False, "message": "Invalid coupon code"}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Check if coupon is valid (date & usage)
+            # Check if coupon is valid (date), usage is checked when it is redeemed
             today = date.today()
             if not (coupon.valid_from <= today <= coupon.valid_to):
                 return Response({"status": False, "message": "Coupon is expired or usage limit exceeded"}, status=status.HTTP_400_BAD_REQUEST)
@@ -54,17 +85,18 @@ class ApplyCouponView(APIView):
                                 status=status.HTTP_400_BAD_REQUEST)
 
             # Apply discount
-            if coupon.discount_type == Coupon.PERCENTAGE:
-                discount = (order.total_price * coupon.discount_value) / 100
-                if coupon.max_discount:
-                    discount = min(discount, coupon.max_discount)
-            else:
-                discount = coupon.discount_value
+            discount = coupon.discount_for(order.total_price)
 
             order.coupon = coupon
             order.discount_amount = discount
             order.final_price = max(0, order.total_price - discount)  # Ensure non-negative price
-            order.save()
+            try:
+                with transaction.atomic():
+                    order.save(update_fields=["coupon", "discount_amount", "final_price", "updated_at"])
+                    # Count the use last, so the coupon row is locked as briefly as possible
+                    redeem_coupon(coupon, order, request.user)
+            except CouponUnavailable as error:
+                return Response({"status": False, "message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
             serializer = OrderSerializerList(order, context={"request": request})
             return Response({
@@ -79,6 +111,54 @@ class ApplyCouponView(APIView):
             return Response({"status": False, "message": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+class BestCouponView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Find the coupon with the biggest discount for one of the user's
+        orders (``order_id``) or for an ``amount`` such as a cart total.
+        """
+        order_id = request.query_params.get("order_id")
+        if order_id:
+            order = Order.objects.filter(id=order_id, user=request.user).first()
+            if not order:
+                return Response({"status": False, "message": "Order data not found."}, status=status.HTTP_400_BAD_REQUEST)
+            amount = order.total_price
+        else:
+            try:
+                amount = float(request.query_params.get("amount", ""))
+            except ValueError:
+                return Response({"status": False, "message": "Please provide an order id or an amount."}, status=status.HTTP_400_BAD_REQUEST)
+            if amount < 0:
+                return Response({"status": False, "message": "Amount must not be negative."}, status=status.HTTP_400_BAD_REQUEST)
+
+        coupon, discount = find_best_coupon(amount, request.user)
+        if not coupon:
+            return Response(
+                {"status": True, "data": None, "message": "No coupon applicable for this amount."},
+                status=status.HTTP_200_OK,
+            )
+
+        return Response(
+            {
+                "status": True,
+                "data": {
+                    "coupon_code": coupon.code,
+                    "discount_type": coupon.discount_type,
+                    "discount_value": coupon.discount_value,
+                    "max_discount": coupon.max_discount,
+                    "min_order_amount": coupon.min_order_amount,
+                    "valid_to": coupon.valid_to,
+                    "discount_amount": discount,
+                    "final_price": max(0, amount - discount),
+                },
+                "message": "Best coupon found successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class OrderAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -96,15 +176,22 @@ class OrderAPIView(APIView):
             )
 
         if order_id:
-            order = get_object_or_404(Order, pk=order_id, user=request.user)
-            serializer = OrderSerializerList(order, context={"request": request})
-            return Response(
+            order = document_rows(Order.objects.filter(pk=order_id, user=request.user)).first()
+            if order:
+                data, etag = order_documents([order], InvoiceDocument.ORDER, OrderSerializerList, request)[0]
+            else:
+                # Old closed orders live in the archive
+                archived = get_object_or_404(ArchivedOrder, pk=order_id, user=request.user)
+                data = OrderSerializerList(restore_instance(archived), context={"request": request}).data
+                etag = make_etag(data)
+            return conditional_response(
+                request,
+                etag,
                 {
                     "status": True,
-                    "data": serializer.data,
+                    "data": data,
                     "message": "Order arrived successfully.",
                 },
-                status=status.HTTP_200_OK,
             )
 
         if self.request.user.is_site_admin:
@@ -121,6 +208,7 @@ class OrderAPIView(APIView):
 
             orders = orders.order_by("-id")
 
+        orders = prefetch_order_details(orders, request)
         serializer = OrderSerializerList(orders, many=True, context={"request": request})
         return Response(
             {
@@ -131,6 +219,7 @@ class OrderAPIView(APIView):
             status=status.HTTP_200_OK,
         )
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         """
         Create a new order for the authenticated user.
@@ -138,42 +227,34 @@ class OrderAPIView(APIView):
         # Pass the request context to the serializer
         serializer = OrderSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
-            # Save the order
-            order = serializer.save(
-                user=self.request.user,
-                created_by=self.request.user,
-                updated_by=self.request.user,
-            )
-
-            # If it's a COD order, mark it as not returnable and create Shiprocket order
-            if order.payment_method == 'COD':
-                order.is_returnable = False
-                order.is_paid = True  # For COD orders, mark as paid
-                order.save()
-
-                # Create Shiprocket order
-                shiprocket = ShiprocketAPI()
-                shiprocket_response = shiprocket.create_order(order)
-
-                if shiprocket_response:
-                    order.shiprocket_order_id = shiprocket_response.get('order_id')
-                    order.shiprocket_shipment_id = shiprocket_response.get('shipment_id')
-                    order.save()
-
-                    # Generate AWB
-                    if order.shiprocket_shipment_id:
-                        awb_response = shiprocket.generate_awb(order.shiprocket_shipment_id)
-                        if awb_response:
-                            order.awb_code = awb_response.get('awb_code')
-                            order.save()
-
-                # Create order history entry
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status=Order.PLACED,
-                    timestamp=now(),
-                    details="COD order placed successfully"
+            with transaction.atomic():
+                # Save the order
+                order = serializer.save(
+                    user=self.request.user,
+                    created_by=self.request.user,
+                    updated_by=self.request.user,
                 )
+                transaction.on_commit(lambda: schedule_order_previews(order.id))
+
+                # If it's a COD order, queue the Shiprocket order
+                if order.payment_method == 'COD':
+                    order.is_paid = True  # For COD orders, mark as paid
+                    order.save(update_fields=["is_paid", "updated_at"])
+
+                    # Create order history entry
+                    OrderStatusHistory.objects.create(
+                        order=order,
+                        status=Order.PLACED,
+                        timestamp=now(),
+                        details="COD order placed successfully"
+                    )
+                    enqueue(
+                        "orders.create_shipment",
+                        {"order_id": order.id},
+                        dedupe_key=f"order:{order.id}:shipment",
+                    )
+                    record_sales_event(order.id, PAID)
+                    commit_reservations(order)
 
             return Response(
                 {
@@ -207,8 +288,11 @@ class OrderAPIView(APIView):
                 {"status": False, "message": "Order not found."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        order.is_deleted = True
-        order.save()
+        with transaction.atomic():
+            order.is_deleted = True
+            order.save()
+            release_coupon(order)
+            release_reservations(order.stock_reservations.all())
         return Response(
             {"status": True, "message": "Order deleted successfully."},
             status=status.HTTP_200_OK,
@@ -218,6 +302,7 @@ class OrderAPIView(APIView):
 class CreateRazorpayOrder(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request, order_id):
         # Get order details from your system
         name = request.data.get("name")
@@ -245,14 +330,12 @@ class CreateRazorpayOrder(APIView):
         if payment_method == 'ONLINE' and  order.is_cod == False and order.is_paid == False:
 
             # Razorpay client initialization
-            client = razorpay.Client(
-                auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-            )
+            client = get_razorpay_client()
             # Gset the total order amount.
             amount = order.total_price if not order.coupon else order.final_price
 
             # Add shipping charges
-            amount += 60
+            amount += settings.SHIPPING_CHARGE
 
             # Create a Razorpay order
             razorpay_order_data = {
@@ -317,17 +400,8 @@ class VerifyPayment(APIView):
         razorpay_order_id = request.data.get("razorpay_order_id")
         razorpay_signature = request.data.get("razorpay_signature")
 
-        # Verify the order exists
-        order = Order.objects.filter(razorpay_order_id=razorpay_order_id).first()
-        if not order:
-            return Response(
-                {"status": False, "message": "Payment order not found."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        # Proceed to verify the payment signature
-        client = razorpay.Client(
-            auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-        )
+        # Verify the payment signature before touching the database
+        client = get_razorpay_client()
         params_dict = {
             "razorpay_order_id": razorpay_order_id,
             "razorpay_payment_id": razorpay_payment_id,
@@ -336,33 +410,101 @@ class VerifyPayment(APIView):
 
         try:
             client.utility.verify_payment_signature(params_dict)
+        except razorpay.errors.SignatureVerificationError:
+            return Response(
+                {"status": False, "message": "Payment verification failed"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            # Mark the order as paid
-            order.razorpay_payment_id = razorpay_payment_id
-            order.is_paid = True
-            order.created_by = self.request.user
-            order.updated_by = self.request.user
-            order.save()
+        # Mark the order as paid; the webhook may already have done it.
+        order, finalized = finalize_razorpay_payment(
+            razorpay_order_id, razorpay_payment_id, user=self.request.user
+        )
+        if not order:
+            return Response(
+                {"status": False, "message": "Payment order not found."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not order.is_paid:
+            return Response(
+                {"status": False, "message": "Order was cancelled before the payment arrived, it will be refunded."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        return Response(
+            {"status": True, "message": "Payment Successfully."},
+            status=status.HTTP_200_OK,
+        )
+
+
+class RazorpayWebhookView(APIView):
+    """
+    Receives Razorpay webhooks and finalizes captured payments.
 
-            # Log payment in order history
-            OrderStatusHistory.objects.create(
-                order=order,
-                status=Order.PLACED,
-                timestamp=now(),
-                details=f"Payment received via Razorpay. Payment ID: {razorpay_payment_id}"
+    The request is authenticated by the ``X-Razorpay-Signature`` HMAC of the raw
+    body, so no user session or token is involved.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        signature = request.headers.get("X-Razorpay-Signature")
+        body = request.body.decode("utf-8")
+
+        if not signature or not settings.RAZORPAY_WEBHOOK_SECRET:
+            return Response(
+                {"status": False, "message": "Webhook signature missing."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
+        try:
+            get_razorpay_client().utility.verify_webhook_signature(
+                body, signature, settings.RAZORPAY_WEBHOOK_SECRET
+            )
+            event = json.loads(body)
+        except (razorpay.errors.SignatureVerificationError, ValueError):
             return Response(
-                {"status": True, "message": "Payment Successfully."},
+                {"status": False, "message": "Webhook verification failed."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if event.get("event") != "payment.captured":
+            return Response(
+                {"status": True, "message": "Event ignored."},
                 status=status.HTTP_200_OK,
             )
 
-        except razorpay.errors.SignatureVerificationError:
+        payment = event.get("payload", {}).get("payment", {}).get("entity", {})
+        order, finalized = finalize_razorpay_payment(
+            payment.get("order_id"), payment.get("id")
+        )
+
+        # Unknown orders are acknowledged too, otherwise Razorpay keeps retrying.
+        if not order:
             return Response(
-                {"status": False, "message": "Payment verification failed"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"status": False, "message": "Payment order not found."},
+                status=status.HTTP_200_OK,
             )
 
+        return Response(
+            {
+                "status": True,
+                "message": (
+                    "Payment Successfully." if finalized
+                    else "Payment already processed." if order.is_paid
+                    else "Order was cancelled, payment recorded for a refund."
+                ),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class InvoicePagination(PageNumberPagination):
+    page_size = settings.INVOICE_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.INVOICE_MAX_PAGE_SIZE
+
 
 class InvoiceListView(generics.ListAPIView):
     """
@@ -371,24 +513,168 @@ class InvoiceListView(generics.ListAPIView):
 
     permission_classes = [IsAuthenticated]
     serializer_class = InvoiceListSerializer
+    pagination_class = InvoicePagination
 
     def get_queryset(self):
-        # Filter orders for the authenticated user
-        return Order.objects.filter(user=self.request.user)
+        # Filter orders for the authenticated user, newest first
+        return document_rows(Order.objects.filter(user=self.request.user).order_by("-id"))
+
+    def paginate_queryset(self, queryset):
+        # Pages are opt in, without ?page or ?page_size the full list is returned as before
+        if not {"page", "page_size"} & set(self.request.query_params):
+            return None
+        return super().paginate_queryset(queryset)
 
     def list(self, request, *args, **kwargs):
-        # Use the default list method, but customize the response
+        # Finalized invoices come from their stored documents, the rest are serialized
         queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(queryset)
+        documents = order_documents(
+            queryset if page is None else page, InvoiceDocument.INVOICE, self.get_serializer_class(), request
+        )
+        payload = {
+            "status": True,
+            "data": [data for data, _ in documents],
+            "message": "Invoice data arrived successfully.",
+        }
+        versions = [etag for _, etag in documents]
+        if page is not None:
+            payload["count"] = self.paginator.page.paginator.count
+            payload["next"] = self.paginator.get_next_link()
+            payload["previous"] = self.paginator.get_previous_link()
+            versions = [payload["count"], self.paginator.page.number, versions]
+        return conditional_response(request, make_etag(versions), payload)
+
+
+class OrderExportView(APIView):
+    """
+    Stream orders, order items or invoice totals for a date range as CSV or JSONL.
+
+    Query params: ``type`` (orders, order_items, invoices), ``output`` (csv,
+    jsonl), ``from`` and ``to`` (YYYY-MM-DD, inclusive). Rows are read with a
+    server-side cursor and written as they arrive, so memory use stays flat
+    regardless of the range.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        export_type = request.query_params.get("type", "orders")
+        output = request.query_params.get("output", "csv")
+        start = parse_date(request.query_params.get("from") or "")
+        end = parse_date(request.query_params.get("to") or "")
+
+        if export_type not in EXPORTS or output not in CONTENT_TYPES:
+            return Response(
+                {"status": False, "message": "Invalid export type or output format."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not start or not end or start > end:
+            return Response(
+                {"status": False, "message": "Please provide a valid from and to date (YYYY-MM-DD)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        response = StreamingHttpResponse(
+            stream_export(export_type, output, start, end),
+            content_type=CONTENT_TYPES[output],
+        )
+        response["Content-Disposition"] = f'attachment; filename="{export_type}_{start}_{end}.{output}"'
+        return response
+
+
+class SalesAnalyticsView(APIView):
+    """
+    Sales totals, daily and per payment method breakdowns, product type totals
+    and top products for ``from`` to ``to`` (YYYY-MM-DD, inclusive).
+
+    Answered from the sales rollup tables, see ``orders.analytics``.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        start = parse_date(request.query_params.get("from") or "")
+        end = parse_date(request.query_params.get("to") or "")
+        if not start or not end or start > end:
+            return Response(
+                {"status": False, "message": "Please provide a valid from and to date (YYYY-MM-DD)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         return Response(
             {
                 "status": True,
-                "data": serializer.data,
-                "message": "Invoice data arrived successfully.",
+                "data": sales_report(start, end),
+                "message": "Sales analytics fetched successfully.",
             },
             status=status.HTTP_200_OK,
         )
 
+
+class OrderImageUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        """
+        Upload a photo for a personalized order item as multipart ``image``.
+
+        The file is streamed to disk and rejected once it passes
+        ``ORDER_IMAGE_MAX_SIZE``. Returns a token to send as
+        ``user_image_token`` on the order item; the image itself is checked by
+        a background worker.
+        """
+        max_size = settings.ORDER_IMAGE_MAX_SIZE
+        too_large = Response(
+            {"status": False, "message": f"Image file size should be less than {max_size // (1024 * 1024)}MB"},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        if int(request.META.get("CONTENT_LENGTH") or 0) > max_size + MULTIPART_OVERHEAD:
+            return too_large
+
+        handler = SizeLimitedUploadHandler(request._request, max_size)
+        request._request.upload_handlers = [handler]
+        image = request.FILES.get("image")
+        if handler.exceeded:
+            return too_large
+        if not image:
+            return Response({"status": False, "message": "Please upload an image."}, status=status.HTTP_400_BAD_REQUEST)
+        if os.path.splitext(image.name)[1].lower() not in ALLOWED_EXTENSIONS:
+            return Response({"status": False, "message": "Only JPG and PNG images are allowed."}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = create_upload(request.user, image)
+        return Response(
+            {
+                "status": True,
+                "data": {"token": upload.token, "status": upload.status},
+                "message": "Image uploaded successfully.",
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    def get(self, request, token):
+        """Check whether an uploaded image passed validation."""
+        upload = ImageUpload.objects.filter(token=token, user=request.user).first()
+        if not upload:
+            return Response({"status": False, "message": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {
+                "status": True,
+                "data": {
+                    "token": upload.token,
+                    "status": upload.status,
+                    "error": upload.error,
+                    "width": upload.width,
+                    "height": upload.height,
+                    "used": upload.used_at is not None,
+                },
+                "message": "Upload arrived successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class OrderItemUpdateAPIView(generics.UpdateAPIView):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemUpdateSerializer
@@ -406,7 +692,13 @@ class OrderItemUpdateAPIView(generics.UpdateAPIView):
             # Serialize and update
             serializer = self.get_serializer(order_item, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save( updated_by=self.request.user)
+                if "user_image" in serializer.validated_data:
+                    # The old preview shows the old photo, render a new one
+                    serializer.save(updated_by=self.request.user, preview_image="")
+                    if needs_preview(order_item):
+                        schedule_preview(order_item.id)
+                else:
+                    serializer.save( updated_by=self.request.user)
                 return Response(
                     {"status": True, "message": "Order item updated successfully.", "data": serializer.data},
                     status=status.HTTP_200_OK
@@ -425,29 +717,65 @@ class OrderItemUpdateAPIView(generics.UpdateAPIView):
         )
 
 
+class OrderItemPreviewView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """
+        Return the preview of a personalized order item, queueing the render
+        with 202 when it is not ready yet.
+        """
+        order_items = OrderItem.objects.select_related("product")
+        if not request.user.is_site_admin:
+            order_items = order_items.filter(order__user=request.user)
+        order_item = order_items.filter(id=pk).first()
+        if not order_item:
+            return Response({"status": False, "message": "Order item not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if order_item.preview_image:
+            return Response(
+                {
+                    "status": True,
+                    "data": {"preview_image": request.build_absolute_uri(order_item.preview_image.url)},
+                    "message": "Preview arrived successfully.",
+                },
+                status=status.HTTP_200_OK,
+            )
+        if not needs_preview(order_item):
+            return Response({"status": False, "message": "No preview available for this item."}, status=status.HTTP_404_NOT_FOUND)
+
+        schedule_preview(order_item.id)
+        return Response(
+            {"status": True, "data": {"preview_image": None}, "message": "Preview is being rendered, please try again shortly."},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
 class OrderStatusUpdateView(APIView):
     permission_classes = [IsAdminUser]
 
     def patch(self, request, order_id):
         """Update order status, log history, and send email"""
         order = get_object_or_404(Order, id=order_id)
-        old_status = order.status
-        
-        serializer = OrderStatusUpdateSerializer(order, data=request.data, partial=True)
-        
+        serializer = OrderStatusUpdateSerializer(order, data=request.data)
+
         if serializer.is_valid():
             new_status = serializer.validated_data['status']
-            serializer.save()
 
-            # If status has changed, log it in history
-            if old_status != new_status:
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status=new_status,
-                    timestamp=now(),
-                    details=request.data.get('details', '')
-                )
-                self.send_status_update_email(order)
+            # If status has changed, move it through the lifecycle and queue the email
+            if order.status != new_status:
+                with transaction.atomic():
+                    history = order.transition_to(
+                        new_status,
+                        details=serializer.validated_data['details'],
+                        user=request.user,
+                    )
+                    if history is None:
+                        return Response({
+                            "status": False,
+                            "message": "Order status was changed by someone else, please try again."
+                        }, status=status.HTTP_409_CONFLICT)
+                    queue_status_update_email(order, new_status)
 
             return Response({
                 "status": True,
@@ -460,31 +788,89 @@ class OrderStatusUpdateView(APIView):
             "message": serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    def send_status_update_email(self, order):
-        subject = f"Your Order {order.order_number} is {order.status}"
-        message = f"Dear {order.user.email},\n\nYour order {order.order_number} status has been updated to {order.status}.\n\nThank you!"
-        recipient_email = order.email if order.email else order.user.email
-        order_items = OrderItem.objects.filter(order=order)
-        email_template = render_to_string(
-            "email_template.html",
+
+class OrderBulkStatusUpdateView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        """
+        Move many orders to one status in a single transaction.
+
+        Orders are picked by ``order_ids`` or by a ``filter`` and locked for the
+        transaction. Moves allowed by ``Order.STATUS_TRANSITIONS`` are written
+        with one ``bulk_update`` and one ``bulk_create`` of history rows, and
+        the notification emails are queued. Returns a result per order.
+        """
+        serializer = OrderBulkStatusUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            error_message = serializers_error(serializer)
+            return Response(
+                {"status": False, "message": error_message},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        new_status = serializer.validated_data["status"]
+        details = serializer.validated_data["details"]
+        limit = settings.BULK_STATUS_UPDATE_LIMIT
+
+        with transaction.atomic():
+            orders = list(
+                serializer.get_queryset()
+                .select_for_update(of=("self",))
+                .select_related("user")
+                .order_by("id")[:limit + 1]
+            )
+            if len(orders) > limit:
+                return Response(
+                    {"status": False, "message": f"Filter matches more than {limit} orders, please narrow it down."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            results = []
+            changed = []
+            timestamp = now()
+            for order in orders:
+                if order.status == new_status:
+                    results.append({"order_id": order.id, "status": False, "message": f"Order is already {new_status}."})
+                elif not order.can_transition_to(new_status):
+                    results.append({"order_id": order.id, "status": False, "message": f"Order cannot move from {order.status} to {new_status}."})
+                else:
+                    order.status = new_status
+                    order.updated_by = request.user
+                    order.updated_at = timestamp
+                    changed.append(order)
+                    results.append({"order_id": order.id, "status": True, "message": "Order status updated successfully!"})
+
+            found = {order.id for order in orders}
+            for order_id in serializer.validated_data.get("order_ids", []):
+                if order_id not in found:
+                    found.add(order_id)
+                    results.append({"order_id": order_id, "status": False, "message": "Order not found."})
+
+            if changed:
+                Order.objects.bulk_update(changed, ["status", "updated_by", "updated_at"])
+                OrderStatusHistory.objects.bulk_create([
+                    OrderStatusHistory(order=order, status=new_status, timestamp=timestamp, details=details)
+                    for order in changed
+                ])
+                queue_emails([status_update_email(order, new_status) for order in changed])
+                if new_status == Order.CANCELLED:
+                    for order in changed:
+                        release_coupon(order)
+                    release_reservations(StockReservation.objects.filter(order__in=changed), committed=True)
+                if new_status in (Order.CANCELLED, Order.DELIVERED):
+                    for order in changed:
+                        record_sales_event(order.id, new_status)
+
+        return Response(
             {
-                "order": order,
-                "order_items": order_items,
-                "status": order.status,
-                "sub_total": order.final_price if order.final_price else order.total_price,
-                "shipping_changes": 60,
-                "total_price": order.final_price + 60 if order.final_price else order.total_price + 60,
+                "status": True,
+                "message": f"{len(changed)} order(s) updated successfully!",
+                "data": results,
             },
+            status=status.HTTP_200_OK,
         )
 
-        send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,                
-                [recipient_email],
-                html_message=email_template,
-            )
-
 
 class OrderStatusHistoryAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -669,9 +1055,75 @@ class CouponAPIView(APIView):
             return Response({"status": False, "message": "Coupon not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+class CouponBulkCreateView(APIView):
+
+    @superuser_required
+    def post(self, request):
+        """
+        Create a campaign of coupons sharing the same terms.
+
+        Codes are either generated (``count``, optional ``prefix`` and
+        ``length``) or imported from ``codes`` or a CSV ``file``. Imported codes
+        that already exist are skipped. Single use by default.
+        """
+        serializer = CouponBulkCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            error_message = serializers_error(serializer)
+            return Response({"status": False, "message": error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        count, prefix, length = data.pop("count", None), data.pop("prefix"), data.pop("length", None)
+        codes, upload = data.pop("codes", None), data.pop("file", None)
+
+        if count:
+            if len(prefix) + (length or settings.COUPON_CODE_LENGTH) > Coupon._meta.get_field("code").max_length:
+                return Response({"status": False, "message": "Prefix and length make codes too long."}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                codes = generate_codes(count, length=length, prefix=prefix)
+            except ValueError as error:
+                return Response({"status": False, "message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+            skipped = 0
+        else:
+            if upload:
+                reader = csv.reader(io.TextIOWrapper(upload, encoding="utf-8-sig"))
+                try:
+                    codes = [row[0] for row in reader if row and row[0].strip().lower() != "code"]
+                except (UnicodeDecodeError, csv.Error):
+                    return Response({"status": False, "message": "File must be a UTF-8 CSV."}, status=status.HTTP_400_BAD_REQUEST)
+                if len(codes) > settings.COUPON_BULK_LIMIT:
+                    return Response({"status": False, "message": f"File has more than {settings.COUPON_BULK_LIMIT} codes."}, status=status.HTTP_400_BAD_REQUEST)
+                if any(len(code.strip()) > Coupon._meta.get_field("code").max_length for code in codes):
+                    return Response({"status": False, "message": "File has codes longer than 50 characters."}, status=status.HTTP_400_BAD_REQUEST)
+            new_codes = filter_new_codes(codes)
+            skipped = len(codes) - len(new_codes)
+            codes = new_codes
+
+        created = create_coupons(codes, user=request.user, **data)
+        return Response(
+            {
+                "status": True,
+                "data": {"campaign": data["campaign"], "created": created, "skipped": skipped},
+                "message": f"{created} coupon(s) created successfully",
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class CouponExportView(APIView):
+
+    @superuser_required
+    def get(self, request):
+        """Stream the coupons of a ``campaign`` (or all coupons) as CSV."""
+        campaign = request.query_params.get("campaign")
+        response = StreamingHttpResponse(stream_csv(COUPON_COLUMNS, coupon_rows(campaign)), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="coupons_{campaign or "all"}.csv"'
+        return response
+
+
 class CODPayment(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request, order_id):
         # Get order details from your system
         name = request.data.get("name")
@@ -696,48 +1148,50 @@ class CODPayment(APIView):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # If it's a COD order, mark it as not returnable and create Shiprocket order
-        if payment_method == 'COD' and  order.is_cod == False and order.is_paid == False:
-            order.is_paid = True  # For COD orders, mark as paid
-
-            # Save address details
-            order.name = name
-            order.email = email
-            order.phone_number = phone_number
-            order.state = state
-            order.city = city
-            order.address = address
-            order.pincode = pincode
-            order.landmark = request.data.get("landmark")
-
-            # Save changes
-            order.created_by = self.request.user
-            order.updated_by = self.request.user
-            order.save()
-
-            # Create Shiprocket order
-            shiprocket = ShiprocketAPI()
-            shiprocket_response = shiprocket.create_order(order)
-
-            if shiprocket_response:
-                order.shiprocket_order_id = shiprocket_response.get('order_id')
-                order.shiprocket_shipment_id = shiprocket_response.get('shipment_id')
-                order.save()
-
-                # Generate AWB
-                if order.shiprocket_shipment_id:
-                    awb_response = shiprocket.generate_awb(order.shiprocket_shipment_id)
-                    if awb_response:
-                        order.awb_code = awb_response.get('awb_code')
-                        order.save()
+        # If it's a COD order, mark it as paid and create Shiprocket order
+        if payment_method == 'COD':
+            changes = {
+                "is_paid": True,  # For COD orders, mark as paid
+                # Save address details
+                "name": name,
+                "email": email,
+                "phone_number": phone_number,
+                "state": state,
+                "city": city,
+                "address": address,
+                "pincode": pincode,
+                "landmark": request.data.get("landmark"),
+                "created_by": self.request.user,
+                "updated_by": self.request.user,
+                "updated_at": now(),
+            }
 
-            # Create order history entry
-            OrderStatusHistory.objects.create(
-                order=order,
-                status=Order.PLACED,
-                timestamp=now(),
-                details="COD order placed successfully"
-            )
+            with transaction.atomic():
+                # Conditional write, so a repeated or concurrent confirmation is
+                # processed once and cannot overwrite status or coupon changes
+                updated = Order.objects.filter(
+                    pk=order.pk, is_cod=False, is_paid=False, status=Order.PLACED
+                ).update(**changes)
+
+                if updated:
+                    # Create order history entry
+                    OrderStatusHistory.objects.create(
+                        order=order,
+                        status=Order.PLACED,
+                        timestamp=now(),
+                        details="COD order placed successfully"
+                    )
+
+                    # Shiprocket order is created by the outbox dispatcher after commit
+                    enqueue(
+                        "orders.create_shipment",
+                        {"order_id": order.id},
+                        dedupe_key=f"order:{order.id}:shipment",
+                    )
+                    record_sales_event(order.id, PAID)
+                    commit_reservations(order)
+
+            order.refresh_from_db()
 
         return Response(
             {
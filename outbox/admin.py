@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import OutboxEvent
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "topic", "status", "attempts", "available_at", "processed_at")
+    list_filter = ("status", "topic")
+    search_fields = ("dedupe_key",)
+    readonly_fields = ("created_at", "processed_at")
@@ -0,0 +1,151 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from backend import metrics
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(topic, payload, dedupe_key=None):
+    """
+    Record a side effect for ``topic`` in the current transaction.
+
+    Call this inside the ``transaction.atomic()`` block that makes the domain
+    change, so the event is committed or rolled back together with it. Events
+    sharing a ``dedupe_key`` are only recorded once.
+    """
+    if dedupe_key:
+        event, created = OutboxEvent.objects.get_or_create(
+            dedupe_key=dedupe_key, defaults={"topic": topic, "payload": payload}
+        )
+    else:
+        event, created = OutboxEvent.objects.create(topic=topic, payload=payload), True
+
+    if created:
+        transaction.on_commit(_kick_dispatcher)
+    return event
+
+
+def _kick_dispatcher():
+    """Ask a worker to drain the outbox now instead of on the next beat tick."""
+    from .tasks import dispatch_outbox
+
+    try:
+        dispatch_outbox.apply_async(retry=False)
+    except Exception:
+        logger.warning("Could not schedule the outbox dispatcher", exc_info=True)
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(30 * 2 ** (attempts - 1), 3600))
+
+
+def claim_batch(batch_size=None):
+    """
+    Lease up to ``batch_size`` due events to this worker.
+
+    Leased events are pushed ``OUTBOX_LEASE_SECONDS`` into the future, so a
+    worker that dies mid-batch only delays them; they are never lost.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEvent.PENDING, available_at__lte=timezone.now())
+            .order_by("id")[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                attempts=F("attempts") + 1,
+                available_at=timezone.now() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+            )
+    for event in events:
+        event.attempts += 1
+    return events
+
+
+def external(handler):
+    """Mark an outbox handler that calls another service, see ``deliver``."""
+    handler.external = True
+    return handler
+
+
+def deliver(event):
+    """
+    Run the handler for one leased event.
+
+    The handler runs in the same transaction that marks the event done, so
+    handlers that only write to the database take effect exactly once. Handlers
+    marked ``@external`` run outside it, so no lock is held during the remote
+    call, and must save their progress themselves to tolerate repeats. An event
+    settled elsewhere meanwhile, such as by a sales rollup rebuild, is skipped.
+    """
+    handler_path = settings.OUTBOX_HANDLERS.get(event.topic)
+    try:
+        if not handler_path:
+            raise LookupError(f"No outbox handler registered for {event.topic}.")
+        handler = import_string(handler_path)
+        is_external = getattr(handler, "external", False)
+        if is_external:
+            if not OutboxEvent.objects.filter(pk=event.pk, status=OutboxEvent.PENDING).exists():
+                metrics.incr(f"outbox.{event.topic}.skipped")
+                return True
+            handler(event.payload)
+        with transaction.atomic():
+            if not OutboxEvent.objects.select_for_update().filter(pk=event.pk, status=OutboxEvent.PENDING):
+                metrics.incr(f"outbox.{event.topic}.skipped")
+                return True
+            if not is_external:
+                handler(event.payload)
+            OutboxEvent.objects.filter(pk=event.pk).update(
+                status=OutboxEvent.DONE, processed_at=timezone.now(), last_error=None
+            )
+    except Exception:
+        dead = not handler_path or event.attempts >= settings.OUTBOX_MAX_ATTEMPTS
+        OutboxEvent.objects.filter(pk=event.pk, status=OutboxEvent.PENDING).update(
+            status=OutboxEvent.DEAD if dead else OutboxEvent.PENDING,
+            available_at=timezone.now() + _retry_delay(event.attempts),
+            last_error=traceback.format_exc(),
+        )
+        metrics.incr(f"outbox.{event.topic}.{'dead' if dead else 'failed'}")
+        logger.exception("Outbox event %s failed (attempt %s)", event.pk, event.attempts)
+        return False
+
+    metrics.incr(f"outbox.{event.topic}.done")
+    return True
+
+
+def dispatch_pending(batch_size=None):
+    """Claim and deliver one batch of due events. Returns the batch size."""
+    events = claim_batch(batch_size)
+    for event in events:
+        deliver(event)
+    return len(events)
+
+
+def prune_done(batch_size=None):
+    """
+    Delete events delivered more than ``OUTBOX_RETENTION_DAYS`` ago in bounded
+    batches. Returns the number deleted.
+
+    A pruned event's ``dedupe_key`` can be recorded again, so the retention
+    must outlast any window in which the same side effect could be re-enqueued.
+    """
+    batch_size = batch_size or settings.OUTBOX_PRUNE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        ids = list(
+            OutboxEvent.objects.filter(status=OutboxEvent.DONE, processed_at__lt=cutoff).values_list("id", flat=True)[
+                :batch_size
+            ]
+        )
+        if not ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,186 @@
+import logging
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from backend import metrics
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _build(to, subject, body="", text_template=None, html_template=None,
+           context=None, context_builder=None, from_email=None):
+    return QueuedEmail(
+        to=to,
+        domain=to.rsplit("@", 1)[-1].lower(),
+        from_email=from_email,
+        subject=subject,
+        body=body,
+        text_template=text_template,
+        html_template=html_template,
+        context=context or {},
+        context_builder=context_builder,
+    )
+
+
+def queue_email(to, subject, **kwargs):
+    """
+    Queue one email for the mail worker and return the ``QueuedEmail``.
+
+    When called inside a transaction the email is only sent if it commits.
+    Accepts ``body``, ``text_template``, ``html_template``, ``context``,
+    ``context_builder`` and ``from_email``.
+    """
+    email = _build(to, subject, **kwargs)
+    email.save()
+    transaction.on_commit(_kick_mailer)
+    return email
+
+
+def queue_emails(messages):
+    """Queue many emails with a single insert. ``messages`` are ``queue_email`` kwargs."""
+    emails = QueuedEmail.objects.bulk_create([_build(**message) for message in messages])
+    if emails:
+        transaction.on_commit(_kick_mailer)
+    return emails
+
+
+def _kick_mailer():
+    from .tasks import send_queued_emails
+
+    try:
+        send_queued_emails.apply_async(retry=False)
+    except Exception:
+        logger.warning("Could not schedule the mail worker", exc_info=True)
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(60 * 2 ** (attempts - 1), 3600))
+
+
+def _domain_allowance(domain):
+    """Reserve one send for ``domain`` in the current minute, if the limit allows."""
+    limits = settings.EMAIL_DOMAIN_RATE_LIMITS
+    limit = limits.get(domain, limits["default"])
+    key = f"email-rate:{domain}:{int(time.time() // 60)}"
+    cache.add(key, 0, 120)
+    try:
+        return cache.incr(key) <= limit
+    except ValueError:
+        return True
+
+
+def render(email):
+    """Build the ``EmailMultiAlternatives`` for a queued email."""
+    context = dict(email.context)
+    if email.context_builder:
+        context = import_string(email.context_builder)(context)
+
+    text = render_to_string(email.text_template, context) if email.text_template else email.body
+    message = EmailMultiAlternatives(
+        email.subject,
+        text or "",
+        email.from_email or settings.DEFAULT_FROM_EMAIL,
+        [email.to],
+    )
+    if email.html_template:
+        message.attach_alternative(render_to_string(email.html_template, context), "text/html")
+    return message
+
+
+def claim_batch(batch_size=None):
+    """Lease a batch of due emails to this worker, see ``outbox.dispatcher.claim_batch``."""
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    with transaction.atomic():
+        emails = list(
+            QueuedEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=QueuedEmail.PENDING, available_at__lte=timezone.now())
+            .order_by("id")[:batch_size]
+        )
+        if emails:
+            QueuedEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+                available_at=timezone.now() + timedelta(seconds=settings.EMAIL_LEASE_SECONDS)
+            )
+    return emails
+
+
+def _mark_failed(email):
+    email.attempts += 1
+    failed = email.attempts >= settings.EMAIL_MAX_ATTEMPTS
+    QueuedEmail.objects.filter(pk=email.pk).update(
+        status=QueuedEmail.FAILED if failed else QueuedEmail.PENDING,
+        attempts=email.attempts,
+        available_at=timezone.now() + _retry_delay(email.attempts),
+        last_error=traceback.format_exc(),
+    )
+    metrics.incr("email.failed")
+    logger.exception("Sending email %s failed (attempt %s)", email.pk, email.attempts)
+
+
+def send_batch(batch_size=None):
+    """
+    Render and send one batch of queued emails over a single SMTP connection.
+
+    Emails over their recipient domain's per-minute limit are deferred to the
+    next minute without counting as an attempt. Returns the batch size.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0
+
+    sendable = []
+    deferred = []
+    for email in emails:
+        (sendable if _domain_allowance(email.domain) else deferred).append(email)
+
+    if deferred:
+        QueuedEmail.objects.filter(pk__in=[email.pk for email in deferred]).update(
+            available_at=timezone.now() + timedelta(seconds=60)
+        )
+        metrics.incr("email.deferred", len(deferred))
+
+    if sendable:
+        with metrics.timer("email.batch"):
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            try:
+                for email in sendable:
+                    try:
+                        message = render(email)
+                        message.connection = connection
+                        connection.send_messages([message])
+                    except Exception:
+                        _mark_failed(email)
+                        continue
+                    # The context can hold secrets such as password reset links, drop it once sent
+                    QueuedEmail.objects.filter(pk=email.pk).update(
+                        status=QueuedEmail.SENT, sent_at=timezone.now(), last_error=None, context={}
+                    )
+                    metrics.incr("email.sent")
+            finally:
+                connection.close()
+
+    return len(emails)
+
+
+def prune_sent(batch_size=None):
+    """Delete emails sent more than ``EMAIL_RETENTION_DAYS`` ago in bounded batches. Returns the number deleted."""
+    batch_size = batch_size or settings.EMAIL_PRUNE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=settings.EMAIL_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        ids = list(
+            QueuedEmail.objects.filter(status=QueuedEmail.SENT, sent_at__lt=cutoff).values_list("id", flat=True)[
+                :batch_size
+            ]
+        )
+        if not ids:
+            return deleted
+        deleted += QueuedEmail.objects.filter(id__in=ids).delete()[0]
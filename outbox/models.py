@@ -0,0 +1,97 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class OutboxEvent(models.Model):
+    """
+    A side effect recorded in the same transaction as the domain change that
+    caused it. The dispatcher delivers it to the handler registered for its
+    topic in ``settings.OUTBOX_HANDLERS``.
+    """
+
+    PENDING = "PENDING"
+    DONE = "DONE"
+    DEAD = "DEAD"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (DONE, "Done"),
+        (DEAD, "Dead"),
+    ]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    dedupe_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.status})"
+
+    class Meta:
+        db_table = "outbox_event"
+        verbose_name = "Outbox Event"
+        verbose_name_plural = "Outbox Events"
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                condition=Q(status="PENDING"),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+
+class QueuedEmail(models.Model):
+    """
+    An email waiting to be rendered and sent by the mail worker.
+
+    Templates are rendered by the worker. ``context`` must be JSON
+    serializable; ``context_builder`` optionally names a function that turns
+    it into the full template context (e.g. loading the order it refers to).
+    """
+
+    PENDING = "PENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    to = models.EmailField(max_length=255)
+    domain = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True, null=True)
+    text_template = models.CharField(max_length=255, blank=True, null=True)
+    html_template = models.CharField(max_length=255, blank=True, null=True)
+    context = models.JSONField(default=dict, blank=True)
+    context_builder = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.subject} to {self.to} ({self.status})"
+
+    class Meta:
+        db_table = "queued_email"
+        verbose_name = "Queued Email"
+        verbose_name_plural = "Queued Emails"
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                condition=Q(status="PENDING"),
+                name="queued_email_pending_idx",
+            ),
+        ]
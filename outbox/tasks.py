@@ -0,0 +1,40 @@
+from celery import shared_task
+from django.conf import settings
+from .dispatcher import dispatch_pending, prune_done
+from .mail import prune_sent, send_batch
+
+
+@shared_task
+def dispatch_outbox():
+    """Drain due outbox events, a bounded number of batches per run."""
+    delivered = 0
+    for _ in range(settings.OUTBOX_MAX_BATCHES_PER_RUN):
+        count = dispatch_pending()
+        delivered += count
+        if count < settings.OUTBOX_BATCH_SIZE:
+            break
+    return delivered
+
+
+@shared_task
+def send_queued_emails():
+    """Send due queued emails, a bounded number of batches per run."""
+    sent = 0
+    for _ in range(settings.EMAIL_MAX_BATCHES_PER_RUN):
+        count = send_batch()
+        sent += count
+        if count < settings.EMAIL_BATCH_SIZE:
+            break
+    return sent
+
+
+@shared_task
+def prune_outbox_events():
+    """Delete delivered outbox events past their retention."""
+    return prune_done()
+
+
+@shared_task
+def prune_sent_emails():
+    """Delete sent emails past their retention."""
+    return prune_sent()
@@ -0,0 +1,72 @@
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from orders.tests import LOCAL_CACHE
+from .dispatcher import deliver, dispatch_pending, enqueue
+from .mail import queue_email, queue_emails, send_batch
+from .models import OutboxEvent, QueuedEmail
+
+DELIVERED = []
+
+
+def record_delivery(payload):
+    DELIVERED.append(payload)
+
+
+@override_settings(OUTBOX_HANDLERS={"tests.record": "outbox.tests.record_delivery"})
+class OutboxTests(TestCase):
+    def setUp(self):
+        DELIVERED.clear()
+
+    def test_dedupe_key_records_an_event_once(self):
+        first = enqueue("tests.record", {"order_id": 1}, dedupe_key="order:1:tests")
+        second = enqueue("tests.record", {"order_id": 1}, dedupe_key="order:1:tests")
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_dispatch_delivers_once(self):
+        enqueue("tests.record", {"order_id": 1})
+
+        self.assertEqual(dispatch_pending(), 1)
+        self.assertEqual(dispatch_pending(), 0)
+        self.assertEqual(DELIVERED, [{"order_id": 1}])
+        self.assertEqual(OutboxEvent.objects.get().status, OutboxEvent.DONE)
+
+    def test_event_settled_elsewhere_is_skipped(self):
+        event = enqueue("tests.record", {"order_id": 1})
+        # e.g. by a sales rollup rebuild after the event was claimed
+        OutboxEvent.objects.filter(pk=event.pk).update(status=OutboxEvent.DONE)
+
+        self.assertTrue(deliver(event))
+        self.assertEqual(DELIVERED, [])
+
+    def test_event_without_a_handler_is_dead(self):
+        event = enqueue("tests.missing", {})
+        event.attempts = 1
+
+        self.assertFalse(deliver(event))
+        self.assertEqual(OutboxEvent.objects.get().status, OutboxEvent.DEAD)
+
+
+@override_settings(CACHES=LOCAL_CACHE, EMAIL_DOMAIN_RATE_LIMITS={"default": 10, "slow.example.com": 1})
+class MailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_batch_is_sent_and_context_dropped(self):
+        queue_email("first@example.com", "Welcome", body="Hello", context={"reset_link": "secret"})
+        queue_emails([{"to": "second@example.com", "subject": "Welcome", "body": "Hello"}])
+
+        self.assertEqual(send_batch(), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["first@example.com", "second@example.com"])
+        self.assertEqual(QueuedEmail.objects.filter(status=QueuedEmail.SENT, context={}).count(), 2)
+        self.assertEqual(send_batch(), 0)
+
+    def test_domain_over_its_limit_is_deferred(self):
+        queue_emails([{"to": f"user{number}@slow.example.com", "subject": "Hi", "body": "Hi"} for number in range(2)])
+
+        send_batch()
+        self.assertEqual(len(mail.outbox), 1)
+        deferred = QueuedEmail.objects.get(status=QueuedEmail.PENDING)
+        self.assertEqual(deferred.attempts, 0)
@@ -0,0 +1,286 @@
+import json
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Max, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+from backend import metrics
+from orders.coupons import find_best_coupon
+from .models import CartItems, Product, ShoppingCart
+
+logger = logging.getLogger(__name__)
+
+GUEST_CART_SALT = "products.cart.guest"
+
+ADD = "add"
+SET = "set"
+REMOVE = "remove"
+
+
+class CartError(Exception):
+    """A cart change that cannot be applied, the message says why."""
+
+
+def summary_cache_key(user_id):
+    return f"cart:summary:{user_id}"
+
+
+def cart_changed(user_id):
+    """Drop the user's cached cart summary once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(summary_cache_key(user_id)))
+
+
+def get_cart(user):
+    """The user's cart, created on first use."""
+    cart = ShoppingCart.objects.filter(user=user).first()
+    if cart:
+        return cart
+    try:
+        with transaction.atomic():
+            return ShoppingCart.objects.create(user=user)
+    except IntegrityError:
+        # Created by a concurrent request
+        return ShoppingCart.objects.get(user=user)
+
+
+def add_item(cart, product_id, quantity):
+    """Add ``quantity`` of a product in place, so concurrent adds never lose an update. Returns the row."""
+    cart_changed(cart.user_id)
+    line = CartItems.objects.filter(cart=cart, product_id=product_id)
+    if not line.update(quantity=F("quantity") + quantity, updated_at=now()):
+        try:
+            with transaction.atomic():
+                return CartItems.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+        except IntegrityError:
+            # The line was created by a concurrent add, the unique constraint kept it single
+            line.update(quantity=F("quantity") + quantity, updated_at=now())
+    return line.get()
+
+
+def set_item(cart, product_id, quantity):
+    """Set the quantity of a product, removing it at zero. Returns the row or ``None``."""
+    if quantity <= 0:
+        remove_item(cart, product_id)
+        return None
+    cart_changed(cart.user_id)
+    line = CartItems.objects.filter(cart=cart, product_id=product_id)
+    if not line.update(quantity=quantity, updated_at=now()):
+        try:
+            with transaction.atomic():
+                return CartItems.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+        except IntegrityError:
+            line.update(quantity=quantity, updated_at=now())
+    return line.get()
+
+
+def change_item(cart, item_id, delta):
+    """Move a cart line's quantity by ``delta`` in place. Returns the row, or ``None`` once it drops to zero."""
+    cart_changed(cart.user_id)
+    line = CartItems.objects.filter(cart=cart, id=item_id)
+    with transaction.atomic():
+        if not line.update(quantity=F("quantity") + delta, updated_at=now()):
+            raise CartItems.DoesNotExist
+        if line.filter(quantity__lte=0).delete()[0]:
+            return None
+        return line.get()
+
+
+def remove_item(cart, product_id):
+    cart_changed(cart.user_id)
+    return CartItems.objects.filter(cart=cart, product_id=product_id).delete()[0] > 0
+
+
+def _available(product_ids):
+    return set(Product.objects.filter(id__in=product_ids, status=Product.IN_STOCK).values_list("id", flat=True))
+
+
+def _check_available(operations):
+    wanted = {operation["product_id"] for operation in operations if operation["op"] in (ADD, SET)}
+    missing = wanted - _available(wanted)
+    if missing:
+        raise CartError(f"Product {min(missing)} is out of stock.")
+
+
+def apply_operations(cart, operations):
+    """
+    Apply a list of ``{"op", "product_id", "quantity"}`` changes in order, in one
+    transaction. Raises ``CartError``, applying none, if a product is not in stock.
+    """
+    _check_available(operations)
+    with transaction.atomic():
+        for operation in operations:
+            if operation["op"] == ADD:
+                add_item(cart, operation["product_id"], operation["quantity"])
+            elif operation["op"] == SET:
+                set_item(cart, operation["product_id"], operation["quantity"])
+            else:
+                remove_item(cart, operation["product_id"])
+
+
+def _totals(items):
+    return items.aggregate(
+        lines=Count("id"),
+        items=Coalesce(Sum("quantity"), 0),
+        subtotal=Coalesce(Sum(F("quantity") * F("product__price"), output_field=FloatField()), 0.0),
+    )
+
+
+def cart_totals(cart):
+    """Line count, item count and subtotal of the cart in one aggregate query."""
+    return _totals(CartItems.objects.filter(cart=cart))
+
+
+def cart_summary(user):
+    """
+    What the cart comes to: the totals, shipping, and the best coupon the user
+    could apply. The totals are cached per user for ``CART_SUMMARY_TTL`` seconds
+    and dropped on cart writes; the coupon is picked on every call, as coupons
+    change independently of the cart.
+    """
+    key = summary_cache_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = _totals(CartItems.objects.filter(cart__user=user))
+        summary["subtotal"] = round(summary["subtotal"], 2)
+        summary["shipping"] = settings.SHIPPING_CHARGE if summary["items"] else 0
+        cache.set(key, summary, settings.CART_SUMMARY_TTL)
+
+    coupon, discount = find_best_coupon(summary["subtotal"], user) if summary["items"] else (None, 0)
+    return {
+        **summary,
+        "coupon": coupon.code if coupon else None,
+        "discount": discount,
+        "total": round(summary["subtotal"] - discount + summary["shipping"], 2),
+    }
+
+
+def prune_abandoned_carts(batch_size=None):
+    """
+    Delete carts whose cart and items are untouched for ``CART_ABANDON_DAYS``, in
+    batches of ``batch_size``. Returns the number of carts deleted.
+    """
+    batch_size = batch_size or settings.CART_PRUNE_BATCH_SIZE
+    cutoff = now() - timedelta(days=settings.CART_ABANDON_DAYS)
+    abandoned = (
+        ShoppingCart.objects.filter(updated_at__lt=cutoff)
+        .annotate(last_activity=Max("cart_items__updated_at"))
+        .filter(Q(last_activity__isnull=True) | Q(last_activity__lt=cutoff))
+    )
+    carts = items = 0
+    last_id = 0
+    while True:
+        ids = list(abandoned.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        # Skip carts that got a new item since they were selected
+        ids = list(abandoned.filter(id__in=ids).values_list("id", flat=True))
+        with transaction.atomic():
+            items += CartItems.objects.filter(cart_id__in=ids).delete()[0]
+            carts += ShoppingCart.objects.filter(id__in=ids).delete()[0]
+
+    metrics.incr("carts.pruned", carts)
+    metrics.incr("carts.pruned.items", items)
+    logger.info("Pruned %s abandoned cart(s) with %s item(s)", carts, items)
+    return carts
+
+
+def read_guest_cart(request):
+    """The guest cart from the signed cookie as ``{product_id: quantity}``, empty if missing or tampered with."""
+    raw = request.get_signed_cookie(
+        settings.GUEST_CART_COOKIE, default=None, salt=GUEST_CART_SALT, max_age=settings.GUEST_CART_COOKIE_AGE
+    )
+    try:
+        lines = {int(product_id): int(quantity) for product_id, quantity in json.loads(raw or "{}").items()}
+    except (TypeError, ValueError, AttributeError):
+        return {}
+    return {product_id: quantity for product_id, quantity in lines.items() if quantity > 0}
+
+
+def write_guest_cart(response, lines):
+    """Store ``lines`` in the guest cart cookie, or clear it when empty."""
+    if not lines:
+        response.delete_cookie(settings.GUEST_CART_COOKIE, samesite=settings.GUEST_CART_COOKIE_SAMESITE)
+        return
+    response.set_signed_cookie(
+        settings.GUEST_CART_COOKIE,
+        json.dumps(lines, separators=(",", ":")),
+        salt=GUEST_CART_SALT,
+        max_age=settings.GUEST_CART_COOKIE_AGE,
+        secure=settings.GUEST_CART_COOKIE_SECURE,
+        httponly=True,
+        samesite=settings.GUEST_CART_COOKIE_SAMESITE,
+    )
+
+
+def apply_guest_operations(lines, operations):
+    """Apply cart operations to guest cart ``lines`` and return the new lines, or raise ``CartError``."""
+    _check_available(operations)
+    lines = dict(lines)
+    for operation in operations:
+        product_id, quantity = operation["product_id"], operation["quantity"]
+        if operation["op"] == ADD:
+            lines[product_id] = lines.get(product_id, 0) + quantity
+        elif operation["op"] == SET and quantity > 0:
+            lines[product_id] = quantity
+        else:
+            lines.pop(product_id, None)
+    if len(lines) > settings.GUEST_CART_MAX_LINES:
+        raise CartError(f"A guest cart can hold at most {settings.GUEST_CART_MAX_LINES} products, please log in.")
+    return lines
+
+
+def guest_cart_contents(lines):
+    """The guest cart lines with their products' price and totals, in one query."""
+    prices = dict(Product.objects.filter(id__in=lines).values_list("id", "price"))
+    items = [
+        {"product_id": product_id, "quantity": quantity, "price": prices[product_id]}
+        for product_id, quantity in lines.items()
+        if product_id in prices
+    ]
+    totals = {
+        "lines": len(items),
+        "items": sum(item["quantity"] for item in items),
+        "subtotal": round(sum(item["quantity"] * item["price"] for item in items), 2),
+    }
+    return {"items": items, "totals": totals}
+
+
+def merge_lines(user, lines):
+    """
+    Add ``{product_id: quantity}`` lines, such as a guest cart, to the user's cart
+    with one bulk upsert. Returns the cart and the ids of products no longer on sale.
+    """
+    available = _available(lines)
+    skipped = sorted(set(lines) - available)
+    lines = {product_id: quantity for product_id, quantity in lines.items() if product_id in available}
+    cart = get_cart(user)
+    if not lines:
+        return cart, skipped
+
+    with transaction.atomic():
+        existing = dict(
+            CartItems.objects.select_for_update()
+            .filter(cart=cart, product_id__in=lines)
+            .values_list("product_id", "quantity")
+        )
+        CartItems.objects.bulk_create(
+            [
+                CartItems(
+                    cart=cart,
+                    product_id=product_id,
+                    quantity=existing.get(product_id, 0) + quantity,
+                    created_by=user,
+                    updated_by=user,
+                )
+                for product_id, quantity in lines.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["cart", "product"],
+            update_fields=["quantity", "updated_by", "updated_at"],
+        )
+        cart_changed(user.pk)
+    return cart, skipped
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+from .models import CartItems, Product
+from .serializers import ProductSerializer
+from .wishlist import wishlist_ids
+
+
+def _cache_key(product_type):
+    version = cache.get(Product.CATALOG_VERSION_KEY) or "0"
+    return f"catalog:{version}:{product_type or 'all'}"
+
+
+def catalog_data(product_type=None):
+    """
+    The in-stock products as every visitor sees them, cached for ``CATALOG_CACHE_TTL``
+    seconds under the catalog version. Personal state comes from ``catalog_overlay``.
+    """
+    key = _cache_key(product_type)
+    data = cache.get(key)
+    if data is None:
+        products = Product.objects.filter(status=Product.IN_STOCK).select_related("product_type").order_by("id")
+        if product_type:
+            products = products.filter(product_type_id=product_type)
+        # No request in the context, so media URLs stay relative to any host
+        data = ProductSerializer(products, many=True, context={"catalog": True}).data
+        cache.set(key, data, settings.CATALOG_CACHE_TTL)
+    return data
+
+
+def catalog_overlay(user):
+    """The user's wishlisted product ids and cart quantities, to lay over the shared catalog."""
+    return {
+        "wishlist": wishlist_ids(user),
+        "cart": list(CartItems.objects.filter(cart__user=user).order_by("id").values("product_id", "quantity")),
+    }
@@ -1,4 +1,6 @@
-from django.db import models
+import uuid
+from django.core.cache import cache
+from django.db import models, transaction
 from backend.models import BaseModel
 from backend.utils import get_product_image_upload_path, get_product_upload_path, validate_file_size
 from users.models import User
@@ -50,6 +52,33 @@ class Product(BaseModel):
     description = models.TextField(null=True, blank=True)
     is_url = models.BooleanField(null=False, blank=False)
     is_image = models.BooleanField(null=False, blank=False)
+    # Where the customer photo sits on ``image`` in order previews, as fractions
+    # of the image size: {"x", "y", "width", "height"}, optionally "rotation"
+    # in degrees, "fit" ("cover" or "contain") and "layer" ("over" or "under")
+    preview_placement = models.JSONField(null=True, blank=True)
+    # Units on hand, less those held by unpaid orders. Empty for products
+    # made to order, whose stock is not tracked; see orders/stock.py
+    stock_quantity = models.PositiveIntegerField(null=True, blank=True)
+
+    CATALOG_VERSION_KEY = "catalog:version"
+
+    @staticmethod
+    def clear_catalog_cache():
+        cache.set(Product.CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+    def save(self, *args, **kwargs):
+        # Tracked stock decides the status, both when it runs out and on restock
+        if self.stock_quantity == 0:
+            self.status = self.OUT_OF_STOCK
+        elif self.stock_quantity and self.status == self.OUT_OF_STOCK:
+            self.status = self.IN_STOCK
+        super().save(*args, **kwargs)
+        transaction.on_commit(Product.clear_catalog_cache)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(Product.clear_catalog_cache)
+        return result
 
     def __str__(self):
         return self.code
@@ -87,6 +116,11 @@ class Wishlist(BaseModel):
     def __str__(self):
         return f"Wish list for {self.user.email} - {self.product.code}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="wishlist_user_product"),
+        ]
+
 
 class ShoppingCart(BaseModel):
     user = models.OneToOneField(
@@ -115,6 +149,9 @@ class CartItems(BaseModel):
 
     class Meta:
         db_table = "cart"
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "product"], name="cart_item_cart_product"),
+        ]
 
 
 class Banner(BaseModel):
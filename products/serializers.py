@@ -12,7 +12,9 @@ from backend.utils import validate_file_size1
 from django.core.exceptions import ValidationError
 import os
 from django.utils.module_loading import import_string
-from django.db.models import Avg
+from django.db.models import Avg, F
+from .cart import ADD, SET, REMOVE
+from .wishlist import favourite_ids
 
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
@@ -55,6 +57,32 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = '__all__'
 
+    def validate_preview_placement(self, value):
+        if value is None:
+            return value
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Preview placement must be an object.")
+        for key in ("x", "y", "width", "height"):
+            if not isinstance(value.get(key), (int, float)) or not 0 <= value[key] <= 1:
+                raise serializers.ValidationError(f"Preview placement {key} must be a fraction between 0 and 1.")
+        if value["width"] == 0 or value["height"] == 0:
+            raise serializers.ValidationError("Preview placement width and height must be greater than 0.")
+        if not isinstance(value.get("rotation", 0), (int, float)):
+            raise serializers.ValidationError("Preview placement rotation must be a number.")
+        if value.get("fit", "cover") not in ("cover", "contain"):
+            raise serializers.ValidationError("Preview placement fit must be cover or contain.")
+        if value.get("layer", "over") not in ("over", "under"):
+            raise serializers.ValidationError("Preview placement layer must be over or under.")
+        return value
+
+    def update(self, instance, validated_data):
+        if "stock_quantity" not in validated_data:
+            # Checkouts move the stock concurrently, leave the stored value alone
+            instance.stock_quantity = F("stock_quantity")
+        instance = super().update(instance, validated_data)
+        instance.refresh_from_db(fields=["stock_quantity", "status"])
+        return instance
+
     def get_image(self, obj):
         if obj.image:
             request = self.context.get("request")
@@ -92,20 +120,10 @@ class ProductSerializer(serializers.ModelSerializer):
         # Get the default serialized data
         data = super().to_representation(instance)
 
-        # Retrieve current user from context
-        request = self.context.get("request")
-        user = request.user if request else None
-
-        # Check if the variant is in the user's wishlist
-        if user and user.is_authenticated:
-            is_favorit = Wishlist.objects.filter(
-                user=user, product=instance
-            ).exists()
-        else:
-            is_favorit = False
-
-        # Add the is_favorit flag to the response
-        data["is_favorit"] = is_favorit
+        # Check the product against the user's wishlist ids, loaded once per request.
+        # The shared catalog leaves it out, clients overlay it from /catalog/me/
+        if not self.context.get("catalog"):
+            data["is_favorit"] = instance.id in favourite_ids(self.context)
         data["name"] = instance.name
         return data
 
@@ -137,20 +155,8 @@ class WishlistProductVariantSerializer(serializers.ModelSerializer):
         # Get the default serialized data
         data = super().to_representation(instance)
 
-        # Retrieve current user from context
-        request = self.context.get("request")
-        user = request.user if request else None
-
-        # Check if the variant is in the user's wishlist
-        if user and user.is_authenticated:
-            is_favorit = Wishlist.objects.filter(
-                user=user, product=instance
-            ).exists()
-        else:
-            is_favorit = False
-
-        # Add the is_favorit flag to the response
-        data["is_favorit"] = is_favorit
+        # Check the product against the user's wishlist ids, loaded once per request
+        data["is_favorit"] = instance.id in favourite_ids(self.context)
         data["name"] = instance.product.name
         return data
 
@@ -171,6 +177,61 @@ class CartSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class CartBatchSerializer(serializers.Serializer):
+    """A list of cart changes: ``{"op": "add" | "set" | "remove", "product_id", "quantity"}``."""
+
+    operations = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.CART_BATCH_MAX_OPERATIONS,
+    )
+
+    def validate_operations(self, value):
+        operations = []
+        for number, operation in enumerate(value, start=1):
+            op = operation.get("op")
+            if op not in (ADD, SET, REMOVE):
+                raise serializers.ValidationError(f"{number}: op must be add, set or remove.")
+            try:
+                product_id = int(operation.get("product_id"))
+                quantity = int(operation.get("quantity", 1 if op == ADD else 0))
+            except (TypeError, ValueError):
+                raise serializers.ValidationError(f"{number}: product_id and quantity must be numbers.")
+            if op == ADD and quantity < 1:
+                raise serializers.ValidationError(f"{number}: quantity must be at least 1.")
+            if op == SET and quantity < 0:
+                raise serializers.ValidationError(f"{number}: quantity cannot be negative.")
+            operations.append({"op": op, "product_id": product_id, "quantity": quantity})
+        return operations
+
+
+class WishlistBulkSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.WISHLIST_BULK_LIMIT,
+    )
+
+
+class WishlistMoveSerializer(WishlistBulkSerializer):
+    """No ``product_ids`` moves the whole wishlist."""
+
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        max_length=settings.WISHLIST_BULK_LIMIT,
+    )
+
+
+class CartMergeItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CartMergeSerializer(serializers.Serializer):
+    items = CartMergeItemSerializer(many=True, required=False, max_length=settings.GUEST_CART_MAX_LINES)
+
+
 class BannerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Banner
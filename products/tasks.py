@@ -0,0 +1,8 @@
+from celery import shared_task
+from .cart import prune_abandoned_carts
+
+
+@shared_task
+def prune_carts():
+    """Delete carts nobody has touched for a long time."""
+    return prune_abandoned_carts()
@@ -1,3 +1,176 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from orders.models import Coupon
+from orders.tests import LOCAL_CACHE, create_product, create_user
+from .cart import add_item, cart_summary, get_cart
+from .models import CartItems, Product, Wishlist
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.product = create_product(price=200.0)
+
+    def test_new_coupon_shows_up_in_a_cached_summary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            add_item(get_cart(self.user), self.product.pk, 2)
+        self.assertIsNone(cart_summary(self.user)["coupon"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Coupon.objects.create(
+                code="SAVE50",
+                discount_type=Coupon.FIXED,
+                discount_value=50,
+                valid_from=date.today(),
+                valid_to=date.today() + timedelta(days=1),
+            )
+        summary = cart_summary(self.user)
+        self.assertEqual(summary["coupon"], "SAVE50")
+        self.assertEqual(summary["total"], 400 - 50 + summary["shipping"])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class WishlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.mug, self.cup = create_product("MUG-1"), create_product("CUP-1")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_add_and_remove(self):
+        sold_out = create_product("BOX-1", stock_quantity=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/product/wishlist/bulk/", {"product_ids": [self.mug.pk, self.cup.pk, sold_out.pk]}, format="json"
+            )
+        self.assertEqual(response.data["data"]["added"], sorted([self.mug.pk, self.cup.pk]))
+        self.assertEqual(self.client.get("/product/wishlist/ids/").data["data"], sorted([self.mug.pk, self.cup.pk]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete("/product/wishlist/bulk/", {"product_ids": [self.mug.pk]}, format="json")
+        self.assertEqual(self.client.get("/product/wishlist/ids/").data["data"], [self.cup.pk])
+
+        response = self.client.post("/product/wishlist/bulk/", {"product_ids": []}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_move_to_cart(self):
+        self.client.post("/product/wishlist/bulk/", {"product_ids": [self.mug.pk, self.cup.pk]}, format="json")
+        Product.objects.filter(pk=self.cup.pk).update(status=Product.OUT_OF_STOCK)
+
+        response = self.client.post("/product/wishlist/move-to-cart/", {}, format="json")
+        self.assertEqual(response.data["data"], {"moved": [self.mug.pk], "skipped": [self.cup.pk]})
+        self.assertEqual(list(CartItems.objects.values_list("product_id", "quantity")), [(self.mug.pk, 1)])
+        self.assertEqual(list(Wishlist.objects.values_list("product_id", flat=True)), [self.cup.pk])
+
+        response = self.client.post("/product/wishlist/move-to-cart/", {"product_ids": ["mug"]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.mug, self.cup = create_product("MUG-1", price=100.0), create_product("CUP-1", price=50.0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *operations):
+        return self.client.post("/product/cart/batch/", {"operations": list(operations)}, format="json")
+
+    def test_operations_apply_in_order(self):
+        response = self.batch(
+            {"op": "add", "product_id": self.mug.pk, "quantity": 2},
+            {"op": "add", "product_id": self.mug.pk, "quantity": 1},
+            {"op": "set", "product_id": self.cup.pk, "quantity": 4},
+            {"op": "remove", "product_id": self.cup.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        items = response.data["data"]["items"]
+        self.assertEqual([(item["product_id"], item["quantity"]) for item in items], [(self.mug.pk, 3)])
+        self.assertEqual(response.data["data"]["totals"], {"lines": 1, "items": 3, "subtotal": 300.0})
+
+    def test_all_or_nothing(self):
+        sold_out = create_product("BOX-1", stock_quantity=0)
+        response = self.batch(
+            {"op": "add", "product_id": self.mug.pk, "quantity": 1},
+            {"op": "add", "product_id": sold_out.pk, "quantity": 1},
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(CartItems.objects.exists())
+
+    def test_adding_to_an_existing_line(self):
+        cart = get_cart(self.user)
+        add_item(cart, self.mug.pk, 1)
+        add_item(cart, self.mug.pk, 2)
+
+        self.assertEqual(list(CartItems.objects.values_list("product_id", "quantity")), [(self.mug.pk, 3)])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.mug, self.cup = create_product("MUG-1", price=100.0), create_product("CUP-1", price=50.0)
+        self.client = APIClient()
+
+    def test_guest_cart_merges_into_the_user_cart(self):
+        self.client.post(
+            "/product/cart/guest/",
+            {"operations": [{"op": "add", "product_id": self.mug.pk, "quantity": 2}]},
+            format="json",
+        )
+        self.assertEqual(self.client.get("/product/cart/guest/").data["data"]["totals"]["items"], 2)
+
+        user = create_user()
+        add_item(get_cart(user), self.mug.pk, 1)
+        Product.objects.filter(pk=self.cup.pk).update(status=Product.OUT_OF_STOCK)
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            "/product/cart/merge/", {"items": [{"product_id": self.cup.pk, "quantity": 1}]}, format="json"
+        )
+
+        self.assertEqual(response.data["data"]["skipped"], [self.cup.pk])
+        self.assertEqual(list(CartItems.objects.values_list("product_id", "quantity")), [(self.mug.pk, 3)])
+        # The cookie is cleared, so merging again adds nothing
+        self.client.post("/product/cart/merge/", {}, format="json")
+        self.assertEqual(CartItems.objects.get().quantity, 3)
+
+    def test_tampered_cookie_reads_as_empty(self):
+        self.client.cookies["guest_cart"] = '{"1":5}'
+        self.assertEqual(self.client.get("/product/cart/guest/").data["data"]["items"], [])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.mug = create_product("MUG-1")
+
+    def codes(self, response):
+        return [product["code"] for product in response.data["data"]]
+
+    def test_product_write_bumps_the_catalog_version(self):
+        self.assertEqual(self.codes(self.client.get("/product/catalog/")), ["MUG-1"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product("CUP-1")
+        self.assertEqual(self.codes(self.client.get("/product/catalog/")), ["MUG-1", "CUP-1"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mug.delete()
+        self.assertEqual(self.codes(self.client.get("/product/catalog/")), ["CUP-1"])
+
+    def test_same_response_for_every_visitor(self):
+        anonymous = self.client.get("/product/catalog/")
+        client = APIClient()
+        client.force_authenticate(create_user())
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post("/product/wishlist/bulk/", {"product_ids": [self.mug.pk]}, format="json")
+
+        self.assertEqual(client.get("/product/catalog/").data, anonymous.data)
+        self.assertIn("public", anonymous["Cache-Control"])
+        self.assertEqual(client.get("/product/catalog/me/").data["data"]["wishlist"], [self.mug.pk])
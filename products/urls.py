@@ -2,8 +2,17 @@ from django.urls import path
 from .views import (
     ProductTypeAPIView,
     ProductAPIView,
+    CatalogView,
+    CatalogOverlayView,
     WishlistView,
+    WishlistBulkView,
+    WishlistIdsView,
+    WishlistMoveToCartView,
     CartAPIView,
+    CartBatchView,
+    CartSummaryView,
+    GuestCartView,
+    CartMergeView,
     BannerAPIView,
     ProductImageUploadView,
     ProductImageDeleteView
@@ -23,11 +32,21 @@ urlpatterns = [
     # Product API
     path("", ProductAPIView.as_view(), name="product_list"),
     path("<int:pk>/", ProductAPIView.as_view(), name="product_detail"),
+    # Shared product catalog and the per-user overlay for it
+    path("catalog/", CatalogView.as_view(), name="catalog"),
+    path("catalog/me/", CatalogOverlayView.as_view(), name="catalog-overlay"),
     # Product Wish List
     path("wishlist/", WishlistView.as_view(), name="wishlist"),
+    path("wishlist/bulk/", WishlistBulkView.as_view(), name="wishlist-bulk"),
+    path("wishlist/ids/", WishlistIdsView.as_view(), name="wishlist-ids"),
+    path("wishlist/move-to-cart/", WishlistMoveToCartView.as_view(), name="wishlist-move-to-cart"),
     # User Cart API
     path("cart/", CartAPIView.as_view(), name="cart-list"),
     path("cart/<int:cart_item_id>/", CartAPIView.as_view(), name="cart_item_detail"),
+    path("cart/batch/", CartBatchView.as_view(), name="cart-batch"),
+    path("cart/summary/", CartSummaryView.as_view(), name="cart-summary"),
+    path("cart/guest/", GuestCartView.as_view(), name="cart-guest"),
+    path("cart/merge/", CartMergeView.as_view(), name="cart-merge"),
     # Get Banner API.
     path("banners/", BannerAPIView.as_view(), name="banner-list-create"),
     path(
@@ -17,10 +17,33 @@ from .serializers import (
     CartSerializer,
     BannerSerializer,
     ProductImageSerializer,
+    CartBatchSerializer,
+    CartMergeSerializer,
+    WishlistBulkSerializer,
+    WishlistMoveSerializer,
 )
+from .cart import (
+    CartError,
+    get_cart,
+    add_item,
+    change_item,
+    apply_operations,
+    cart_totals,
+    cart_summary,
+    cart_changed,
+    read_guest_cart,
+    write_guest_cart,
+    apply_guest_operations,
+    guest_cart_contents,
+    merge_lines,
+)
+from .catalog import catalog_data, catalog_overlay
+from .wishlist import wishlist_changed, wishlist_ids, add_to_wishlist, remove_from_wishlist, move_to_cart
 from backend.utils import superuser_required, serializers_error
 from django.shortcuts import get_object_or_404
 from django.db.models import ProtectedError
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
 
 
 # ProductType CRUD API View
@@ -348,6 +371,55 @@ class ProductAPIView(APIView):
             )
 
 
+class CatalogView(APIView):
+    """
+    The product catalog without per-user fields, identical for every
+    visitor so browsers, proxies and CDNs can share it.
+    """
+
+    # Not authenticated, so the response can never depend on who asks
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        product_type = request.query_params.get("product_type")
+        if product_type and not product_type.isdigit():
+            return Response(
+                {"status": False, "message": "Invalid product type."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        response = Response(
+            {
+                "status": True,
+                "data": catalog_data(product_type),
+                "message": "Product arrived successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+        patch_cache_control(response, public=True, max_age=settings.CATALOG_MAX_AGE)
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+
+class CatalogOverlayView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """The user's wishlist and cart state for the products in the catalog."""
+        response = Response(
+            {
+                "status": True,
+                "data": catalog_overlay(request.user),
+                "message": "Catalog overlay arrived successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+
 class WishlistView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -365,6 +437,7 @@ class WishlistView(APIView):
             )
 
             if created:
+                wishlist_changed(self.request.user.pk)
                 return Response(
                     {"status": True, "message": "Product added to wishlist."},
                     status=status.HTTP_201_CREATED,
@@ -405,6 +478,7 @@ class WishlistView(APIView):
         wishlist_item = Wishlist.objects.filter(product_id=product.id, user=self.request.user).first()
         if wishlist_item:
             wishlist_item.delete()
+            wishlist_changed(self.request.user.pk)
             return Response(
                 {"status": True, "message": "Product removed from wishlist."},
                 status=status.HTTP_200_OK,
@@ -419,6 +493,7 @@ class WishlistView(APIView):
         wishlist_item = Wishlist.objects.filter(id=wishlist_id, user=self.request.user).first()
         if wishlist_item:
             wishlist_item.delete()
+            wishlist_changed(self.request.user.pk)
             return Response(
                 {"status": True, "message": "Product removed from wishlist."},
                 status=status.HTTP_200_OK,
@@ -430,15 +505,84 @@ class WishlistView(APIView):
         )
 
 
+class WishlistBulkView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def _product_ids(self, request):
+        serializer = WishlistBulkSerializer(data=request.data)
+        if not serializer.is_valid():
+            return None, Response(
+                {"status": False, "message": serializers_error(serializer)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return serializer.validated_data["product_ids"], None
+
+    def post(self, request):
+        """Add several products to the wishlist."""
+        product_ids, error = self._product_ids(request)
+        if error:
+            return error
+        added = add_to_wishlist(request.user, product_ids)
+        return Response(
+            {"status": True, "data": {"added": added}, "message": f"{len(added)} product(s) added to wishlist."},
+            status=status.HTTP_200_OK,
+        )
+
+    def delete(self, request):
+        """Remove several products from the wishlist."""
+        product_ids, error = self._product_ids(request)
+        if error:
+            return error
+        removed = remove_from_wishlist(request.user, product_ids)
+        return Response(
+            {"status": True, "message": f"{removed} product(s) removed from wishlist."},
+            status=status.HTTP_200_OK,
+        )
+
+
+class WishlistIdsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """The wishlisted product ids, for marking favourites on cached product lists."""
+        return Response(
+            {"status": True, "data": wishlist_ids(request.user), "message": "Wishlist arrived successfully."},
+            status=status.HTTP_200_OK,
+        )
+
+
+class WishlistMoveToCartView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """Move the given wishlist products, or the whole wishlist, to the cart."""
+        serializer = WishlistMoveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"status": False, "message": serializers_error(serializer)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        moved, skipped = move_to_cart(request.user, serializer.validated_data.get("product_ids"))
+        return Response(
+            {
+                "status": True,
+                "data": {"moved": moved, "skipped": skipped},
+                "message": f"{len(moved)} product(s) moved to cart.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class CartAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         """Get the cart items for the logged-in user."""
-        user_cart = ShoppingCart.objects.filter(user=self.request.user).first()
-        if not user_cart:
-            user_cart = ShoppingCart.objects.create(user=self.request.user)
-        cart_items = CartItems.objects.filter(cart_id=user_cart.id)
+        # Reading never creates a cart, the first add does
+        cart_items = CartItems.objects.filter(cart__user=self.request.user).select_related(
+            "product__product_type"
+        ).order_by("id")
         serializer = CartSerializer(cart_items, many=True)
         return Response(
             {
@@ -469,21 +613,10 @@ class CartAPIView(APIView):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        shoping_cart = ShoppingCart.objects.filter(user=self.request.user).first()
-        if not shoping_cart:
-            shoping_cart = ShoppingCart.objects.create(user=self.request.user)
-
-        # Check if the product is already in the cart
-        cart_item, created = CartItems.objects.get_or_create(
-            cart=shoping_cart,
-            product=productData,
-            defaults={"quantity": int(quantity)},
-        )
+        shoping_cart = get_cart(self.request.user)
 
-        if not created:
-            # Update the quantity if the product already exists in the cart
-            cart_item.quantity += int(quantity)
-            cart_item.save()
+        # Adds to the line in place if the product is already in the cart
+        cart_item = add_item(shoping_cart, productData.id, int(quantity))
 
         serializer = CartSerializer(cart_item)
         return Response(
@@ -498,52 +631,39 @@ class CartAPIView(APIView):
     def put(self, request, cart_item_id):
         """Increment or decrement the quantity of a product in the cart."""
         user_cart = get_object_or_404(ShoppingCart, user=self.request.user)
-        cart_item = get_object_or_404(CartItems, id=cart_item_id, cart_id=user_cart.id)
         action = request.data.get("action", None)
-
-        if action == "increment":
-            # Increase the quantity by 1
-            cart_item.quantity += 1
-            cart_item.save()
-            serializer = CartSerializer(cart_item)
+        if action not in ("increment", "decrement"):
             return Response(
-                {
-                    "status": True,
-                    "data": serializer.data,
-                    "message": "Product updated successfully.",
-                },
-                status=status.HTTP_200_OK,
+                {"message": "Invalid action"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        elif action == "decrement":
-            # Decrease the quantity by 1
-            cart_item.quantity -= 1
-
-            # If quantity is now 0, delete the item from the cart
-            if cart_item.quantity <= 0:
-                cart_item.delete()
-                return Response(
-                    {"status": True, "message": "Item removed from cart."},
-                    status=status.HTTP_200_OK,
-                )
-
-            cart_item.save()
-            serializer = CartSerializer(cart_item)
+        # Changed in place, so rapid taps never overwrite each other
+        try:
+            cart_item = change_item(user_cart, cart_item_id, 1 if action == "increment" else -1)
+        except CartItems.DoesNotExist:
             return Response(
-                {
-                    "status": True,
-                    "data": serializer.data,
-                    "message": "Product updated successfully.",
-                },
-                status=status.HTTP_200_OK,
+                {"status": False, "message": "Cart item not found."},
+                status=status.HTTP_404_NOT_FOUND,
             )
 
-        else:
+        # A decrement removes the item once its quantity reaches 0
+        if cart_item is None:
             return Response(
-                {"message": "Invalid action"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"status": True, "message": "Item removed from cart."},
+                status=status.HTTP_200_OK,
             )
 
+        serializer = CartSerializer(cart_item)
+        return Response(
+            {
+                "status": True,
+                "data": serializer.data,
+                "message": "Product updated successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
     def delete(self, request, cart_item_id, *args, **kwargs):
         """
         Remove an item from the user's cart.
@@ -568,6 +688,7 @@ class CartAPIView(APIView):
 
         # Delete the cart item
         cart_item.delete()
+        cart_changed(request.user.pk)
 
         # Return success response
         return Response(
@@ -576,6 +697,148 @@ class CartAPIView(APIView):
         )
 
 
+class CartSummaryView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """Cart totals, shipping and best coupon estimate, for the cart badge and checkout."""
+        return Response(
+            {
+                "status": True,
+                "data": cart_summary(request.user),
+                "message": "Cart summary arrived successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class CartBatchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Apply several add, set and remove operations to the cart in one
+        transaction and return the cart with its totals.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"status": False, "message": serializers_error(serializer)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cart = get_cart(request.user)
+        try:
+            apply_operations(cart, serializer.validated_data["operations"])
+        except CartError as error:
+            return Response(
+                {"status": False, "message": str(error)},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        return Response(
+            {
+                "status": True,
+                "data": {
+                    "items": list(CartItems.objects.filter(cart=cart).order_by("id").values("id", "product_id", "quantity")),
+                    "totals": cart_totals(cart),
+                },
+                "message": "Cart updated successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class GuestCartView(APIView):
+    """Cart of a shopper who is not logged in, kept in a signed cookie."""
+
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        return Response(
+            {
+                "status": True,
+                "data": guest_cart_contents(read_guest_cart(request)),
+                "message": "Cart item arrived successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def post(self, request):
+        """Apply add, set and remove operations, like ``CartBatchView``."""
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"status": False, "message": serializers_error(serializer)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            lines = apply_guest_operations(read_guest_cart(request), serializer.validated_data["operations"])
+        except CartError as error:
+            return Response(
+                {"status": False, "message": str(error)},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        response = Response(
+            {
+                "status": True,
+                "data": guest_cart_contents(lines),
+                "message": "Cart updated successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+        write_guest_cart(response, lines)
+        return response
+
+    def delete(self, request):
+        response = Response(
+            {"status": True, "message": "Cart cleared."},
+            status=status.HTTP_200_OK,
+        )
+        write_guest_cart(response, {})
+        return response
+
+
+class CartMergeView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Move the guest cart into the user's cart after login, in one go.
+
+        Clients that kept the cart themselves can send it as ``items``
+        (``[{"product_id", "quantity"}]``) instead of replaying it.
+        """
+        serializer = CartMergeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"status": False, "message": serializers_error(serializer)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        lines = read_guest_cart(request)
+        for item in serializer.validated_data.get("items", []):
+            lines[item["product_id"]] = lines.get(item["product_id"], 0) + item["quantity"]
+
+        cart, skipped = merge_lines(request.user, lines)
+        response = Response(
+            {
+                "status": True,
+                "data": {
+                    "items": list(CartItems.objects.filter(cart=cart).order_by("id").values("id", "product_id", "quantity")),
+                    "totals": cart_totals(cart),
+                    "skipped": skipped,
+                },
+                "message": "Cart merged successfully.",
+            },
+            status=status.HTTP_200_OK,
+        )
+        write_guest_cart(response, {})
+        return response
+
+
 class BannerAPIView(APIView):
 
     def get(self, request, pk=None, *args, **kwargs):
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .cart import merge_lines
+from .models import Product, Wishlist
+
+
+def ids_cache_key(user_id):
+    return f"wishlist:ids:{user_id}"
+
+
+def wishlist_changed(user_id):
+    """Drop the user's cached wishlist ids once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(ids_cache_key(user_id)))
+
+
+def wishlist_ids(user):
+    """The ids of the products on the user's wishlist, sorted, cached until it changes."""
+    key = ids_cache_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = sorted(Wishlist.objects.filter(user=user).values_list("product_id", flat=True))
+        cache.set(key, ids, settings.WISHLIST_IDS_TTL)
+    return ids
+
+
+def favourite_ids(context):
+    """
+    The request user's wishlisted product ids as a set, looked up once per
+    serializer context, so a product list costs one lookup, not one per product.
+    """
+    if "wishlist_ids" not in context:
+        request = context.get("request")
+        user = request.user if request else None
+        context["wishlist_ids"] = set(wishlist_ids(user)) if user and user.is_authenticated else set()
+    return context["wishlist_ids"]
+
+
+def add_to_wishlist(user, product_ids):
+    """
+    Add the in-stock products among ``product_ids`` in one insert.
+    Returns the ids that were added; ones already on the wishlist are skipped.
+    """
+    available = set(
+        Product.objects.filter(id__in=product_ids, status=Product.IN_STOCK).values_list("id", flat=True)
+    )
+    added = sorted(available - set(wishlist_ids(user)))
+    if added:
+        Wishlist.objects.bulk_create(
+            [Wishlist(user=user, product_id=product_id, created_by=user, updated_by=user) for product_id in added],
+            ignore_conflicts=True,
+        )
+        wishlist_changed(user.pk)
+    return added
+
+
+def remove_from_wishlist(user, product_ids):
+    """Remove ``product_ids`` from the wishlist in one delete. Returns the number removed."""
+    removed = Wishlist.objects.filter(user=user, product_id__in=product_ids).delete()[0]
+    if removed:
+        wishlist_changed(user.pk)
+    return removed
+
+
+def move_to_cart(user, product_ids=None):
+    """
+    Move wishlist products, or all of them when ``product_ids`` is empty, to
+    the cart, one of each, in one transaction.
+
+    Returns ``(moved, skipped)`` product ids; products no longer on sale stay
+    on the wishlist.
+    """
+    items = Wishlist.objects.filter(user=user)
+    if product_ids:
+        items = items.filter(product_id__in=product_ids)
+    with transaction.atomic():
+        wanted = set(items.values_list("product_id", flat=True))
+        cart, skipped = merge_lines(user, {product_id: 1 for product_id in wanted})
+        moved = sorted(wanted - set(skipped))
+        remove_from_wishlist(user, moved)
+    return moved, skipped
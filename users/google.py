@@ -1,5 +1,6 @@
 from google.auth.transport import requests
 from google.oauth2 import id_token
+from backend.http_client import get_session
 
 class Google:
     """Google class to fetch the user info and return it"""
@@ -11,7 +12,7 @@ class Google:
         """
         try:
             idinfo = id_token.verify_oauth2_token(
-                auth_token, requests.Request())
+                auth_token, requests.Request(session=get_session("google")))
 
             if 'accounts.google.com' in idinfo['iss']:
                 return idinfo
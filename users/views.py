@@ -19,8 +19,7 @@ from rest_framework.generics import GenericAPIView
 from .models import User
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.encoding import force_bytes
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from outbox.mail import queue_email
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -275,21 +274,13 @@ class PasswordResetRequestView(generics.GenericAPIView):
             else:
                 reset_link = f"{settings.FRONTEND_DOMAIN}/reset-password/{uid}/{token}/"
 
-            # Send the email
-            subject = "Password Reset Request"
-            msg_plain = render_to_string(
-                "email.txt", {"reset_link": reset_link, "email": user.email}
-            )
-            email_template = render_to_string(
-                "password_reset_email.html",
-                {"reset_link": reset_link, "email": user.email},
-            )
-            send_mail(
-                subject,
-                msg_plain,
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                html_message=email_template,
+            # Queue the email, templates are rendered by the mail worker
+            queue_email(
+                email,
+                "Password Reset Request",
+                text_template="email.txt",
+                html_template="password_reset_email.html",
+                context={"reset_link": reset_link, "email": user.email},
             )
 
             return Response(
@@ -527,26 +518,11 @@ class ContactUsAPIView(APIView):
                 f"Message:\n{message}"
             )
 
-            try:
-                send_mail(
-                    subject,
-                    admin_message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [settings.CONTACTUS_EMAIL],
-                    fail_silently=False,
-                )
-                return Response(
-                    {"status": True, "message": "Contact request sent successfully!"},
-                    status=status.HTTP_200_OK,
-                )
-            except Exception as e:
-                return Response(
-                    {
-                        "status": False,
-                        "message": "Failed to send email. Please try again later.",
-                    },
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
+            queue_email(settings.CONTACTUS_EMAIL, subject, body=admin_message)
+            return Response(
+                {"status": True, "message": "Contact request sent successfully!"},
+                status=status.HTTP_200_OK,
+            )
 
         error_message = serializers_error(serializer)
         return Response(